@@ -0,0 +1,197 @@
+"""
+Generators of synthetic inputs for the coverage pipeline.
+
+Everything is derived from a seeded `random.Random`, the same arguments always give the
+same files and payloads.
+"""
+
+__all__ = [
+    "coverage_entry",
+    "generate_coverage_points",
+    "generate_dat_files",
+    "generate_ignore_rules",
+    "generate_cov_group",
+    "generate_cov_groups",
+    "generate_test_reports",
+]
+
+import os
+import random
+from types import SimpleNamespace
+
+# Coverage types written by verilator and their `o` comments
+_COMMENTS = {
+    "line": ["block", "if", "else", "case"],
+    "branch": ["if", "else", "cond_then", "cond_else"],
+    "toggle": ["0->1", "1->0"],
+}
+
+
+def coverage_entry(path, line, column, cov_type, module, comment, blocks, hierarchy):
+    """Build the key of one SystemC::Coverage-3 entry, fields in the order verilator writes them."""
+    entry = f"\x01f\x02{path}\x01l\x02{line}\x01n\x02{column}\x01page\x02v_{cov_type}/{module}\x01o\x02{comment}"
+    if blocks:
+        entry += "\x01S\x02" + ",".join(
+            f"{l}-{r}" if l != r else f"{l}" for l, r in blocks
+        )
+    return entry + f"\x01h\x02{hierarchy}"
+
+
+def generate_coverage_points(
+    entries=10000, sources=20, mix=(0.5, 0.2, 0.3), block_size=4, seed=0
+):
+    """
+    Return `entries` distinct coverage keys spread over `sources` source files.
+
+    `mix` gives the share of line, branch and toggle points. Line and branch points get an
+    `S` block list covering up to `block_size` lines after their own line.
+    """
+    rng = random.Random(seed)
+    kinds = rng.choices(["line", "branch", "toggle"], weights=mix, k=entries)
+    points = []
+    for i, kind in enumerate(kinds):
+        src = i % sources
+        path = f"rtl/gen/module_{src}.sv"
+        module = f"module_{src}"
+        line = rng.randint(1, max(1, entries // sources * 4))
+        if kind == "toggle":
+            comment = f"sig_{i}[{rng.randint(0, 63)}]:{rng.choice(_COMMENTS['toggle'])}"
+            blocks = []
+        else:
+            comment = rng.choice(_COMMENTS[kind])
+            size = rng.randint(0, block_size)
+            blocks = [(line, line + size)] if size else []
+        hierarchy = f"TOP.top.u_{module}_{i % 7}"
+        points.append(
+            coverage_entry(path, line, i % 80, kind, module, comment, blocks, hierarchy)
+        )
+    return points
+
+
+def generate_dat_files(
+    out_dir,
+    files=16,
+    entries=10000,
+    sources=20,
+    mix=(0.5, 0.2, 0.3),
+    block_size=4,
+    hit_ratio=0.6,
+    seed=0,
+):
+    """
+    Write `files` coverage files of the same design to `out_dir`, as produced by one test each.
+
+    Every file holds all points of the design, a point is hit with probability `hit_ratio`.
+    Return the list of written paths.
+    """
+    os.makedirs(out_dir, exist_ok=True)
+    points = generate_coverage_points(entries, sources, mix, block_size, seed)
+    rng = random.Random(seed + 1)
+    paths = []
+    for n in range(files):
+        path = os.path.join(out_dir, f"test_{n}.dat")
+        with open(path, "w", encoding="utf-8") as f:
+            f.write("# SystemC::Coverage-3\n")
+            for p in points:
+                hit = rng.randint(1, 100) if rng.random() < hit_ratio else 0
+                f.write(f"C '{p}' {hit}\n")
+        paths.append(path)
+    return paths
+
+
+def generate_ignore_rules(
+    sources=20, patterns=4, ranges_per_file=8, range_size=50, large_range=200000, seed=0
+):
+    """
+    Return a list of ignore rules in the format accepted by `set_line_coverage(ignore=...)`.
+
+    The list mixes file glob patterns, `file:l-r,...` miss line rules and one rule covering
+    `large_range` lines of a generated file (0 to leave it out).
+    """
+    rng = random.Random(seed)
+    rules = [f"*/module_{rng.randrange(sources)}_unused*" for _ in range(patterns)]
+    for src in range(0, sources, 2):
+        ranges = []
+        for _ in range(ranges_per_file):
+            l = rng.randint(1, 2000)
+            ranges.append(f"{l}-{l + rng.randint(0, range_size)}")
+        rules.append(f"rtl/gen/module_{src}.sv:" + ",".join(ranges))
+    if large_range:
+        rules.append(f"rtl/gen/module_{sources - 1}.sv:1-{large_range}")
+    return rules
+
+
+def generate_cov_group(name, points=16, bins=8, hit_ratio=0.5, rng=None):
+    """Return the dict of one CovGroup, the same structure as `json.loads(str(CovGroup))`."""
+    rng = rng or random.Random(0)
+    data = {
+        "name": name,
+        "hinted": False,
+        "has_once": False,
+        "points": [],
+    }
+    for p in range(points):
+        bin_list = [
+            {
+                "name": f"bin_{b}",
+                "hints": rng.randint(1, 50) if rng.random() < hit_ratio else 0,
+            }
+            for b in range(bins)
+        ]
+        data["points"].append(
+            {
+                "name": f"{name}_point_{p}",
+                "hinted": all(b["hints"] > 0 for b in bin_list),
+                "once": False,
+                "dynamic_bin": False,
+                "functions": {b["name"]: [f"test_{name}_{p}"] for b in bin_list[:2]},
+                "bins": bin_list,
+            }
+        )
+    return data
+
+
+def generate_cov_groups(groups=8, points=16, bins=8, hit_ratio=0.5, seed=0):
+    """Return the dicts of `groups` distinct CovGroups."""
+    rng = random.Random(seed)
+    return [
+        generate_cov_group(f"group_{g}", points, bins, hit_ratio, rng)
+        for g in range(groups)
+    ]
+
+
+def generate_test_reports(
+    tests=10000, func_payloads=None, line_payloads=None, fail_ratio=0.02, seed=0
+):
+    """
+    Return a pytest-reporter like list of tests whose call phase reports carry coverage.
+
+    Test `i` carries `func_payloads[i % len(func_payloads)]` as `__coverage_group__` and
+    `line_payloads[i % len(line_payloads)]` as `__line_coverage__`, like the reports built by
+    `process_func_coverage`. A test fails with probability `fail_ratio`.
+    """
+    rng = random.Random(seed)
+    result = []
+    for i in range(tests):
+        passed = rng.random() >= fail_ratio
+        report = SimpleNamespace(
+            nodeid=f"test_gen.py::test_case[{i}]",
+            outcome="passed" if passed else "failed",
+        )
+        if func_payloads:
+            report.__coverage_group__ = func_payloads[i % len(func_payloads)]
+        if line_payloads:
+            report.__line_coverage__ = line_payloads[i % len(line_payloads)]
+
+        def function():
+            pass
+
+        function.__name__ = function.__qualname__ = f"test_case_{i}"
+        result.append(
+            {
+                "item": SimpleNamespace(nodeid=report.nodeid, function=function),
+                "phases": [{"when": "call", "report": report}],
+                "status": {"word": "PASSED" if passed else "FAILED"},
+            }
+        )
+    return result
@@ -0,0 +1,147 @@
+"""
+Run the coverage pipeline benchmarks.
+
+    python -m benchmarks.run --scale small --save benchmarks/baselines/small.json
+    python -m benchmarks.run --scale small --compare benchmarks/baselines/small.json
+
+Each stage is timed `--repeat` times and the best time is kept, the peak memory is measured
+in one extra run under tracemalloc. Memory allocated in worker processes is not counted.
+With `--compare` the run fails if a stage is slower than the baseline by more than `--tolerance`.
+"""
+
+__all__ = [
+    "main",
+]
+
+import argparse
+import gc
+import json
+import os
+import platform
+import sys
+import tempfile
+import time
+import tracemalloc
+
+from .stages import SCALES
+from .stages import STAGES
+
+
+def measure(run, repeat):
+    best = None
+    for _ in range(repeat):
+        gc.collect()
+        start = time.perf_counter()
+        run()
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    gc.collect()
+    tracemalloc.start()
+    run()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return best, peak
+
+
+def run_stages(names, scale, workdir, repeat):
+    results = {}
+    for name in names:
+        run, extra = STAGES[name](workdir, scale)
+        seconds, peak = measure(run, repeat)
+        results[name] = {"seconds": round(seconds, 6), "peak_bytes": peak}
+        if extra is not None:
+            results[name].update(extra(seconds))
+        metrics = " ".join(
+            f"{k}={v}"
+            for k, v in results[name].items()
+            if k not in ("seconds", "peak_bytes")
+        )
+        print(
+            f"{name:<28}{seconds:>10.3f}s{peak / 2 ** 20:>10.1f}MiB  {metrics}",
+            flush=True,
+        )
+    return results
+
+
+def compare(results, baseline, tolerance):
+    regressions = []
+    for name, res in results.items():
+        base = baseline.get("stages", {}).get(name)
+        if base is None:
+            continue
+        ratio = res["seconds"] / base["seconds"] if base["seconds"] else 1.0
+        if ratio > 1 + tolerance:
+            regressions.append(
+                f"{name}: {base['seconds']:.3f}s -> {res['seconds']:.3f}s ({ratio:.2f}x)"
+            )
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Benchmark the toffee-test coverage pipeline."
+    )
+    parser.add_argument("--scale", choices=sorted(SCALES), default="small")
+    parser.add_argument(
+        "--stage",
+        action="append",
+        choices=sorted(STAGES),
+        help="Stage to run, can be given more than once. Default: all stages.",
+    )
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument(
+        "--workdir", default=None, help="Directory of the generated inputs."
+    )
+    parser.add_argument(
+        "--save", default=None, help="Save the results as a baseline json file."
+    )
+    parser.add_argument(
+        "--compare", default=None, help="Compare the results with a baseline json file."
+    )
+    parser.add_argument(
+        "--tolerance",
+        type=float,
+        default=0.2,
+        help="Allowed slowdown against the baseline, 0.2 for 20%%.",
+    )
+    args = parser.parse_args(argv)
+
+    scale = SCALES[args.scale]
+    names = args.stage or list(STAGES)
+    workdir = args.workdir or tempfile.mkdtemp(prefix="toffee_bench_")
+    print(f"scale={args.scale} workdir={workdir}", flush=True)
+    results = run_stages(names, scale, workdir, args.repeat)
+
+    if args.save:
+        os.makedirs(os.path.dirname(os.path.abspath(args.save)), exist_ok=True)
+        with open(args.save, "w") as f:
+            json.dump(
+                {
+                    "scale": args.scale,
+                    "params": scale,
+                    "python": platform.python_version(),
+                    "machine": platform.machine(),
+                    "cpus": os.cpu_count(),
+                    "stages": results,
+                },
+                f,
+                indent=2,
+            )
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        if baseline.get("scale") != args.scale:
+            print(
+                f"Baseline scale {baseline.get('scale')} differs from {args.scale}",
+                file=sys.stderr,
+            )
+            return 2
+        regressions = compare(results, baseline, args.tolerance)
+        if regressions:
+            print("Regressions:\n  " + "\n  ".join(regressions), file=sys.stderr)
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
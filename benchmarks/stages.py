@@ -0,0 +1,414 @@
+"""
+Benchmark stages of the coverage pipeline.
+
+A stage is a setup function `setup(workdir, scale) -> (run, extra)`. Setup prepares the
+inputs outside of the measurement, `run()` is the measured call and `extra(seconds)`, if
+not None, returns additional metrics derived from the measured time.
+"""
+
+__all__ = [
+    "SCALES",
+    "STAGES",
+]
+
+import os
+import uuid
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
+from types import SimpleNamespace
+
+from . import generators
+from toffee_test import reporter
+from toffee_test.request import CovSampler
+from toffee_test.utils.func_coverage import encode_func_coverage
+from toffee_test.utils.func_coverage import func_coverage_payload_hash
+from toffee_test.utils.verilator_coverage.dat_cache import DatCache
+from toffee_test.utils.verilator_coverage.external import external_merge_coverage
+from toffee_test.utils.verilator_coverage.html import render_coverage_html
+from toffee_test.utils.verilator_coverage.lcov import write_lcov_info
+from toffee_test.utils.verilator_coverage.models import VerilatorCoverage
+from toffee_test.utils.verilator_coverage.point_dict import build_key
+from toffee_test.utils.verilator_coverage.point_dict import PointDictionary
+from toffee_test.utils.verilator_coverage.processor import (
+    count_verilator_coverage_files,
+)
+from toffee_test.utils.verilator_coverage.processor import count_verilator_coverage_hit
+from toffee_test.utils.verilator_coverage.processor import filter_coverage
+from toffee_test.utils.verilator_coverage.processor import merge_verilator_coverage
+from toffee_test.utils.verilator_coverage.processor import (
+    merge_verilator_coverage_table,
+)
+from toffee_test.utils.verilator_coverage.processor import process_coverage_list
+from toffee_test.utils.verilator_coverage.processor import verilator_coverage_miss
+from toffee_test.utils.verilator_coverage.shared import read_shared_hits
+from toffee_test.utils.verilator_coverage.shared import SharedHitVector
+
+SCALES = {
+    "small": dict(
+        files=8,
+        entries=20000,
+        sources=20,
+        tests=10000,
+        groups=8,
+        points=16,
+        bins=8,
+        cycles=20000,
+        sessions=4,
+        session_records=2000,
+    ),
+    "medium": dict(
+        files=32,
+        entries=100000,
+        sources=50,
+        tests=50000,
+        groups=16,
+        points=16,
+        bins=8,
+        cycles=100000,
+        sessions=8,
+        session_records=10000,
+    ),
+    "large": dict(
+        files=128,
+        entries=1000000,
+        sources=200,
+        tests=100000,
+        groups=40,
+        points=32,
+        bins=16,
+        cycles=200000,
+        sessions=16,
+        session_records=50000,
+    ),
+}
+
+_cache = {}
+
+
+def _dat_files(workdir, scale):
+    key = ("dat", workdir)
+    if key not in _cache:
+        _cache[key] = generators.generate_dat_files(
+            os.path.join(workdir, "dat"),
+            scale["files"],
+            scale["entries"],
+            scale["sources"],
+        )
+    return _cache[key]
+
+
+def _line_coverage_list(workdir, scale):
+    ignore = generators.generate_ignore_rules(scale["sources"])
+    return [
+        {"hash": "%s" % hash(f), "id": "bench", "data": f, "ignore": ignore}
+        for f in _dat_files(workdir, scale)
+    ]
+
+
+def _merged_table(workdir, scale):
+    key = ("table", workdir)
+    if key not in _cache:
+        _cache[key] = merge_verilator_coverage_table(_dat_files(workdir, scale), 1)
+    return _cache[key]
+
+
+def _filtered_table(workdir, scale):
+    key = ("filtered", workdir)
+    if key not in _cache:
+        _, _, patterns, miss_lines = process_coverage_list(
+            _line_coverage_list(workdir, scale)
+        )
+        _cache[key] = filter_coverage(
+            _merged_table(workdir, scale), patterns, miss_lines
+        )
+    return _cache[key]
+
+
+def _points(scale):
+    key = ("points", scale["entries"])
+    if key not in _cache:
+        _cache[key] = generators.generate_coverage_points(
+            scale["entries"], scale["sources"]
+        )
+    return _cache[key]
+
+
+def count_hit(workdir, scale):
+    files = _dat_files(workdir, scale)
+    return lambda: [count_verilator_coverage_hit(f) for f in files], None
+
+
+def count_files(workers):
+    def setup(workdir, scale):
+        files = _dat_files(workdir, scale)
+        return lambda: count_verilator_coverage_files(files, workers), None
+
+    return setup
+
+
+def count_files_dat_cache(workdir, scale):
+    files = _dat_files(workdir, scale)
+    cache = DatCache(os.path.join(workdir, "dat_cache"))
+    # Fill the cache outside of the measurement, the run only loads cached hit maps
+    count_verilator_coverage_files(files, 1, cache)
+    return lambda: count_verilator_coverage_files(files, 1, cache), None
+
+
+def count_files_point_vectors(dat_cache):
+    def setup(workdir, scale):
+        files = _dat_files(workdir, scale)
+        # All generated files share the entries of one simulated DUT build
+        builds = {f: "bench" for f in files}
+        cache = DatCache(os.path.join(workdir, "dat_cache")) if dat_cache else None
+        # Learn the point dictionary (and fill the cache) outside of the measurement
+        count_verilator_coverage_files(files, 1, cache, builds)
+        return lambda: count_verilator_coverage_files(files, 1, cache, builds), None
+
+    return setup
+
+
+def shared_vectors(workdir, scale):
+    files = _dat_files(workdir, scale)
+    # Shared vectors are keyed by fixed-size build ids, like the ones of set_line_coverage
+    build_id = build_key("bench")
+    dictionary = PointDictionary(build_id)
+    dictionary.learn(files[0])
+    shared_dir = os.path.join(workdir, "line_shared")
+    os.makedirs(shared_dir, exist_ok=True)
+
+    def run():
+        # Add every file to the vector of one process, then read the vectors back
+        vector = SharedHitVector(
+            os.path.join(shared_dir, "%s-main.vec" % build_id), dictionary
+        )
+        extra = Counter()
+        for f in files:
+            vector.add(f, extra)
+        vector.close()
+        return read_shared_hits(shared_dir)
+
+    return run, None
+
+
+def merge_objects(workdir, scale):
+    files = _dat_files(workdir, scale)
+    return lambda: merge_verilator_coverage(files, 1), None
+
+
+def merge_table(workdir, scale):
+    files = _dat_files(workdir, scale)
+    return lambda: merge_verilator_coverage_table(files, 1), None
+
+
+def merge_external(workdir, scale):
+    files = _dat_files(workdir, scale)
+    _, _, patterns, miss_lines = process_coverage_list(
+        _line_coverage_list(workdir, scale)
+    )
+    work_dir = os.path.join(workdir, "merge_runs")
+
+    def run():
+        # Merge and filter through sorted runs of at most 16 MiB, as --line-cov-memory-budget 16
+        external_merge_coverage(
+            files, work_dir, 16 * 2**20, None, patterns, miss_lines
+        ).close()
+
+    return run, None
+
+
+def decode_eager(workdir, scale):
+    points = _points(scale)
+    return lambda: [VerilatorCoverage(p) for p in points], None
+
+
+def decode_lazy_path(workdir, scale):
+    points = _points(scale)
+    return lambda: [VerilatorCoverage(p, lazy=True).path for p in points], None
+
+
+def filter_objects(workdir, scale):
+    files = _dat_files(workdir, scale)
+    _, _, patterns, miss_lines = process_coverage_list(
+        _line_coverage_list(workdir, scale)
+    )
+
+    def run():
+        # Entries are mutated by the filter, start from a fresh merge every time
+        return filter_coverage(merge_verilator_coverage(files, 1), patterns, miss_lines)
+
+    return run, None
+
+
+def filter_table(workdir, scale):
+    table = _merged_table(workdir, scale)
+    _, _, patterns, miss_lines = process_coverage_list(
+        _line_coverage_list(workdir, scale)
+    )
+    return lambda: filter_coverage(table, patterns, miss_lines), None
+
+
+def coverage_miss(workdir, scale):
+    table = _filtered_table(workdir, scale)
+    out_file = os.path.join(workdir, "code_coverage.json")
+    return lambda: verilator_coverage_miss(table, out_file), None
+
+
+def lcov(workdir, scale):
+    table = _filtered_table(workdir, scale)
+    out_file = os.path.join(workdir, "merged.info")
+    return lambda: write_lcov_info(table, out_file), None
+
+
+def html_render(workers):
+    def setup(workdir, scale):
+        table = _filtered_table(workdir, scale)
+        out_dir = os.path.join(workdir, "html_%d" % workers)
+        return lambda: render_coverage_html(table, out_dir, workers), None
+
+    return setup
+
+
+def _func_payloads(scale):
+    key = ("func", scale["groups"], scale["tests"])
+    if key not in _cache:
+        groups = generators.generate_cov_groups(
+            scale["groups"], scale["points"], scale["bins"]
+        )
+        payloads = []
+        schemas = {}
+        # One payload list per distinct test, each test samples all groups
+        for i in range(min(scale["tests"], 1000)):
+            payloads.append(
+                [
+                    {
+                        "hash": func_coverage_payload_hash(p),
+                        "id": "bench-%d" % i,
+                        "data": p,
+                    }
+                    for p in (encode_func_coverage(g, schemas) for g in groups)
+                ]
+            )
+        _cache[key] = payloads, schemas
+    return _cache[key]
+
+
+def func_encode(workdir, scale):
+    groups = generators.generate_cov_groups(
+        scale["groups"], scale["points"], scale["bins"]
+    )
+    schemas = {}
+    return (
+        lambda: [encode_func_coverage(g, schemas) for g in groups for _ in range(100)],
+        None,
+    )
+
+
+def func_update(workdir, scale):
+    payloads, schemas = _func_payloads(scale)
+    data = [fc["data"] for payload in payloads for fc in payload]
+    return lambda: reporter.__update_func_coverage__(data, schemas=schemas), None
+
+
+def process_context(workdir, scale):
+    func_payloads, schemas = _func_payloads(scale)
+    line_payloads = _line_coverage_list(workdir, scale)
+    tests = generators.generate_test_reports(
+        scale["tests"], func_payloads, line_payloads
+    )
+    options = {
+        "--line-cov-workers": 0,
+        "--line-cov-genhtml": False,
+        "--line-cov-cache": None,
+        "--line-cov-cache-size": 512,
+        "--line-cov-dat-cache": None,
+        "--line-cov-dat-cache-size": 1024,
+        "--line-cov-memory-budget": 0,
+        "--report-dump-format": "json",
+        "--report-dump-compact": False,
+        "--report-dump-gzip": False,
+    }
+    config = SimpleNamespace(
+        getoption=options.get,
+        option=SimpleNamespace(toffee_report_dump_json=False),
+    )
+    reporter.set_output_report(os.path.join(workdir, "report", "report.html"))
+
+    def run():
+        # The schemas registered by the process that ran the tests
+        session = SimpleNamespace(__func_schemas__=schemas)
+        context = {"tests": tests, "metadata": {}, "session": session}
+        reporter.process_context(context, config)
+        return context
+
+    return run, lambda seconds: {"tests_per_second": round(len(tests) / seconds, 1)}
+
+
+def sampler(groups):
+    def setup(workdir, scale):
+        cycles = scale["cycles"]
+        s = CovSampler()
+        for _ in range(groups):
+            s.add(SimpleNamespace(sample=lambda: None))
+
+        def run():
+            for _ in range(cycles):
+                s(None)
+
+        return run, lambda seconds: {"cycles_per_second": round(cycles / seconds, 1)}
+
+    return setup
+
+
+def _collect_session_coverage(records):
+    # One pytest session of module scoped requests collecting line coverage
+    session = SimpleNamespace()
+    request = SimpleNamespace(scope="module", session=session, node=SimpleNamespace())
+    for i in range(records):
+        reporter.set_line_coverage(request, "cov_%d_%s.dat" % (i, uuid.uuid4().hex))
+    return len(session.__line_coverage__)
+
+
+def concurrent_sessions(workdir, scale):
+    sessions = scale["sessions"]
+    records = scale["session_records"]
+    pool = ProcessPoolExecutor(max_workers=sessions)
+    # Start the workers before the measurement
+    list(pool.map(_collect_session_coverage, [1] * sessions))
+
+    def run():
+        return list(pool.map(_collect_session_coverage, [records] * sessions))
+
+    return run, lambda seconds: {
+        "records_per_second": round(sessions * records / seconds, 1)
+    }
+
+
+STAGES = {
+    "count_hit": count_hit,
+    "count_files_threads": count_files(0),
+    "count_files_1_process": count_files(1),
+    "count_files_4_processes": count_files(4),
+    "count_files_dat_cache": count_files_dat_cache,
+    "count_files_vectors": count_files_point_vectors(False),
+    "count_files_vectors_dat_cache": count_files_point_vectors(True),
+    "shared_vectors": shared_vectors,
+    "merge_objects": merge_objects,
+    "merge_table": merge_table,
+    "merge_external": merge_external,
+    "decode_eager": decode_eager,
+    "decode_lazy_path": decode_lazy_path,
+    "filter_objects": filter_objects,
+    "filter_table": filter_table,
+    "coverage_miss": coverage_miss,
+    "lcov": lcov,
+    "html_render_1_process": html_render(1),
+    "html_render_threads": html_render(0),
+    "html_render_all_cores": html_render(os.cpu_count() or 1),
+    "func_encode": func_encode,
+    "func_update": func_update,
+    "process_context": process_context,
+    "sampler_1_group": sampler(1),
+    "sampler_10_groups": sampler(10),
+    "sampler_40_groups": sampler(40),
+    "concurrent_sessions": concurrent_sessions,
+}
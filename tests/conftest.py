@@ -0,0 +1,45 @@
+import pytest
+
+
+def coverage_entry(
+    path,
+    line,
+    column=0,
+    type="line",
+    module="top",
+    comment="stmt",
+    block=None,
+    hierarchy="TOP.top",
+):
+    """A SystemC::Coverage-3 entry, as written by a verilated model."""
+    fields = [
+        ("f", path),
+        ("l", line),
+        ("n", column),
+        ("page", "v_%s/%s" % (type, module)),
+        ("o", comment),
+    ]
+    if block is not None:
+        fields.append(("S", block))
+    fields.append(("h", hierarchy))
+    return "".join("\x01%s\x02%s" % (k, v) for k, v in fields)
+
+
+@pytest.fixture
+def entry():
+    return coverage_entry
+
+
+@pytest.fixture
+def write_dat(tmp_path):
+    """Write `{entry: hit}` as a coverage file under tmp_path, return its path."""
+
+    def write(name, hits):
+        path = tmp_path / name
+        with open(path, "w") as f:
+            f.write("# SystemC::Coverage-3\n")
+            for e, hit in hits.items():
+                f.write("C '%s' %d\n" % (e, hit))
+        return str(path)
+
+    return write
@@ -0,0 +1,119 @@
+import json
+from types import SimpleNamespace
+
+import pytest
+
+from toffee_test.aggregator import CoverageAggregator
+from toffee_test.utils.func_coverage import encode_func_coverage
+from toffee_test.utils.func_coverage import func_coverage_payload_hash
+from toffee_test.utils.func_coverage import FuncCoverageMerger
+from toffee_test.utils.verilator_coverage.point_dict import build_key
+from toffee_test.utils.verilator_coverage.processor import (
+    count_verilator_coverage_files,
+)
+
+SCHEMAS = {}
+
+
+def group(hints):
+    return {
+        "name": "g",
+        "has_once": False,
+        "points": [
+            {
+                "name": "p",
+                "hinted": False,
+                "once": False,
+                "dynamic_bin": False,
+                "functions": {},
+                "bins": [{"name": b, "hints": h} for b, h in hints.items()],
+            }
+        ],
+    }
+
+
+def func_payload(i):
+    payload = encode_func_coverage(group({"a": i % 2, "b": i % 3}), SCHEMAS)
+    return {"hash": func_coverage_payload_hash(payload), "id": "P1", "data": payload}
+
+
+def line_payload(path, build=None):
+    return {"hash": str(hash(path)), "id": "P1", "data": path, "build": build}
+
+
+def make_report(nodeid, outcome="passed", func=None, line=None, **kwargs):
+    report = SimpleNamespace(nodeid=nodeid, when="teardown", outcome=outcome, **kwargs)
+    if func is not None:
+        report.__coverage_group__ = [func]
+    if line is not None:
+        report.__line_coverage__ = line
+    return report
+
+
+@pytest.fixture
+def dat_files(write_dat, entry):
+    return [
+        write_dat(
+            "%d.dat" % i,
+            {entry("rtl/a.sv", line): (line * i) % 4 for line in range(1, 6 + i)},
+        )
+        for i in range(6)
+    ]
+
+
+def merged_groups(merger):
+    merger.add_schemas(SCHEMAS)
+    return json.dumps(merger.result(), sort_keys=True)
+
+
+def test_matches_serial_merge(dat_files, tmp_path):
+    build = build_key(str(tmp_path))
+    aggregator = CoverageAggregator()
+    aggregator.start()
+    serial = FuncCoverageMerger()
+    passed = []
+    for i, dat in enumerate(dat_files):
+        func = func_payload(i)
+        serial.add(func["data"])
+        line = line_payload(dat, build if i % 2 else None)
+        if i == 1:
+            outcome, extra = "failed", {}
+        elif i == 4:
+            outcome, extra = "skipped", {"wasxfail": ""}
+        else:
+            outcome, extra = "passed", {}
+            passed.append(dat)
+        report = make_report("t::%d" % i, outcome, func, line, **extra)
+        aggregator.submit(report)
+        # The same coverage is only folded once
+        aggregator.submit(report)
+    assert aggregator.finish()
+    assert aggregator.finish()
+    assert aggregator._queue.empty() and not aggregator._thread.is_alive()
+    assert aggregator.has_func_coverage and len(aggregator.func_keys) == 6
+    assert merged_groups(aggregator.func_merged) == merged_groups(serial)
+    # Line coverage of failed and xfailed tests is skipped
+    assert aggregator.line_hits == count_verilator_coverage_files(passed, 1)
+    assert sorted(lc["data"] for lc in aggregator.line_coverage_list) == passed
+    assert all(lc["merged"] for lc in aggregator.line_coverage_list)
+
+
+def test_failed_phase_skips_line_coverage(dat_files):
+    aggregator = CoverageAggregator()
+    aggregator.start()
+    # The call phase failed, the teardown report carrying the coverage passed
+    aggregator.submit(make_report("t::a", "failed"))
+    aggregator.submit(make_report("t::a", line=line_payload(dat_files[0])))
+    assert aggregator.finish()
+    assert not aggregator.line_hits and not aggregator.line_coverage_list
+
+
+def test_worker_error(dat_files, tmp_path):
+    aggregator = CoverageAggregator()
+    aggregator.start()
+    missing = str(tmp_path / "missing.dat")
+    aggregator.submit(make_report("t::a", line=line_payload(missing)))
+    aggregator.submit(make_report("t::b", line=line_payload(dat_files[0])))
+    assert not aggregator.finish()
+    assert isinstance(aggregator.error, OSError)
+    assert not aggregator._thread.is_alive()
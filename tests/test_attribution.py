@@ -0,0 +1,116 @@
+import json
+from types import SimpleNamespace
+
+import pytest
+
+from toffee_test.attribution import AttributionIndex
+from toffee_test.attribution import AttributionIndexBuilder
+from toffee_test.attribution import bin_point
+from toffee_test.attribution import line_point
+from toffee_test.utils.func_coverage import encode_func_coverage
+
+
+def group(hints):
+    return {
+        "name": "g",
+        "has_once": False,
+        "points": [
+            {
+                "name": "p",
+                "hinted": False,
+                "once": False,
+                "dynamic_bin": False,
+                "functions": {},
+                "bins": [{"name": b, "hints": h} for b, h in hints.items()],
+            }
+        ],
+    }
+
+
+def report(nodeid, outcome="passed", func=(), line=None):
+    r = SimpleNamespace(nodeid=nodeid, when="teardown", outcome=outcome)
+    if func:
+        setattr(r, "__coverage_group__", [{"data": g} for g in func])
+    if line is not None:
+        setattr(r, "__line_coverage__", line)
+    return r
+
+
+def with_schema(payload, schemas):
+    # Payloads of older versions carry their schema
+    return {**payload, "group": schemas[payload["schema"]]}
+
+
+def test_save_load_round_trip(tmp_path):
+    index = AttributionIndex()
+    a, b, c = (index.add_test(t) for t in ("t::a", "t::b", "t::c"))
+    p, q = index.point_id("x.sv:1"), index.point_id("x.sv:2")
+    index.add_hits(a, [p, q])
+    index.add_hits(c, [p])
+    # Out of order and repeated hits keep the postings sorted and unique
+    index.add_hits(b, [p, p])
+    index.add_hits(a, [p])
+    path = str(tmp_path / "index.json.gz")
+    index.save(path)
+    loaded = AttributionIndex.load(path)
+    assert loaded.tests_hitting("x.sv:1") == ["t::a", "t::b", "t::c"]
+    assert loaded.points_uniquely_hit_by("t::a") == ["x.sv:2"]
+    assert loaded.summary()["points"] == 2
+
+
+def test_line_coverage(write_dat, entry):
+    dat = write_dat(
+        "a.dat",
+        {entry("rtl/top.sv", 3, block="3-4"): 1, entry("rtl/top.sv", 9): 0},
+    )
+    builder = AttributionIndexBuilder()
+    builder.pytest_runtest_logreport(report("t::a", line={"data": dat}))
+    index = builder.finish()
+    assert index.tests_hitting(line_point("rtl/top.sv", 4)) == ["t::a"]
+    assert index.tests_hitting(line_point("rtl/top.sv", 9)) == []
+
+
+def test_schemas_at_finish(tmp_path):
+    schemas = {}
+    builder = AttributionIndexBuilder()
+    for name in ("t::a", "t::b"):
+        payload = encode_func_coverage(group({"one": 1, "two": 0}), schemas)
+        builder.pytest_runtest_logreport(report(name, func=[payload]))
+    index = builder.finish(schemas)
+    path = str(tmp_path / "index.json.gz")
+    index.save(path)
+    loaded = AttributionIndex.load(path)
+    assert loaded.tests_hitting(bin_point("g", "p", "one")) == ["t::a", "t::b"]
+    assert loaded.tests_hitting(bin_point("g", "p", "two")) == []
+
+
+def test_schema_of_failed_first_test(tmp_path):
+    # Only the failed first test carries the schema of the group, the passed tests
+    # must still be attributed and the index saved
+    schemas = {}
+    builder = AttributionIndexBuilder()
+    first = with_schema(encode_func_coverage(group({"one": 1}), schemas), schemas)
+    builder.pytest_runtest_logreport(report("t::a", outcome="failed", func=[first]))
+    for name in ("t::b", "t::c"):
+        payload = encode_func_coverage(group({"one": 1}), schemas)
+        builder.pytest_runtest_logreport(report(name, func=[payload]))
+    index = builder.finish()
+    assert index.tests_hitting(bin_point("g", "p", "one")) == ["t::b", "t::c"]
+    index.save(str(tmp_path / "index.json.gz"))
+
+
+def test_missing_schema_warns():
+    builder = AttributionIndexBuilder()
+    payload = encode_func_coverage(group({"one": 1}), {})
+    builder.pytest_runtest_logreport(report("t::a", func=[payload]))
+    with pytest.warns(UserWarning, match="schema of groups g is missing"):
+        builder.finish()
+
+
+def test_legacy_json_payload():
+    builder = AttributionIndexBuilder()
+    legacy = json.dumps(group({"one": 2, "two": 0}))
+    builder.pytest_runtest_logreport(report("t::a", func=[legacy]))
+    index = builder.finish()
+    assert index.tests_hitting(bin_point("g", "p", "one")) == ["t::a"]
+    assert index.tests_hitting(bin_point("g", "p", "two")) == []
@@ -0,0 +1,59 @@
+import os
+
+import pytest
+
+from toffee_test.utils.verilator_coverage.cache_dir import evict_lru
+from toffee_test.utils.verilator_coverage.cache_dir import replace_file
+from toffee_test.utils.verilator_coverage.cache_dir import store_file
+
+
+def write_text(text):
+    def write(tmp):
+        with open(tmp, "w") as f:
+            f.write(text)
+
+    return write
+
+
+def test_replace_file(tmp_path):
+    path = tmp_path / "a"
+    replace_file(str(path), b"old")
+    link = tmp_path / "link"
+    os.link(path, link)
+    replace_file(str(path), write_text("new"))
+    assert path.read_text() == "new"
+    # A hard link to the old file keeps its content
+    assert link.read_text() == "old"
+    assert sorted(os.listdir(tmp_path)) == ["a", "link"]
+
+
+def test_failed_write(tmp_path):
+    path = tmp_path / "a"
+    path.write_text("old")
+
+    def fail(tmp):
+        with open(tmp, "w") as f:
+            f.write("partial")
+        raise OSError("disk full")
+
+    with pytest.raises(OSError):
+        replace_file(str(path), fail)
+    assert path.read_text() == "old"
+    assert os.listdir(tmp_path) == ["a"]
+    # Cache entries that cannot be written are skipped
+    store_file(str(path), fail)
+    store_file(str(tmp_path / "missing" / "b"), b"new")
+    assert path.read_text() == "old"
+    assert os.listdir(tmp_path) == ["a"]
+
+
+def test_evict_lru(tmp_path):
+    for i, name in enumerate(["0.a", "1.b", "2.a", "3.b"]):
+        path = tmp_path / name
+        path.write_text("x" * 100)
+        os.utime(path, (i, i))
+    (tmp_path / "other.tmp").write_text("x" * 1000)
+    evict_lru(str(tmp_path), (".a", ".b"), 250)
+    assert sorted(os.listdir(tmp_path)) == ["2.a", "3.b", "other.tmp"]
+    evict_lru(str(tmp_path), (".a", ".b"), 0)
+    assert os.listdir(tmp_path) == ["other.tmp"]
@@ -0,0 +1,134 @@
+import json
+
+import pytest
+
+from toffee_test.utils.verilator_coverage.models import CoverageTable
+from toffee_test.utils.verilator_coverage.models import VerilatorCoverage
+from toffee_test.utils.verilator_coverage.processor import filter_coverage
+from toffee_test.utils.verilator_coverage.processor import merge_verilator_coverage
+from toffee_test.utils.verilator_coverage.processor import (
+    merge_verilator_coverage_table,
+)
+from toffee_test.utils.verilator_coverage.processor import verilator_coverage_miss
+
+FIELDS = ("path", "line", "column", "type", "module_name", "hierarchy", "comment")
+
+
+@pytest.fixture
+def dat_files(write_dat, entry):
+    return [
+        write_dat(
+            "a.dat",
+            {
+                entry("rtl/b.sv", 4): 0,
+                entry("rtl/a.sv", 9, block="9-12,15"): 3,
+                entry("rtl/a.sv", 2, column=1, type="branch", comment="if"): 1,
+                entry("rtl/a.sv", 2, column=2, type="branch", comment="else"): 0,
+                entry("rtl/a.sv", 20, block="20-30"): 0,
+            },
+        ),
+        write_dat(
+            "b.dat",
+            {
+                entry("rtl/b.sv", 4): 2,
+                entry("rtl/a.sv", 2, column=2, type="branch", comment="else"): 0,
+                entry("rtl/c.sv", 1, module="sub", hierarchy="TOP.top.sub"): 0,
+            },
+        ),
+    ]
+
+
+def rows(merged):
+    return [
+        (tuple(getattr(meta, f) for f in FIELDS), meta.block, str(meta), hit)
+        for meta, hit in merged
+    ]
+
+
+def test_table_matches_objects(dat_files):
+    table = merge_verilator_coverage_table(dat_files, 1)
+    assert isinstance(table, CoverageTable)
+    assert len(table) == 6
+    assert rows(table) == rows(merge_verilator_coverage(dat_files, 1))
+
+
+def test_take_shares_strings(dat_files):
+    table = merge_verilator_coverage_table(dat_files, 1)
+    subset = table.take([4, 1], {1: [range(10, 11)]})
+    assert subset.paths is table.paths
+    assert [meta.block for meta, _ in subset] == [table.block(4), [range(10, 11)]]
+    assert rows(subset.sorted()) == sorted(rows(subset))
+
+
+def test_filter_matches_objects(dat_files):
+    ignores = {"rtl/c.sv"}
+    miss_lines = {"rtl/a.sv": [range(2, 3), range(22, 26)], "b.sv": [range(4, 5)]}
+    table = filter_coverage(
+        merge_verilator_coverage_table(dat_files, 1), ignores, miss_lines
+    )
+    objects = filter_coverage(
+        merge_verilator_coverage(dat_files, 1), ignores, miss_lines
+    )
+    assert isinstance(table, CoverageTable)
+    assert [(m.path, m.line, m.column) for m, _ in table] == [
+        ("rtl/a.sv", 2, 1),
+        ("rtl/a.sv", 9, 0),
+        ("rtl/a.sv", 20, 0),
+        ("rtl/b.sv", 4, 0),
+    ]
+    assert rows(table) == rows(objects)
+
+
+def test_miss_matches_objects(dat_files, tmp_path):
+    table_json = tmp_path / "table.json"
+    objects_json = tmp_path / "objects.json"
+    summary = verilator_coverage_miss(
+        merge_verilator_coverage_table(dat_files, 1), str(table_json)
+    )
+    expected = verilator_coverage_miss(
+        merge_verilator_coverage(dat_files, 1), str(objects_json)
+    )
+    assert summary == expected
+    assert json.loads(table_json.read_text()) == json.loads(objects_json.read_text())
+
+
+def test_lazy_path_only(entry):
+    raw = entry("rtl/a.sv", 9, block="9-12,15")
+    meta = VerilatorCoverage(raw, lazy=True)
+    assert meta.path == "rtl/a.sv"
+    assert not meta._decoded
+    # The first access to another field decodes the entry, blocks stay raw until used
+    assert meta.line == 9 and meta._decoded and meta._block_raw == "9-12,15"
+    assert meta.block == [range(9, 13), range(15, 16)]
+    assert meta.block_set == {9, 10, 11, 12, 15}
+
+
+@pytest.mark.parametrize("lazy", [False, True])
+def test_str(entry, lazy):
+    raw = entry("rtl/a.sv", 2, column=1, type="branch", comment="if", block="2-3")
+    meta = VerilatorCoverage(raw, lazy=lazy)
+    assert str(meta) == raw
+    if lazy:
+        # An unmodified entry returns its raw line without decoding it
+        assert str(meta) is raw and not meta._decoded
+    meta.block = [range(3, 4)]
+    assert str(meta) == entry(
+        "rtl/a.sv", 2, column=1, type="branch", comment="if", block="3"
+    )
+    fields = [getattr(meta, f) for f in FIELDS]
+    assert fields == ["rtl/a.sv", 2, 1, "branch", "top", "TOP.top", "if"]
+
+
+def test_from_hits_matches_objects(dat_files):
+    hits = {}
+    for f in dat_files:
+        with open(f) as lines:
+            for line in lines:
+                if line.startswith("C '"):
+                    raw, _, hit = line[3:].rpartition("' ")
+                    hits[raw] = hits.get(raw, 0) + int(hit)
+    objects = sorted(
+        ((VerilatorCoverage(raw), hit) for raw, hit in hits.items()),
+        key=lambda x: x[0],
+    )
+    assert rows(CoverageTable.from_hits(hits)) == rows(objects)
@@ -0,0 +1,127 @@
+import os
+import shutil
+from collections import Counter
+
+import pytest
+
+from toffee_test.utils.verilator_coverage.dat_cache import DatCache
+from toffee_test.utils.verilator_coverage.dat_cache import decode_hits
+from toffee_test.utils.verilator_coverage.dat_cache import encode_hits
+from toffee_test.utils.verilator_coverage.point_dict import PointDictionary
+from toffee_test.utils.verilator_coverage.processor import (
+    count_verilator_coverage_files,
+)
+from toffee_test.utils.verilator_coverage.processor import (
+    count_verilator_coverage_hit,
+)
+from toffee_test.utils.verilator_coverage.processor import parse_verilator_coverage
+
+
+@pytest.fixture
+def points(entry):
+    return [entry("rtl/top.sv", line) for line in range(1, 6)]
+
+
+@pytest.fixture
+def dat(write_dat, points):
+    return write_dat("a.dat", {p: i for i, p in enumerate(points)})
+
+
+@pytest.fixture
+def cache(tmp_path):
+    return DatCache(str(tmp_path / "cache"))
+
+
+def cached(cache, suffix):
+    return sorted(n for n in os.listdir(cache.cache_dir) if n.endswith(suffix))
+
+
+def counting_parse(calls):
+    def parse(lines):
+        calls.append(1)
+        return parse_verilator_coverage(lines)
+
+    return parse
+
+
+def test_encode_decode(points):
+    hits = Counter({p: 2**40 * i for i, p in enumerate(points)})
+    assert decode_hits(encode_hits(hits)) == hits
+    assert decode_hits(encode_hits({})) == Counter()
+    assert decode_hits(b"XXXX" + encode_hits(hits)[4:]) is None
+
+
+def test_load(cache, dat, tmp_path):
+    calls = []
+    expected = count_verilator_coverage_hit(dat)
+    assert cache.load(dat, counting_parse(calls)) == expected
+    assert cache.load(dat, counting_parse(calls)) == expected
+    assert len(calls) == 1
+    # A copy with the same content is hashed, but not parsed again
+    copy = str(tmp_path / "copy.dat")
+    shutil.copyfile(dat, copy)
+    assert cache.load(copy, counting_parse(calls)) == expected
+    assert len(calls) == 1
+    assert len(cached(cache, ".hits")) == 1 and len(cached(cache, ".ref")) == 2
+    assert count_verilator_coverage_hit(dat, cache) == expected
+
+
+def test_changed_file(cache, write_dat, points):
+    dat = write_dat("a.dat", {points[0]: 1})
+    cache.load(dat, parse_verilator_coverage)
+    st = os.stat(dat)
+    dat = write_dat("a.dat", {points[0]: 7})
+    os.utime(dat, ns=(st.st_atime_ns, st.st_mtime_ns + 10**9))
+    assert cache.load(dat, parse_verilator_coverage) == {points[0]: 7}
+
+
+def test_load_vector(cache, dat, write_dat, entry, points):
+    dictionary = PointDictionary("test")
+    dictionary.learn(dat)
+    expected = [0] * len(dictionary)
+    dictionary.read(dat, expected, Counter())
+    extra = Counter()
+    assert cache.load_vector(dat, dictionary, extra) == expected
+    assert len(cached(cache, ".vec")) == 1
+    assert cache.load_vector(dat, dictionary, extra) == expected
+    assert not extra
+    # Files with entries the dictionary does not know are not cached
+    other = write_dat("b.dat", {points[0]: 4, entry("rtl/new.sv", 1): 2})
+    hits = cache.load_vector(other, dictionary, extra)
+    assert dictionary.hit_map(hits, extra) == count_verilator_coverage_hit(other)
+    assert len(cached(cache, ".vec")) == 1
+
+
+def test_points(cache, dat):
+    assert cache.load_points("test") is None
+    dictionary = PointDictionary("test")
+    dictionary.learn(dat)
+    cache.store_points(dictionary)
+    loaded = cache.load_points("test")
+    assert loaded.keys == dictionary.keys
+    assert loaded.digest() == dictionary.digest()
+
+
+def test_evict(cache, write_dat, points):
+    for i in range(4):
+        dat = write_dat("%d.dat" % i, {points[0]: i})
+        cache.load(dat, parse_verilator_coverage)
+    for name in os.listdir(cache.cache_dir):
+        os.utime(os.path.join(cache.cache_dir, name), (0, 0))
+    # Only the most recently used file fits
+    newest = os.path.join(cache.cache_dir, cached(cache, ".hits")[2])
+    os.utime(newest, (1, 1))
+    cache.max_bytes = os.path.getsize(newest)
+    cache.evict()
+    assert os.listdir(cache.cache_dir) == [os.path.basename(newest)]
+
+
+@pytest.mark.parametrize("workers", [0, 1, 2])
+def test_count_files(cache, write_dat, points, workers):
+    files = [
+        write_dat("%d.dat" % i, {p: i + j for j, p in enumerate(points[i:])})
+        for i in range(3)
+    ]
+    expected = count_verilator_coverage_files(files, 1)
+    assert count_verilator_coverage_files(files, workers, cache) == expected
+    assert count_verilator_coverage_files(files, workers, cache) == expected
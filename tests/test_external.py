@@ -0,0 +1,136 @@
+import argparse
+import os
+from collections import Counter
+from types import SimpleNamespace
+
+import pytest
+
+from toffee_test import plugin
+from toffee_test import reporter
+from toffee_test.utils.verilator_coverage import convert_verilator_coverage
+from toffee_test.utils.verilator_coverage import external
+from toffee_test.utils.verilator_coverage.external import external_merge_coverage
+from toffee_test.utils.verilator_coverage.processor import filter_coverage
+from toffee_test.utils.verilator_coverage.processor import merge_verilator_coverage
+
+IGNORES = {"rtl/skip/*"}
+MISS_LINES = {"rtl/a.sv": [range(3, 4), range(12, 14)]}
+
+
+@pytest.fixture
+def dat_files(write_dat, entry):
+    files = []
+    for i in range(4):
+        hits = {
+            entry("rtl/a.sv", line, block="%d-%d" % (line, line + 3)): (line + i) % 3
+            for line in range(1, 20, 2)
+        }
+        hits[entry("rtl/b.sv", 10 + i, type="branch", comment="if")] = i
+        hits[entry("rtl/b.sv", 2, module="m%d" % (i % 2))] = 0
+        hits[entry("rtl/skip/c.sv", i)] = 0
+        files.append(write_dat("%d.dat" % i, hits))
+    return files
+
+
+def rows(merged):
+    return [
+        (meta.path, meta.line, meta.column, meta.type, meta.module_name)
+        + (meta.block, str(meta), hit)
+        for meta, hit in merged
+    ]
+
+
+def in_memory(dat_files, merged_hits=None):
+    merged = merge_verilator_coverage(dat_files, 1, merged_hits)
+    return rows(filter_coverage(merged, IGNORES, MISS_LINES))
+
+
+@pytest.mark.parametrize("budget", [1, 2000, 2**30])
+def test_matches_in_memory(dat_files, tmp_path, budget):
+    work_dir = str(tmp_path / "runs")
+    spilled = external_merge_coverage(
+        dat_files, work_dir, budget, None, IGNORES, MISS_LINES
+    )
+    expected = in_memory(dat_files)
+    assert rows(spilled) == expected
+    # The merged file can be streamed again
+    assert rows(spilled) == expected
+    assert os.listdir(work_dir) == ["merged"]
+    spilled.close()
+    assert not os.path.exists(work_dir)
+
+
+def test_multi_pass(dat_files, tmp_path, monkeypatch, entry):
+    monkeypatch.setattr(external, "_MAX_OPEN_RUNS", 2)
+    merged_hits = Counter({entry("rtl/a.sv", 1, block="1-4"): 5})
+    spilled = external_merge_coverage(
+        dat_files, str(tmp_path / "runs"), 1, merged_hits, IGNORES, MISS_LINES
+    )
+    assert rows(spilled) == in_memory(dat_files, merged_hits)
+
+
+def test_no_files(tmp_path):
+    spilled = external_merge_coverage([], str(tmp_path / "runs"), 1)
+    assert list(spilled) == []
+
+
+def test_convert(dat_files, tmp_path):
+    coverage_list = [
+        {"data": f, "ignore": ["rtl/skip/*", "rtl/a.sv:3,12-13"]} for f in dat_files
+    ]
+    outputs = {}
+    for budget in (0, 1):
+        out = tmp_path / ("out_%d" % budget)
+        convert_verilator_coverage(
+            coverage_list, str(out), workers=1, memory_budget=budget
+        )
+        outputs[budget] = [
+            (out / name).read_text() for name in ("code_coverage.json", "merged.info")
+        ]
+        assert not (out / "merge_runs").exists()
+    assert outputs[1] == outputs[0]
+
+
+def plugin_config(*args):
+    # pytest parses its options with argparse
+    parser = argparse.ArgumentParser()
+    group = SimpleNamespace(addoption=parser.add_argument)
+    plugin.pytest_addoption(SimpleNamespace(getgroup=lambda name: group))
+    option = parser.parse_args(args)
+    option.toffee_report_dump_json = False
+    return SimpleNamespace(
+        option=option,
+        getoption=lambda name: getattr(option, name.lstrip("-").replace("-", "_")),
+    )
+
+
+def test_plugin_options(dat_files, tmp_path, monkeypatch):
+    runs = []
+    write_run = external._write_run
+    monkeypatch.setattr(
+        external,
+        "_write_run",
+        lambda path, lines: runs.append(path) or write_run(path, lines),
+    )
+    session = SimpleNamespace()
+    request = SimpleNamespace(scope="module", session=session, node=SimpleNamespace())
+    for f in dat_files:
+        reporter.set_line_coverage(request, f, ["rtl/skip/*", "rtl/a.sv:3,12-13"])
+    outputs = {}
+    for budget in ("0", "0.001"):
+        config = plugin_config(
+            "--line-cov-workers", "1", "--line-cov-memory-budget", budget
+        )
+        reporter.set_output_report(str(tmp_path / budget / "report.html"))
+        context = {"tests": [], "metadata": {}, "session": session}
+        reporter.process_context(context, config)
+        out = tmp_path / budget / "line_dat"
+        outputs[budget] = [context["coverages"]["line"]] + [
+            (out / name).read_text() for name in ("code_coverage.json", "merged.info")
+        ]
+        assert not (out / "merge_runs").exists()
+    # A fraction of a MiB spills several runs even for a few coverage points
+    assert len(runs) > 1
+    assert outputs["0.001"] == outputs["0"]
+    line = outputs["0"][0]
+    assert not line["error"] and line["total"] > 0
@@ -0,0 +1,122 @@
+import json
+
+import pytest
+
+from toffee_test.utils.func_coverage import decode_func_coverage
+from toffee_test.utils.func_coverage import encode_func_coverage
+from toffee_test.utils.func_coverage import FuncCoverageMerger
+
+
+def make_group(name, hints, sample_count=1, once=False):
+    points = [
+        {
+            "once": once,
+            "hinted": all(h > 0 for h in bins.values()),
+            "bins": [{"name": b, "hints": h} for b, h in bins.items()],
+            "name": point,
+            "functions": {b: ["tests.check_%s" % b] for b in bins},
+            "dynamic_bin": False,
+        }
+        for point, bins in hints.items()
+    ]
+    return {
+        "points": points,
+        "name": name,
+        "hinted": all(p["hinted"] for p in points),
+        "bin_num_total": sum(len(p["bins"]) for p in points),
+        "bin_num_hints": sum(b["hints"] > 0 for p in points for b in p["bins"]),
+        "point_num_total": len(points),
+        "point_num_hints": sum(p["hinted"] for p in points),
+        "has_once": once,
+        "__filename__": "tests/test_dut.py",
+        "__lineno__": 12,
+        "__sample_count__": sample_count,
+        "__stop_sample__": False,
+    }
+
+
+def canonical(groups):
+    return json.dumps(groups, sort_keys=True)
+
+
+def test_round_trip():
+    group = make_group("g", {"p0": {"a": 3, "b": 0}, "p1": {"c": 1}})
+    schemas = {}
+    payload = encode_func_coverage(group, schemas)
+    assert canonical(decode_func_coverage(payload, schemas)) == canonical(group)
+    assert decode_func_coverage(payload, {}) is None
+
+
+def test_schema_registered_once():
+    # Payloads only carry the digest of their schema
+    schemas = {}
+    first = encode_func_coverage(make_group("g", {"p": {"a": 1}}), schemas)
+    second = encode_func_coverage(make_group("g", {"p": {"a": 2}}), schemas)
+    assert "group" not in first and "group" not in second
+    assert first["schema"] == second["schema"]
+    assert list(schemas) == [first["schema"]]
+
+
+def test_schemas_after_payloads():
+    # The schemas of xdist workers reach the controller after the test reports
+    schemas = {}
+    payloads = [
+        encode_func_coverage(
+            make_group("g", {"p": {"a": a, "b": 0}}, once=True), schemas
+        )
+        for a in (1, 2)
+    ]
+    merged = FuncCoverageMerger()
+    for payload in payloads:
+        merged.add(payload)
+    merged.add_schemas(schemas)
+    groups, once = merged.result()
+    assert [b["hints"] for b in groups["g"]["points"][0]["bins"]] == [3, 0]
+    assert groups["g"]["points"][0]["hinted"] is False and once
+
+
+def test_missing_schema_warns():
+    merged = FuncCoverageMerger()
+    merged.add(encode_func_coverage(make_group("g", {"p": {"a": 1}}), {}))
+    with pytest.warns(UserWarning, match="schema of groups g is missing"):
+        groups, _ = merged.result()
+    assert groups == {}
+
+
+def test_legacy_payload_with_schema():
+    group = make_group("g", {"p": {"a": 1}})
+    schemas = {}
+    payload = encode_func_coverage(group, schemas)
+    payload["group"] = schemas[payload["schema"]]
+    merged = FuncCoverageMerger()
+    merged.add(payload)
+    assert canonical(merged.result()[0]["g"]) == canonical(group)
+    assert canonical(decode_func_coverage(payload, {})) == canonical(group)
+
+
+def test_metadata_not_in_schema_digest():
+    schemas = {}
+    a = encode_func_coverage(make_group("g", {"p": {"a": 1}}, sample_count=1), schemas)
+    b = encode_func_coverage(make_group("g", {"p": {"a": 1}}, sample_count=5), schemas)
+    assert a["schema"] == b["schema"]
+
+
+def test_merge_matches_legacy_json():
+    groups = [
+        make_group("g", {"p0": {"a": 3, "b": 0}, "p1": {"c": 0}}, sample_count=3),
+        make_group("g", {"p0": {"a": 0, "b": 2}, "p1": {"c": 0}}, sample_count=8),
+        make_group("h", {"q": {"x": 1}}, once=True),
+    ]
+    legacy = FuncCoverageMerger()
+    encoded = FuncCoverageMerger()
+    schemas = {}
+    for g in groups:
+        legacy.add(json.dumps(g))
+        encoded.add(encode_func_coverage(g, schemas))
+    encoded.add_schemas(schemas)
+    (legacy_groups, legacy_once), (groups, once) = legacy.result(), encoded.result()
+    assert canonical(groups) == canonical(legacy_groups)
+    assert once == legacy_once
+    # Metadata comes from the first payload, like merge_dicts
+    assert groups["g"]["__sample_count__"] == 3
+    assert [b["hints"] for b in groups["g"]["points"][0]["bins"]] == [3, 2]
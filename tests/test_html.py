@@ -0,0 +1,106 @@
+import os
+
+import pytest
+
+from toffee_test.utils.verilator_coverage.html import evict_render_cache
+from toffee_test.utils.verilator_coverage.html import render_coverage_html
+from toffee_test.utils.verilator_coverage.processor import merge_verilator_coverage
+
+
+@pytest.fixture
+def coverage(write_dat, entry, tmp_path):
+    sources = []
+    for i in range(3):
+        source = tmp_path / ("m%d.sv" % i)
+        source.write_text("".join("line %d\n" % n for n in range(1, 11)))
+        sources.append(str(source))
+    hits = {}
+    for i, source in enumerate(sources):
+        hits[entry(source, 2, comment="if")] = i
+        hits[entry(source, 2, column=1, comment="else")] = 20
+        hits[entry(source, 5, block="5-7")] = 0
+    return merge_verilator_coverage([write_dat("a.dat", hits)], 1)
+
+
+def pages(out_dir):
+    return {
+        name: open(os.path.join(out_dir, name)).read()
+        for name in sorted(os.listdir(out_dir))
+    }
+
+
+@pytest.mark.parametrize("workers", [0, 2])
+def test_workers_render_the_same_pages(coverage, tmp_path, workers):
+    serial = render_coverage_html(coverage, str(tmp_path / "serial"), 1)
+    pooled = render_coverage_html(coverage, str(tmp_path / "pooled"), workers)
+    assert pooled == serial
+    assert pages(tmp_path / "pooled") == pages(tmp_path / "serial")
+
+
+def test_summaries(coverage, tmp_path):
+    summaries = render_coverage_html(coverage, str(tmp_path / "html"), 1)
+    assert [s.path for s in summaries] == sorted(s.path for s in summaries)
+    # Lines 2, 5, 6 and 7, line 2 carries two branch points
+    assert [(s.line_found, s.line_hit, s.branch_found) for s in summaries] == [
+        (4, 1, 2)
+    ] * 3
+    assert [s.branch_hit for s in summaries] == [1, 1, 1]
+    assert "index.html" in os.listdir(tmp_path / "html")
+
+
+def test_render_cache(coverage, tmp_path):
+    cache_dir = tmp_path / "cache"
+    first = render_coverage_html(
+        coverage, str(tmp_path / "a"), 1, cache_dir=str(cache_dir)
+    )
+    cached = sorted(os.listdir(cache_dir))
+    assert len(cached) == 3
+    # Mark the cached pages, pages placed from the cache carry the mark
+    for name in cached:
+        (cache_dir / name).write_text("cached " + name)
+    second = render_coverage_html(
+        coverage, str(tmp_path / "b"), 1, cache_dir=str(cache_dir)
+    )
+    assert second == first
+    assert sorted(v for k, v in pages(tmp_path / "b").items() if k != "index.html") == [
+        "cached " + name for name in cached
+    ]
+    # A changed source file is rendered again
+    source = first[0].path
+    with open(source, "a") as f:
+        f.write("line 11\n")
+    render_coverage_html(coverage, str(tmp_path / "c"), 1, cache_dir=str(cache_dir))
+    page = pages(tmp_path / "c")[first[0].page]
+    assert not page.startswith("cached") and "line 11" in page
+    assert len(os.listdir(cache_dir)) == 4
+
+
+def test_evict_render_cache(tmp_path):
+    for i in range(4):
+        page = tmp_path / ("%d.html" % i)
+        page.write_text("x" * 100)
+        os.utime(page, (i, i))
+    (tmp_path / "other.tmp").write_text("x" * 1000)
+    evict_render_cache(str(tmp_path), 250)
+    assert sorted(os.listdir(tmp_path)) == ["2.html", "3.html", "other.tmp"]
+
+
+def test_render_cache_same_output_dir(write_dat, entry, tmp_path):
+    source = tmp_path / "top.sv"
+    source.write_text("".join("line %d\n" % n for n in range(1, 6)))
+    runs = {
+        name: merge_verilator_coverage(
+            [write_dat(name + ".dat", {entry(str(source), 3): hit})], 1
+        )
+        for name, hit in (("a", 7), ("b", 0))
+    }
+    expected = {}
+    for name, coverage in runs.items():
+        render_coverage_html(coverage, str(tmp_path / name), 1)
+        expected[name] = pages(tmp_path / name)
+    # Pages placed from the cache must not be overwritten by a later miss
+    cache_dir = str(tmp_path / "cache")
+    out_dir = tmp_path / "line_dat"
+    for name in ("a", "a", "b", "a", "b"):
+        render_coverage_html(runs[name], str(out_dir), 1, cache_dir=cache_dir)
+        assert pages(out_dir) == expected[name]
@@ -0,0 +1,150 @@
+import fnmatch
+import random
+
+import pytest
+
+from toffee_test.utils.verilator_coverage.processor import filter_coverage
+from toffee_test.utils.verilator_coverage.processor import filter_ranges
+from toffee_test.utils.verilator_coverage.processor import get_range_filter
+from toffee_test.utils.verilator_coverage.processor import IgnoreMatcher
+from toffee_test.utils.verilator_coverage.processor import in_ranges
+from toffee_test.utils.verilator_coverage.processor import merge_ranges
+from toffee_test.utils.verilator_coverage.processor import merge_verilator_coverage
+from toffee_test.utils.verilator_coverage.processor import parse_ignore_miss_lines
+from toffee_test.utils.verilator_coverage.processor import process_ignore_files
+
+
+def lines(ranges):
+    return {n for r in ranges for n in r}
+
+
+def test_parse_ignore_miss_lines():
+    miss_lines = {}
+    assert parse_ignore_miss_lines("rtl/a.sv:3,5-7", miss_lines)
+    assert parse_ignore_miss_lines("rtl/a.sv:1-1000000000", miss_lines)
+    assert not parse_ignore_miss_lines("rtl/*.sv", miss_lines)
+    assert not parse_ignore_miss_lines("rtl/b.sv:", miss_lines)
+    assert miss_lines == {
+        "rtl/a.sv": [range(3, 4), range(5, 8), range(1, 1000000001)],
+    }
+
+
+def test_merge_ranges():
+    assert merge_ranges([range(5, 8), range(1, 3), range(3, 4), range(6, 10)]) == [
+        range(1, 4),
+        range(5, 10),
+    ]
+    assert merge_ranges([range(2, 2), range(4, 5)]) == [range(4, 5)]
+
+
+def test_ranges_match_line_sets():
+    rand = random.Random(0)
+    for _ in range(200):
+        filters = merge_ranges(
+            range(s, s + rand.randint(1, 5))
+            for s in (rand.randint(1, 40) for _ in range(rand.randint(0, 6)))
+        )
+        blocks = [
+            range(s, s + rand.randint(1, 8))
+            for s in (rand.randint(1, 40) for _ in range(rand.randint(1, 4)))
+        ]
+        ignored = lines(filters)
+        assert [in_ranges(n, filters) for n in range(50)] == [
+            n in ignored for n in range(50)
+        ]
+        kept = filter_ranges(blocks, filters)
+        assert lines(kept) == lines(blocks) - ignored
+        assert kept == merge_ranges(kept)
+
+
+def test_get_range_filter():
+    miss_lines = {
+        "/abs/rtl/a.sv": [range(1, 2)],
+        "rtl/a.sv": [range(5, 9)],
+        "a.sv": [range(7, 12)],
+    }
+    assert get_range_filter("/abs/rtl/a.sv", miss_lines) == [range(1, 2)]
+    assert get_range_filter("/src/rtl/a.sv", miss_lines) == [range(5, 12)]
+    assert get_range_filter("/src/b.sv", miss_lines) == []
+
+
+def test_process_ignore_files(tmp_path):
+    ignore = tmp_path / "top.ignore"
+    ignore.write_text("# comment\nrtl/a.sv:2-4 # tail\nrtl/a.sv:10\n")
+    patterns = set()
+    miss_lines = {}
+    process_ignore_files([str(ignore)], patterns, miss_lines)
+    assert miss_lines == {"rtl/a.sv": [range(2, 5), range(10, 11)]}
+
+
+@pytest.mark.parametrize("stop", [30, 1000000000])
+def test_filter_coverage(write_dat, entry, stop):
+    dat = write_dat(
+        "a.dat",
+        {
+            entry("rtl/a.sv", 3): 0,
+            entry("rtl/a.sv", 4): 2,
+            entry("rtl/a.sv", 40): 0,
+            entry("rtl/a.sv", 20, block="20-25,45-50"): 0,
+            entry("rtl/a.sv", 21, block="21-22"): 0,
+        },
+    )
+    miss_lines = {}
+    parse_ignore_miss_lines("rtl/a.sv:1-%d" % stop, miss_lines)
+    filtered = filter_coverage(merge_verilator_coverage([dat], 1), set(), miss_lines)
+    expected = [(4, [], 2)]
+    if stop < 40:
+        # Only the miss lines outside the range are left
+        expected += [(20, [range(45, 51)], 0), (40, [], 0)]
+    assert [(m.line, m.block, hit) for m, hit in filtered] == expected
+
+
+IGNORE_PATTERNS = [
+    "rtl/skip/*",
+    "*.svh",
+    "rtl/?.sv",
+    "rtl/[ab]*.sv",
+    "rtl/[!c]x.sv",
+    "*/gen/*",
+    "rtl/top.sv",
+    "rtl/sub*/core.sv",
+    "[*]",
+]
+IGNORE_PATHS = [
+    "rtl/skip/a.sv",
+    "rtl/skip/deep/b.sv",
+    "rtl/skip",
+    "inc/defs.svh",
+    "rtl/defs.svh.bak",
+    "rtl/a.sv",
+    "rtl/ab.sv",
+    "rtl/bus.sv",
+    "rtl/cx.sv",
+    "rtl/dx.sv",
+    "rtl/c.sv",
+    "build/gen/top.sv",
+    "gen/top.sv",
+    "rtl/top.sv",
+    "rtl/top.svx",
+    "rtl/sub/core.sv",
+    "rtl/sub1/2/core.sv",
+    "*",
+    "x",
+    "",
+]
+
+
+@pytest.mark.parametrize("pattern", IGNORE_PATTERNS)
+def test_ignore_matcher_like_fnmatch(pattern):
+    matcher = IgnoreMatcher([pattern])
+    for path in IGNORE_PATHS:
+        assert matcher(path) == fnmatch.fnmatch(path, pattern), path
+        # Cached decisions stay the same
+        assert matcher(path) == fnmatch.fnmatch(path, pattern), path
+
+
+def test_ignore_matcher_any_pattern():
+    matcher = IgnoreMatcher(IGNORE_PATTERNS + IGNORE_PATTERNS[:2])
+    for path in IGNORE_PATHS:
+        assert matcher(path) == any(fnmatch.fnmatch(path, p) for p in IGNORE_PATTERNS)
+    assert not any(map(IgnoreMatcher([]), IGNORE_PATHS))
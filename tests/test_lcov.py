@@ -0,0 +1,75 @@
+import shutil
+import subprocess
+
+import pytest
+
+from toffee_test.utils.verilator_coverage.lcov import ANNOTATE_MIN
+from toffee_test.utils.verilator_coverage.lcov import write_lcov_info
+from toffee_test.utils.verilator_coverage.processor import merge_verilator_coverage
+
+
+@pytest.fixture
+def sample_dat(write_dat, entry):
+    return write_dat(
+        "sample.dat",
+        {
+            # Two points on line 3, one of them below ANNOTATE_MIN
+            entry("rtl/a.sv", 3, column=1, type="branch", comment="if"): 12,
+            entry("rtl/a.sv", 3, column=2, type="branch", comment="else"): 5,
+            entry("rtl/a.sv", 7): 0,
+            # A block spanning its own line and the next one
+            entry("rtl/a.sv", 10, block="10-11"): 4,
+            entry("rtl/b.sv", 2, type="toggle", comment="sig:0->1"): ANNOTATE_MIN,
+            entry("rtl/b.sv", 2, column=1, type="toggle", comment="sig:1->0"): 0,
+        },
+    )
+
+
+def native_info(dat, out):
+    write_lcov_info(merge_verilator_coverage([dat], 1), str(out))
+    return out.read_text()
+
+
+def test_write_lcov_info(sample_dat, tmp_path):
+    assert native_info(sample_dat, tmp_path / "native.info") == "\n".join(
+        [
+            "TN:verilator_coverage",
+            "SF:rtl/a.sv",
+            "DA:3,12",
+            "BRDA:3,0,0,12",
+            "BRDA:3,0,1,5",
+            "DA:7,0",
+            "DA:10,4",
+            "DA:11,4",
+            "BRF:2",
+            "BRH:1",
+            "LF:4",
+            "LH:3",
+            "end_of_record",
+            "SF:rtl/b.sv",
+            "DA:2,10",
+            "BRDA:2,0,0,10",
+            "BRDA:2,0,1,0",
+            "BRF:2",
+            "BRH:1",
+            "LF:1",
+            "LH:1",
+            "end_of_record",
+            "",
+        ]
+    )
+
+
+@pytest.mark.skipif(
+    shutil.which("verilator_coverage") is None,
+    reason="verilator_coverage is not installed",
+)
+def test_parity_with_verilator_coverage(sample_dat, tmp_path):
+    reference = tmp_path / "reference.info"
+    subprocess.run(
+        ["verilator_coverage", "-write-info", str(reference), sample_dat],
+        check=True,
+        stdout=subprocess.PIPE,
+    )
+    native = native_info(sample_dat, tmp_path / "native.info")
+    assert native == reference.read_text()
@@ -0,0 +1,96 @@
+import json
+from types import SimpleNamespace
+
+from toffee_test.minimize import CoverageMinimizer
+from toffee_test.minimize import func_cover_ids
+from toffee_test.minimize import greedy_set_cover
+from toffee_test.minimize import line_cover_ids
+from toffee_test.minimize import load_selection
+from toffee_test.minimize import pack_cover_ids
+from toffee_test.minimize import unpack_cover_ids
+
+
+def bits(*points):
+    return sum(1 << p for p in points)
+
+
+def covered(covers, selected):
+    union = 0
+    for t in selected:
+        union |= covers[t]
+    return union
+
+
+def test_greedy_set_cover():
+    covers = {
+        "a": bits(0, 1, 2, 3),
+        "b": bits(0, 1),
+        "c": bits(2, 3),
+        "d": bits(4),
+        "e": 0,
+        "f": bits(4),
+    }
+    weights = {"a": 4.0, "b": 1.0, "c": 1.0, "d": 1.0, "f": 2.0}
+    selected = greedy_set_cover(covers, weights)
+    # Two short tests are cheaper than the long one covering the same points
+    assert sorted(selected) == ["b", "c", "d"]
+    assert covered(covers, selected) == covered(covers, covers)
+    assert greedy_set_cover(covers, {t: 1.0 for t in covers})[0] == "a"
+    assert greedy_set_cover({}, {}) == []
+
+
+def test_greedy_set_cover_rescores():
+    # Once "a" is taken "b" only adds one point, "c" must be preferred over it
+    covers = {"a": bits(0, 1, 2, 3), "b": bits(0, 1, 2, 4), "c": bits(4, 5)}
+    selected = greedy_set_cover(covers, {"a": 1.0, "b": 1.0, "c": 1.0})
+    assert selected == ["a", "c"]
+
+
+def test_cover_ids(write_dat, entry):
+    groups = [
+        {
+            "name": "g",
+            "points": [
+                {"name": "p", "bins": [{"name": "hit", "hints": 2}, {"name": "miss"}]},
+            ],
+        }
+    ]
+    func_ids = func_cover_ids(groups)
+    assert len(func_ids) == 1
+    dat = write_dat("a.dat", {entry("rtl/a.sv", 1): 3, entry("rtl/a.sv", 2): 0})
+    line_ids = line_cover_ids(dat)
+    assert len(line_ids) == 1 and not line_ids & func_ids
+    ids = func_ids | line_ids
+    assert set(unpack_cover_ids(pack_cover_ids(ids))) == ids
+
+
+def test_minimizer(tmp_path):
+    shared = {bytes([1] * 8), bytes([2] * 8)}
+    extra = {bytes([3] * 8)}
+    reports = [
+        ("slow", "passed", 5.0, shared | extra),
+        ("fast", "passed", 1.0, shared),
+        ("other", "passed", 1.0, extra),
+        ("broken", "failed", 0.1, shared | extra),
+        ("setup_error", "error", 0.1, shared | extra),
+        ("skipped", "skipped", 0.0, shared | extra),
+        ("xpassed", "passed", 0.1, shared | extra),
+    ]
+    outfile = tmp_path / "selection.json"
+    minimizer = CoverageMinimizer(str(outfile))
+    for nodeid, outcome, duration, ids in reports:
+        report = SimpleNamespace(
+            nodeid=nodeid,
+            outcome=outcome,
+            duration=duration,
+            __toffee_cover_ids__=pack_cover_ids(ids),
+        )
+        if nodeid == "xpassed":
+            report.wasxfail = ""
+        minimizer.pytest_runtest_logreport(report)
+    minimizer.pytest_sessionfinish(None)
+    result = json.loads(outfile.read_text())
+    assert sorted(result["tests"]) == ["fast", "other"]
+    assert result["points"] == 3 and result["total_tests"] == 3
+    assert result["selected_duration"] == 2.0 and result["total_duration"] == 7.0
+    assert load_selection(str(outfile)) == {"fast", "other"}
@@ -0,0 +1,92 @@
+import importlib.util
+import os
+import sys
+import uuid
+from collections import Counter
+
+import pytest
+
+from toffee_test.utils.verilator_coverage.point_dict import dut_build_id
+from toffee_test.utils.verilator_coverage.point_dict import PointDictionary
+from toffee_test.utils.verilator_coverage.processor import (
+    count_verilator_coverage_files,
+)
+from toffee_test.utils.verilator_coverage.processor import (
+    count_verilator_coverage_hit,
+)
+from toffee_test.utils.verilator_coverage.processor import LineHitSum
+
+
+@pytest.fixture
+def dat_files(write_dat, entry):
+    points = [entry("rtl/top.sv", line) for line in range(1, 9)]
+    first = write_dat("a.dat", {p: i for i, p in enumerate(points)})
+    # Same entries in another order, plus an entry the first file does not have
+    reordered = {p: 2 for p in reversed(points)}
+    reordered[entry("rtl/extra.sv", 1)] = 5
+    second = write_dat("b.dat", reordered)
+    third = write_dat("c.dat", {p: 1 for p in points[:3]})
+    return [first, second, third]
+
+
+def load_dut_class(package_dir, name):
+    module_file = package_dir / ("%s.py" % name)
+    module_file.write_text("class DUT:\n    pass\n")
+    spec = importlib.util.spec_from_file_location(name, module_file)
+    module = importlib.util.module_from_spec(spec)
+    sys.modules[name] = module
+    spec.loader.exec_module(module)
+    return module.DUT
+
+
+def test_dut_build_id(tmp_path):
+    dut_cls = load_dut_class(tmp_path, "dut_%s" % uuid.uuid4().hex)
+    assert dut_build_id(dut_cls) is None
+    lib = tmp_path / "libDUT.so"
+    lib.write_bytes(b"\0" * 64)
+    build_id = dut_build_id(dut_cls)
+    assert build_id is not None and dut_build_id(dut_cls) == build_id
+    # A rebuilt library changes the id
+    st = os.stat(lib)
+    os.utime(lib, ns=(st.st_atime_ns, st.st_mtime_ns + 10**9))
+    assert dut_build_id(dut_cls) != build_id
+
+
+def test_read_matches_counter(dat_files):
+    dictionary = PointDictionary("test")
+    dictionary.learn(dat_files[0])
+    hits = [0] * len(dictionary)
+    extra = Counter()
+    expected = Counter()
+    for f in dat_files:
+        dictionary.read(f, hits, extra)
+        expected.update(count_verilator_coverage_hit(f))
+    assert dictionary.hit_map(hits, extra) == expected
+
+
+def test_save_load(dat_files, tmp_path):
+    dictionary = PointDictionary("test")
+    dictionary.learn(dat_files[0])
+    path = str(tmp_path / "test.points")
+    dictionary.save(path)
+    loaded = PointDictionary.load("test", path)
+    assert loaded.keys == dictionary.keys
+    assert list(loaded.layout) == list(dictionary.layout)
+    assert loaded.digest() == dictionary.digest()
+
+
+@pytest.mark.parametrize("workers", [0, 1, 2])
+def test_count_files_with_builds(dat_files, workers):
+    builds = {f: "build-%s" % uuid.uuid4().hex for f in dat_files[:1]}
+    builds.update({f: builds[dat_files[0]] for f in dat_files[1:]})
+    expected = count_verilator_coverage_files(dat_files, 1)
+    assert count_verilator_coverage_files(dat_files, workers, None, builds) == expected
+
+
+def test_line_hit_sum(dat_files):
+    build_id = "build-%s" % uuid.uuid4().hex
+    total = LineHitSum()
+    for f in dat_files[:2]:
+        total.add(f, build_id)
+    total.add(dat_files[2])
+    assert total.counter() == count_verilator_coverage_files(dat_files, 1)
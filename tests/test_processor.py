@@ -0,0 +1,53 @@
+from collections import Counter
+
+import pytest
+
+from toffee_test.utils.verilator_coverage.processor import (
+    count_verilator_coverage_files,
+)
+from toffee_test.utils.verilator_coverage.processor import shard_coverage_files
+from toffee_test.utils.verilator_coverage.processor import tree_reduce_counters
+
+
+@pytest.fixture
+def coverage(write_dat, entry, tmp_path):
+    """Seven coverage files of different sizes, a header only file and an empty file."""
+    expected = Counter()
+    files = []
+    for i in range(7):
+        hits = {
+            entry("rtl/%d.sv" % (j % 3), j, module="m%d" % (i % 2)): (i * j) % 5
+            for j in range(1, 2 + 3 * i)
+        }
+        expected.update(hits)
+        files.append(write_dat("%d.dat" % i, hits))
+    files.append(write_dat("header.dat", {}))
+    empty = tmp_path / "empty.dat"
+    empty.write_text("")
+    files.append(str(empty))
+    return files, expected
+
+
+@pytest.mark.parametrize("workers", [0, 1, 2, 3, 4, 16])
+def test_count_files(coverage, workers):
+    files, expected = coverage
+    # Compared as dicts, entries that are never hit must be kept
+    assert dict(count_verilator_coverage_files(files, workers)) == dict(expected)
+    assert dict(count_verilator_coverage_files(files[::-1], workers)) == dict(expected)
+    assert not count_verilator_coverage_files(files[-2:], workers)
+    assert not count_verilator_coverage_files([], workers)
+
+
+@pytest.mark.parametrize("shards", [1, 3, 4, 9, 20])
+def test_shards(coverage, shards):
+    files, _ = coverage
+    result = shard_coverage_files(files, shards)
+    assert len(result) == min(shards, len(files))
+    assert sorted(f for shard in result for f in shard) == sorted(files)
+
+
+@pytest.mark.parametrize("n", [0, 1, 2, 5, 8])
+def test_tree_reduce(n):
+    counters = [Counter({"a": i, "b%d" % i: 1}) for i in range(1, n + 1)]
+    expected = sum(counters, Counter())
+    assert tree_reduce_counters([Counter(c) for c in counters]) == expected
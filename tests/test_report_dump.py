@@ -0,0 +1,109 @@
+import gzip
+import json
+import os
+from types import SimpleNamespace
+
+import pytest
+
+from toffee_test.utils.report_dump import dump_report_context
+
+
+def report(nodeid, when, outcome, **kwargs):
+    return SimpleNamespace(
+        nodeid=nodeid,
+        when=when,
+        outcome=outcome,
+        duration=0.5,
+        location=("test_a.py", 3, nodeid),
+        **kwargs,
+    )
+
+
+def make_context(tests):
+    return {
+        "config": object(),
+        "session": SimpleNamespace(),
+        "title": "Toffee Test Report",
+        "metadata": {"Python": "3"},
+        "coverages": {"line": {"hints": 3, "total": 4}, "functional": None},
+        "tests": [
+            {
+                "item": SimpleNamespace(nodeid=nodeid),
+                "status": {"word": outcome.upper()},
+                "phases": [
+                    {"call": object(), "report": report(nodeid, "call", outcome, **kw)}
+                ],
+            }
+            for nodeid, outcome, kw in tests
+        ],
+    }
+
+
+TESTS = [
+    ("test_a.py::test_ok", "passed", {}),
+    ("test_a.py::test_bad", "failed", {"longreprtext": "assert 0"}),
+    ("test_a.py::test_xfail", "skipped", {"wasxfail": "known", "longreprtext": ""}),
+]
+
+
+def read(path, compress):
+    if compress:
+        assert path.endswith(".gz")
+        with gzip.open(path, "rt", encoding="utf-8") as f:
+            return f.read()
+    with open(path, encoding="utf-8") as f:
+        return f.read()
+
+
+def load(path, fmt, compress):
+    text = read(path, compress)
+    if fmt == "json":
+        return json.loads(text)
+    lines = [json.loads(line) for line in text.splitlines()]
+    assert [line.pop("type") for line in lines] == ["session"] + ["test"] * (
+        len(lines) - 1
+    )
+    return {**lines[0], "tests": lines[1:]}
+
+
+@pytest.mark.parametrize("compress", [False, True])
+@pytest.mark.parametrize("compact", [False, True])
+@pytest.mark.parametrize("fmt", ["json", "ndjson"])
+@pytest.mark.parametrize("tests", [TESTS, []], ids=["tests", "empty"])
+def test_dump(tmp_path, fmt, compact, compress, tests):
+    path = dump_report_context(
+        make_context(tests), str(tmp_path), fmt, compact, compress
+    )
+    suffix = ".gz" if compress else ""
+    assert path == str(tmp_path / ("toffee_report." + fmt + suffix))
+    data = load(path, fmt, compress)
+    # pytest objects are dropped
+    assert "config" not in data and "session" not in data
+    assert data["title"] == "Toffee Test Report"
+    assert data["metadata"] == {"Python": "3"}
+    # The coverages are replaced by the names of their sidecar files
+    assert data["coverages"] == {
+        "line": "coverage_line.json" + suffix,
+        "functional": "coverage_functional.json" + suffix,
+    }
+    sidecars = {
+        name: json.loads(read(os.path.join(str(tmp_path), f), compress))
+        for name, f in data["coverages"].items()
+    }
+    assert sidecars == {"line": {"hints": 3, "total": 4}, "functional": None}
+    assert [t["item"] for t in data["tests"]] == [nodeid for nodeid, _, _ in tests]
+    if compact:
+        assert "\n " not in read(path, compress)
+    if not tests:
+        return
+    ok, bad, xfail = (t["phases"][0] for t in data["tests"])
+    assert all("call" not in p for p in (ok, bad, xfail))
+    assert ok["report"] == {
+        "nodeid": "test_a.py::test_ok",
+        "when": "call",
+        "outcome": "passed",
+        "duration": 0.5,
+        "location": ["test_a.py", 3, "test_a.py::test_ok"],
+    }
+    assert bad["report"]["longrepr"] == "assert 0"
+    assert xfail["report"]["wasxfail"] == "known"
@@ -0,0 +1,265 @@
+from types import SimpleNamespace
+
+import pytest
+
+from toffee_test import request as toffee_request
+from toffee_test import timing
+from toffee_test.reporter import __update_sim_metrics__
+from toffee_test.reporter import set_sim_metrics
+from toffee_test.request import CovSampler
+from toffee_test.request import ToffeeRequest
+
+
+class FakeClock:
+    def __init__(self):
+        self.clk = 0
+        self.callbacks = []
+
+    def StepRis(self, callback):
+        self.callbacks.append(callback)
+
+    def Step(self, cycles):
+        for _ in range(cycles):
+            self.clk += 1
+            for callback in self.callbacks:
+                callback(self.clk)
+
+
+class FakeDUT:
+    def __init__(self, **kwargs):
+        self.xclock = FakeClock()
+
+    def GetWaveFormat(self):
+        return ""
+
+    def GetCovMetrics(self):
+        return 0
+
+    def Finish(self):
+        pass
+
+
+class FakeGroup:
+    def __init__(self):
+        self.cycles = []
+        self.clock = None
+
+    def sample(self):
+        self.cycles.append(self.clock.clk)
+
+    def clear(self):
+        pass
+
+
+def fake_request(no_func_cov=False):
+    options = {"--toffee-report": False, "--no-func-cov": no_func_cov}
+    return ToffeeRequest(SimpleNamespace(config=SimpleNamespace(getoption=options.get)))
+
+
+def groups_of(dut, n):
+    groups = [FakeGroup() for _ in range(n)]
+    for g in groups:
+        g.clock = dut.xclock
+    return groups
+
+
+@pytest.mark.parametrize("timed", [False, True])
+def test_one_callback_for_all_groups(monkeypatch, timed):
+    if timed:
+        monkeypatch.setattr(timing, "__stage_timer__", timing.StageTimer())
+    request = fake_request()
+    dut = request.create_dut(FakeDUT)
+    every_cycle = groups_of(dut, 2)
+    request.add_cov_groups(every_cycle)
+    every_third = groups_of(dut, 1)
+    request.add_cov_groups(every_third, periodic_sample=3)
+    dut.xclock.Step(7)
+    assert len(dut.xclock.callbacks) == 1
+    assert [g.cycles for g in every_cycle] == [list(range(1, 8))] * 2
+    assert every_third[0].cycles == [3, 6]
+    assert (request.cov_sampler.seconds > 0) == timed
+    assert len(request.cov_groups) == 3
+    request.finish(None)
+    assert not request.cov_groups and not request.cov_sampler.groups
+
+
+def test_sample_enable():
+    request = fake_request()
+    dut = request.create_dut(FakeDUT)
+    enabled = groups_of(dut, 1)
+    request.add_cov_groups(
+        enabled, periodic_sample=2, sample_enable=lambda: 3 <= dut.xclock.clk <= 7
+    )
+    dut.xclock.Step(10)
+    assert enabled[0].cycles == [4, 6]
+
+
+def test_groups_added_before_dut():
+    request = fake_request()
+    groups = [FakeGroup()]
+    request.add_cov_groups(groups, periodic_sample=2)
+    request.add_cov_groups([FakeGroup()], periodic_sample=False)
+    assert request.cov_sampler is None
+    dut = request.create_dut(FakeDUT)
+    groups[0].clock = dut.xclock
+    dut.xclock.Step(4)
+    assert groups[0].cycles == [2, 4]
+    assert request.cov_sampler.groups == []
+
+
+def test_no_func_cov():
+    request = fake_request(no_func_cov=True)
+    dut = request.create_dut(FakeDUT)
+    request.add_cov_groups(groups_of(dut, 1))
+    assert request.cov_sampler is None and not dut.xclock.callbacks
+
+
+def test_sampler_schedule():
+    clock = FakeClock()
+    always, every_other, gated = groups_of(SimpleNamespace(xclock=clock), 3)
+    sampler = CovSampler()
+    sampler.add(always)
+    sampler.add(every_other, every=2)
+    sampler.add(gated, enable=lambda: clock.clk % 3 == 0)
+    assert sampler.callback is sampler
+    clock.StepRis(sampler.callback)
+    clock.Step(6)
+    assert always.cycles == [1, 2, 3, 4, 5, 6]
+    assert every_other.cycles == [2, 4, 6]
+    assert gated.cycles == [3, 6]
+    assert sampler.cycle == 6 and sampler.seconds == 0.0
+    sampler.clear()
+    clock.Step(1)
+    assert len(always.cycles) == 6
+
+
+class SlowGroup(FakeGroup):
+    def __init__(self, clock, now):
+        super().__init__()
+        self.clock = clock
+        self.now = now
+
+    def sample(self):
+        super().sample()
+        self.now[0] += 0.05
+
+
+def pytest_request(tmp_path):
+    options = {"--toffee-report": True, "--no-func-cov": False}
+    return SimpleNamespace(
+        config=SimpleNamespace(
+            getoption=options.get,
+            option=SimpleNamespace(report=[str(tmp_path / "report.html")]),
+        ),
+        node=SimpleNamespace(name="test_a", nodeid="t::test_a"),
+        session=SimpleNamespace(),
+        path="tests/t.py",
+        scope="function",
+    )
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    now = [100.0]
+    monkeypatch.setattr(toffee_request.time, "perf_counter", lambda: now[0])
+    monkeypatch.setattr(timing, "__stage_timer__", timing.StageTimer())
+    return now
+
+
+def test_sim_metrics(tmp_path, clock, monkeypatch):
+    # The groups are fakes, they are not serialized
+    monkeypatch.setattr(toffee_request, "set_func_coverage", lambda *args: None)
+    request = pytest_request(tmp_path)
+    toffee = ToffeeRequest(request)
+    dut = toffee.create_dut(FakeDUT)
+    dut.xclock.Step(2)
+    toffee.add_cov_groups([SlowGroup(dut.xclock, clock)], periodic_sample=2)
+    dut.xclock.Step(10)
+    clock[0] += 1.75
+    toffee.finish(request)
+    assert request.node.__sim_metrics__ == [
+        {
+            "dut": "FakeDUT",
+            "cycles": 12,
+            "seconds": pytest.approx(2.0),
+            "sample_seconds": pytest.approx(0.25),
+            "cycles_per_second": pytest.approx(6.0),
+            "sample_fraction": pytest.approx(0.125),
+            "nodeid": "t::test_a",
+        }
+    ]
+
+
+def test_sim_metrics_no_elapsed_time(tmp_path, clock):
+    request = pytest_request(tmp_path)
+    toffee = ToffeeRequest(request)
+    toffee.create_dut(FakeDUT)
+    toffee.finish(request)
+    (metrics,) = request.node.__sim_metrics__
+    assert metrics["seconds"] == 0.0 and metrics["cycles"] == 0
+    assert metrics["cycles_per_second"] == 0.0 and metrics["sample_fraction"] == 0.0
+
+
+def metrics(dut, nodeid, cycles, seconds, sample_seconds=0.0):
+    return {
+        "dut": dut,
+        "nodeid": nodeid,
+        "cycles": cycles,
+        "seconds": seconds,
+        "sample_seconds": sample_seconds,
+        "cycles_per_second": cycles / seconds if seconds > 0 else 0.0,
+    }
+
+
+def test_update_sim_metrics():
+    assert __update_sim_metrics__([]) is None
+    rows = [
+        metrics("top", "t::a", 100, 1.0, 0.5),
+        metrics("top", "t::b", 300, 1.0, 0.5),
+        metrics("top", "t::c", 20, 0.5),
+        # Tests that did not step the clock are not the slowest ones
+        metrics("top", "t::d", 0, 0.5),
+        metrics("alu", "t::e", 0, 0.0),
+    ]
+    result = __update_sim_metrics__(rows)
+    assert result["tests"] == rows
+    assert result["duts"] == {
+        "top": {
+            "tests": 4,
+            "cycles": 420,
+            "seconds": 3.0,
+            "sample_seconds": 1.0,
+            "slowest_test": "t::c",
+            "slowest_cycles_per_second": 40.0,
+            "cycles_per_second": 140.0,
+            "sample_fraction": 1.0 / 3.0,
+        },
+        "alu": {
+            "tests": 1,
+            "cycles": 0,
+            "seconds": 0.0,
+            "sample_seconds": 0.0,
+            "slowest_test": None,
+            "slowest_cycles_per_second": None,
+            "cycles_per_second": 0.0,
+            "sample_fraction": 0.0,
+        },
+    }
+
+
+def test_set_sim_metrics():
+    session = SimpleNamespace()
+    node = SimpleNamespace(nodeid="t::a")
+    request = SimpleNamespace(scope="function", session=session, node=node)
+    set_sim_metrics(request, {"cycles": 1})
+    set_sim_metrics(request, {"cycles": 2})
+    assert node.__sim_metrics__ == [
+        {"cycles": 1, "nodeid": "t::a"},
+        {"cycles": 2, "nodeid": "t::a"},
+    ]
+    # Module scoped requests are buffered on the session
+    module = SimpleNamespace(scope="module", session=session, node=SimpleNamespace())
+    module.node.nodeid = "t.py"
+    set_sim_metrics(module, {"cycles": 3})
+    assert session.__sim_metrics__ == [{"cycles": 3, "nodeid": "t.py"}]
+    assert not hasattr(module.node, "__sim_metrics__")
@@ -0,0 +1,139 @@
+from types import SimpleNamespace
+
+import pytest
+
+from toffee_test import plugin
+from toffee_test.scheduler import DurationHistory
+from toffee_test.scheduler import DurationScheduling
+from toffee_test.scheduler import lpt_makespan
+
+
+class FakeCache:
+    def __init__(self, values):
+        self.values = values
+
+    def get(self, key, default):
+        return self.values.get(key, default)
+
+    def set(self, key, value):
+        self.values[key] = value
+
+
+class FakeConfig:
+    def __init__(self, durations, workers=2):
+        self.cache = FakeCache({DurationHistory.CACHE_KEY: durations})
+        self.workers = workers
+
+    def getvalue(self, name):
+        assert name == "tx"
+        return ["%d*popen" % self.workers]
+
+    def getoption(self, name):
+        assert name == "maxschedchunk"
+        return None
+
+
+class FakeNode:
+    def __init__(self, name):
+        self.gateway = SimpleNamespace(id=name)
+        self.shutting_down = False
+        self.sent = []
+
+    def send_runtest_some(self, indices):
+        self.sent.extend(indices)
+
+    def shutdown(self):
+        self.shutting_down = True
+
+
+def report(nodeid, duration, node=None):
+    return SimpleNamespace(nodeid=nodeid, duration=duration, node=node)
+
+
+def test_lpt_makespan():
+    assert lpt_makespan([], 2) == 0.0
+    assert lpt_makespan([3.0, 3.0, 2.0, 2.0, 2.0], 2) == 7.0
+    assert lpt_makespan([5.0, 1.0, 1.0], 4) == 5.0
+
+
+def test_history_smoothing():
+    config = FakeConfig({"a": 4.0, "b": 1.0, "c": 2.0})
+    history = DurationHistory(config)
+    assert history.estimate("a") == 4.0
+    # Tests without history are estimated with the median
+    assert history.estimate("new") == 2.0
+    for phase in (0.5, 1.5, 0.0):
+        history.pytest_runtest_logreport(report("a", phase))
+    history.pytest_runtest_logreport(report("new", 3.0))
+    history.pytest_sessionfinish(None)
+    assert config.cache.values[DurationHistory.CACHE_KEY] == {
+        "a": 3.0,
+        "b": 1.0,
+        "c": 2.0,
+        "new": 3.0,
+    }
+
+
+def test_history_without_cache():
+    history = DurationHistory(SimpleNamespace(cache=None))
+    assert history.estimate("a") == 1.0
+    history.pytest_runtest_logreport(report("a", 1.0))
+    history.pytest_sessionfinish(None)
+
+
+@pytest.fixture
+def scheduling():
+    durations = {"t0": 1.0, "t1": 8.0, "t2": 3.0, "t3": 5.0, "t4": 2.0}
+    config = FakeConfig(durations)
+    sched = DurationScheduling(config, history=DurationHistory(config))
+    nodes = [FakeNode("gw0"), FakeNode("gw1")]
+    collection = ["t0", "t1", "t2", "t3", "t4", "t5"]
+    for node in nodes:
+        sched.add_node(node)
+        sched.add_node_collection(node, collection)
+    sched.schedule()
+    return sched, nodes
+
+
+def test_longest_first(scheduling):
+    sched, (gw0, gw1) = scheduling
+    # t5 has no history and is estimated with the median, 3.0
+    assert gw0.sent == [1, 2] and gw1.sent == [3, 5]
+    assert sched.pending == [4, 0]
+    assert sched.history.predicted_makespan == lpt_makespan(
+        [1.0, 8.0, 3.0, 5.0, 2.0, 3.0], 2
+    )
+
+
+def test_free_worker_gets_next_test(scheduling):
+    sched, (gw0, gw1) = scheduling
+    sched.mark_test_complete(gw1, 3)
+    assert gw1.sent == [3, 5, 4]
+    sched.mark_test_complete(gw0, 1)
+    assert gw0.sent == [1, 2, 0]
+    assert not sched.pending
+    sched.mark_test_complete(gw1, 5)
+    assert gw1.shutting_down and not gw0.shutting_down
+
+
+@pytest.mark.parametrize(
+    "duration_sched, dist, replaced",
+    [
+        (False, "load", False),
+        (True, "load", True),
+        # An explicit --dist keeps its own scheduler
+        (True, "loadfile", False),
+        (True, "loadgroup", False),
+    ],
+)
+def test_make_scheduler(duration_sched, dist, replaced):
+    config = FakeConfig({"t0": 1.0})
+    options = {"--duration-sched": duration_sched, "dist": dist}
+    config.getoption = lambda name: options.get(name)
+    config._toffee_duration_history = DurationHistory(config)
+    sched = plugin.pytest_xdist_make_scheduler(config, None)
+    assert isinstance(sched, DurationScheduling) == replaced
+    if replaced:
+        assert sched.history is config._toffee_duration_history
+    else:
+        assert sched is None
@@ -0,0 +1,58 @@
+import os
+from collections import Counter
+
+import pytest
+
+from toffee_test.utils.verilator_coverage.point_dict import build_key
+from toffee_test.utils.verilator_coverage.point_dict import PointDictionary
+from toffee_test.utils.verilator_coverage.processor import (
+    count_verilator_coverage_files,
+)
+from toffee_test.utils.verilator_coverage.processor import write_verilator_coverage
+from toffee_test.utils.verilator_coverage.shared import read_shared_hits
+from toffee_test.utils.verilator_coverage.shared import SharedHitVector
+
+
+@pytest.fixture
+def dat_files(write_dat, entry):
+    points = [entry("rtl/top.sv", line) for line in range(1, 6)]
+    return [
+        write_dat("a.dat", {p: i for i, p in enumerate(points)}),
+        write_dat("b.dat", {p: 1 for p in points}),
+        write_dat("c.dat", {points[0]: 3, entry("rtl/new.sv", 1): 2}),
+    ]
+
+
+def test_build_key():
+    digest = "0123456789abcdef0123456789abcdef"
+    assert build_key(digest) == digest
+    for build in ("x" * 100, "rtl-ü", digest.upper()):
+        key = build_key(build)
+        assert len(key) == 32 and build_key(key) == key
+        assert key != build
+
+
+def test_invalid_build_id(tmp_path):
+    with pytest.raises(ValueError):
+        SharedHitVector(str(tmp_path / "x.vec"), PointDictionary("x" * 40))
+
+
+def test_shared_vectors(tmp_path, dat_files):
+    shared_dir = tmp_path / "shared"
+    shared_dir.mkdir()
+    build_id = build_key("bench")
+    dictionary = PointDictionary(build_id)
+    dictionary.learn(dat_files[0])
+    extra = Counter()
+    # Two processes, each with its own vector file
+    for process_id, files in (("gw0", dat_files[:2]), ("gw1", dat_files[2:])):
+        path = os.path.join(shared_dir, "%s-%s.vec" % (build_id, process_id))
+        vector = SharedHitVector(path, dictionary)
+        for f in files:
+            vector.add(f, extra)
+        vector.close()
+    # Entries missing from the dictionary are left in a coverage file
+    write_verilator_coverage(extra, os.path.join(shared_dir, "gw1.dat"))
+    assert read_shared_hits(str(shared_dir)) == count_verilator_coverage_files(
+        dat_files, 1
+    )
@@ -0,0 +1,87 @@
+from types import SimpleNamespace
+
+import pytest
+
+from toffee_test import hooks
+from toffee_test import plugin
+from toffee_test import timing
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    """Disable timing until a test enables it, the clock is advanced by hand."""
+    now = [0.0]
+    monkeypatch.setattr(timing.time, "perf_counter", lambda: now[0])
+    monkeypatch.setattr(timing, "__stage_timer__", None)
+    return now
+
+
+def test_disabled(clock):
+    with timing.stage_timer("idle"):
+        clock[0] += 1.0
+    assert timing.get_stage_timer() is None
+
+
+def test_nesting_and_accumulation(clock):
+    timer = timing.enable_stage_timing()
+    assert timing.get_stage_timer() is timer
+    with timing.stage_timer("outer"):
+        clock[0] += 1.0
+        with timing.stage_timer("inner"):
+            clock[0] += 2.0
+        clock[0] += 0.5
+    with pytest.raises(ValueError):
+        with timing.stage_timer("inner"):
+            clock[0] += 4.0
+            raise ValueError
+    # Nested stages are booked on their own, the outer one includes the inner one
+    assert timer.session == {"outer": 3.5, "inner": 6.0}
+
+
+def test_tests_and_session(clock):
+    timer = timing.enable_stage_timing()
+    for nodeid, seconds in (("t::a", 1.0), ("t::b", 2.0), ("t::a", 0.25)):
+        plugin.pytest_runtest_protocol(SimpleNamespace(nodeid=nodeid), None)
+        with timing.stage_timer("dut_finish"):
+            clock[0] += seconds
+        # The times of a test travel to the controller on its teardown report
+        report = SimpleNamespace(nodeid=nodeid, __toffee_timing__=timer.finish_test())
+        plugin.pytest_runtest_logreport(report)
+    with timing.stage_timer("dut_finish"):
+        clock[0] += 8.0
+    assert timer.as_dict() == {
+        "totals": {"dut_finish": 11.25},
+        "session": {"dut_finish": 8.0},
+        "tests": {"t::a": {"dut_finish": 1.25}, "t::b": {"dut_finish": 2.0}},
+    }
+
+
+class TimingRecorder:
+    def __init__(self):
+        self.calls = []
+
+    def pytest_toffee_timing(self, config, timing):
+        self.calls.append((config, timing))
+
+
+def hook_config(**kwargs):
+    pm = pytest.PytestPluginManager()
+    pm.add_hookspecs(hooks)
+    recorder = TimingRecorder()
+    pm.register(recorder)
+    return SimpleNamespace(hook=pm.hook, **kwargs), recorder
+
+
+def test_hook(clock):
+    config, recorder = hook_config()
+    plugin.pytest_unconfigure(config)
+    assert recorder.calls == []
+    timer = timing.enable_stage_timing()
+    with timing.stage_timer("report"):
+        clock[0] += 1.0
+    # Only called on the controller
+    worker, worker_recorder = hook_config(workerinput={"workerid": "gw0"})
+    plugin.pytest_unconfigure(worker)
+    assert worker_recorder.calls == []
+    plugin.pytest_unconfigure(config)
+    assert recorder.calls == [(config, timer.as_dict())]
@@ -0,0 +1,175 @@
+import os
+from types import SimpleNamespace
+
+import pytest
+
+from toffee.funcov import CovGroup
+
+from toffee_test import plugin
+from toffee_test import reporter
+from toffee_test.aggregator import WorkerLineCoverageMerger
+from toffee_test.utils.verilator_coverage.processor import (
+    count_verilator_coverage_files,
+)
+
+
+def controller_config():
+    return SimpleNamespace(
+        _toffee_worker_coverage={
+            "func": [],
+            "line": [],
+            "sim": [],
+            "shards": [],
+            "schemas": {},
+        }
+    )
+
+
+def worker_config(tmp_path, workerid):
+    return SimpleNamespace(
+        option=SimpleNamespace(report=[str(tmp_path / "report" / "report.html")]),
+        workerinput={"workerid": workerid},
+        workeroutput={},
+    )
+
+
+def node_down(controller, worker):
+    plugin.pytest_testnodedown(
+        SimpleNamespace(config=controller, workeroutput=worker.workeroutput), None
+    )
+
+
+@pytest.fixture
+def dat_files(write_dat, entry, tmp_path):
+    os.makedirs(tmp_path / "report")
+    return [
+        write_dat(
+            "%d.dat" % i,
+            {entry("rtl/a.sv", line): (line + i) % 3 for line in range(1, 4 + i)},
+        )
+        for i in range(7)
+    ]
+
+
+def test_line_coverage_shards(dat_files, tmp_path):
+    controller = controller_config()
+    passed = []
+    expected = count_verilator_coverage_files(
+        [f for i, f in enumerate(dat_files) if i % 3], 1
+    )
+    for workerid, files in (
+        ("gw0", dat_files[:4]),
+        ("gw1", dat_files[4:]),
+        ("gw2", []),
+    ):
+        config = worker_config(tmp_path, workerid)
+        merger = WorkerLineCoverageMerger(config)
+        for dat in files:
+            i = dat_files.index(dat)
+            report = SimpleNamespace(
+                nodeid="t::%d" % i,
+                when="teardown",
+                outcome="passed" if i % 3 else "failed",
+                __line_coverage__={
+                    "hash": str(hash(dat)),
+                    "id": workerid,
+                    "data": dat,
+                    "ignore": [],
+                },
+            )
+            merger.pytest_runtest_logreport(report)
+            # Folded files are flagged for the controller and removed
+            merged = report.__line_coverage__.get("merged", False)
+            assert merged == (i % 3 != 0) and os.path.exists(dat) != merged
+            if merged:
+                passed.append(dat)
+        merger.pytest_sessionfinish(None)
+        assert ("toffee_line_coverage_shard" in config.workeroutput) == bool(files)
+        node_down(controller, config)
+    worker_coverage = controller._toffee_worker_coverage
+    assert len(worker_coverage["shards"]) == 2
+    assert [lc["data"] for lc in worker_coverage["line"]] == worker_coverage["shards"]
+    assert len(passed) == 4
+    assert count_verilator_coverage_files(worker_coverage["shards"], 1) == expected
+
+
+def cov_group(values):
+    group = CovGroup("grp")
+    value = SimpleNamespace(v=0)
+    group.add_watch_point(
+        value, {"lo": lambda x: x.v < 3, "hi": lambda x: x.v >= 3}, name="v"
+    )
+    for v in values:
+        value.v = v
+        group.sample()
+    return group
+
+
+def run_module(session, name, values, dat):
+    # A module scoped request collecting coverage
+    request = SimpleNamespace(scope="module", session=session, node=SimpleNamespace())
+    reporter.set_func_coverage(request, cov_group(values))
+    reporter.set_line_coverage(request, dat)
+    request.node.nodeid = name
+    cycles = len(values)
+    reporter.set_sim_metrics(
+        request,
+        {
+            "dut": "top",
+            "cycles": cycles,
+            "seconds": 1.0,
+            "sample_seconds": 0.0,
+            "cycles_per_second": float(cycles),
+            "sample_fraction": 0.0,
+        },
+    )
+
+
+def report_context(tmp_path, name, session, config):
+    options = {
+        "--line-cov-workers": 1,
+        "--line-cov-genhtml": False,
+        "--line-cov-cache": None,
+        "--line-cov-cache-size": 512,
+        "--line-cov-dat-cache": None,
+        "--line-cov-dat-cache-size": 1024,
+        "--line-cov-memory-budget": 0,
+    }
+    config.getoption = options.get
+    config.option = SimpleNamespace(toffee_report_dump_json=False)
+    reporter.set_output_report(str(tmp_path / name / "report.html"))
+    context = {"tests": [], "metadata": {}, "session": session}
+    reporter.process_context(context, config)
+    return context
+
+
+def test_session_buffers(dat_files, tmp_path):
+    modules = [
+        ("test_%d.py" % i, list(range(i, 2 * i + 1)), dat)
+        for i, dat in enumerate(dat_files[:5])
+    ]
+    serial = SimpleNamespace()
+    for module in modules:
+        run_module(serial, *module)
+    expected = report_context(tmp_path, "serial", serial, SimpleNamespace())
+
+    controller = controller_config()
+    for workerid, worker_modules in (("gw0", modules[:2]), ("gw1", modules[2:])):
+        config = worker_config(tmp_path, workerid)
+        session = SimpleNamespace(config=config)
+        for module in worker_modules:
+            run_module(session, *module)
+        plugin.pytest_sessionfinish(session)
+        node_down(controller, config)
+    assert len(controller._toffee_worker_coverage["schemas"]) == 1
+    context = report_context(tmp_path, "xdist", SimpleNamespace(), controller)
+    assert context["coverages"] == expected["coverages"]
+    assert context["coverages"]["line"]["total"] > 0
+    groups = context["coverages"]["functional"]["groups"]
+    bins = [
+        cov_group(values).as_dict()["points"][0]["bins"] for _, values, _ in modules
+    ]
+    assert [b["hints"] for b in groups[0]["points"][0]["bins"]] == [
+        sum(b[i]["hints"] for b in bins) for i in range(2)
+    ]
+    assert context["sim_metrics"] == expected["sim_metrics"]
@@ -0,0 +1,221 @@
+import os
+import queue
+import threading
+import uuid
+from collections import Counter
+
+import pytest
+
+from .reporter import __merge_func_coverage__
+from .utils import report_passed
+from .utils.verilator_coverage.processor import get_point_dictionary
+from .utils.verilator_coverage.processor import LineHitSum
+from .utils.verilator_coverage.processor import write_verilator_coverage
+from .utils.verilator_coverage.shared import SharedHitVector
+
+
+class CoverageAggregator:
+    """
+    Fold the coverage carried by test reports into a running merged state while tests are still running.
+
+    Reports are handed over from `pytest_runtest_logreport` and parsed on a background thread, so that at
+    the end of the session `process_context` only has to filter and render the merged data.
+    """
+
+    def __init__(self):
+        self.line_hits = Counter()
+        self.line_coverage_list = []
+        self._line_sum = LineHitSum()
+        self.line_keys = set()
+        self.func_merged = None
+        self.func_keys = set()
+        self.has_func_coverage = False
+        self.error = None
+
+        self._failed_tests = set()
+        self._queue = queue.Queue()
+        self._thread = threading.Thread(
+            target=self._run, name="toffee-coverage-aggregator", daemon=True
+        )
+
+    def start(self):
+        self._thread.start()
+
+    def pytest_runtest_logreport(self, report):
+        self.submit(report)
+
+    def submit(self, report):
+        """
+        Called with every test report, only reports with coverage of passed tests are folded.
+        """
+
+        if not report_passed(report):
+            self._failed_tests.add(report.nodeid)
+        if hasattr(report, "__coverage_group__"):
+            self.has_func_coverage = True
+            self._queue.put(("func", report.__coverage_group__))
+        if hasattr(report, "__line_coverage__"):
+            if report.nodeid in self._failed_tests:
+                return
+            self._queue.put(("line", report.__line_coverage__))
+
+    def finish(self) -> bool:
+        """
+        Wait until all submitted reports are folded, return False if folding failed.
+        """
+
+        if self._thread.is_alive():
+            self._queue.put(None)
+            self._thread.join()
+            self.line_hits = self._line_sum.counter()
+        return self.error is None
+
+    def _run(self):
+        while True:
+            item = self._queue.get()
+            if item is None:
+                return
+            if self.error is not None:
+                continue
+            try:
+                kind, data = item
+                if kind == "func":
+                    self._fold_func(data)
+                else:
+                    self._fold_line(data)
+            except Exception as e:
+                self.error = e
+
+    def _fold_func(self, groups):
+        new_data = []
+        for fc_data in groups:
+            key = "%s-%s" % (fc_data["hash"], fc_data["id"])
+            if key in self.func_keys:
+                continue
+            self.func_keys.add(key)
+            new_data.append(fc_data["data"])
+        self.func_merged = __merge_func_coverage__(new_data, self.func_merged)
+
+    def _fold_line(self, lc_data):
+        key = "%s-%s" % (lc_data["hash"], lc_data["id"])
+        if key in self.line_keys:
+            return
+        self.line_keys.add(key)
+        if lc_data.get("merged", False):
+            # Already folded into the shard of an xdist worker
+            self.line_coverage_list.append(lc_data)
+            return
+        self._line_sum.add(lc_data["data"], lc_data.get("build"))
+        self.line_coverage_list.append({**lc_data, "merged": True})
+
+
+class WorkerLineCoverageMerger:
+    """
+    Keep a running merged hit map of the line coverage of passed tests on an xdist worker.
+
+    Folded entries are flagged as merged in the report so that the controller does not read them
+    again. At the end of the session the merged hits are written as one shard, which is handed to
+    the controller through `workeroutput`.
+    """
+
+    def __init__(self, config, keep_dat=False):
+        self.config = config
+        self.keep_dat = keep_dat
+        self.hits = LineHitSum()
+        self._failed_tests = set()
+
+    @pytest.hookimpl(tryfirst=True)
+    def pytest_runtest_logreport(self, report):
+        # Run before xdist sends the report to the controller
+        if not report_passed(report):
+            self._failed_tests.add(report.nodeid)
+        if (
+            not hasattr(report, "__line_coverage__")
+            or report.nodeid in self._failed_tests
+        ):
+            return
+        lc_data = report.__line_coverage__
+        if lc_data.get("merged", False):
+            return
+        self.hits.add(lc_data["data"], lc_data.get("build"))
+        report.__line_coverage__ = {**lc_data, "merged": True}
+        if not self.keep_dat:
+            try:
+                os.remove(lc_data["data"])
+            except OSError:
+                pass
+
+    def pytest_sessionfinish(self, session):
+        if not self.hits:
+            return
+        report_dir = os.path.dirname(self.config.option.report[0])
+        shard = os.path.join(
+            report_dir, "line_coverage_%s.dat" % self.config.workerinput["workerid"]
+        )
+        write_verilator_coverage(self.hits.counter(), shard)
+        self.config.workeroutput["toffee_line_coverage_shard"] = {
+            "hash": "%s" % hash(shard),
+            "id": "H%s-P%s" % (uuid.getnode(), os.getpid()),
+            "data": shard,
+            "ignore": [],
+        }
+
+
+class SharedLineCoverage:
+    """
+    Add the line coverage of passed tests to memory-mapped hit vectors as soon as each test ends.
+
+    Each process (xdist worker or the controller itself) keeps one vector per DUT build in
+    `shared_dir`, over the point ids of the build. The controller reads the vectors directly
+    instead of the coverage files. Files without a build id are left to the controller, entries
+    missing from the point dictionary are written to one leftover file per process.
+    """
+
+    def __init__(self, shared_dir: str, process_id: str, keep_dat=False):
+        self.shared_dir = shared_dir
+        self.process_id = process_id
+        self.keep_dat = keep_dat
+        self.vectors: dict[str, SharedHitVector] = {}
+        self.extra = Counter()
+        self._failed_tests = set()
+
+    @pytest.hookimpl(tryfirst=True)
+    def pytest_runtest_logreport(self, report):
+        # Run before xdist sends the report to the controller
+        if not report_passed(report):
+            self._failed_tests.add(report.nodeid)
+        if (
+            not hasattr(report, "__line_coverage__")
+            or report.nodeid in self._failed_tests
+        ):
+            return
+        lc_data = report.__line_coverage__
+        build_id = lc_data.get("build")
+        if build_id is None or lc_data.get("merged", False):
+            return
+        vector = self.vectors.get(build_id)
+        if vector is None:
+            path = os.path.join(
+                self.shared_dir, "%s-%s.vec" % (build_id, self.process_id)
+            )
+            vector = self.vectors[build_id] = SharedHitVector(
+                path, get_point_dictionary(build_id, lc_data["data"])
+            )
+        vector.add(lc_data["data"], self.extra)
+        report.__line_coverage__ = {**lc_data, "merged": True}
+        if not self.keep_dat:
+            try:
+                os.remove(lc_data["data"])
+            except OSError:
+                pass
+
+    @pytest.hookimpl(tryfirst=True)
+    def pytest_sessionfinish(self, session):
+        # Before the report of the controller is generated
+        for vector in self.vectors.values():
+            vector.close()
+        self.vectors.clear()
+        if self.extra:
+            write_verilator_coverage(
+                self.extra, os.path.join(self.shared_dir, "%s.dat" % self.process_id)
+            )
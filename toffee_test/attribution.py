@@ -0,0 +1,313 @@
+"""
+Coverage attribution index: which tests hit a coverage point.
+
+Points are code lines, named `path:line`, and functional bins, named `group/point/bin`.
+For every point the index keeps the sorted ids of the tests that hit it. On disk the id
+lists are delta encoded as varints and the whole index is gzip compressed.
+
+Query a saved index from the command line:
+
+    python -m toffee_test.attribution coverage_attribution.json.gz --point rtl/top.sv:42
+    python -m toffee_test.attribution coverage_attribution.json.gz --unique "test_top.py::test_reset"
+"""
+
+__all__ = [
+    "AttributionIndex",
+    "AttributionIndexBuilder",
+    "line_point",
+    "bin_point",
+]
+
+import argparse
+import base64
+import gzip
+import json
+import os
+import warnings
+from array import array
+
+from .utils import report_passed
+from .utils.func_coverage import decode_func_coverage
+from .utils.verilator_coverage.models import VerilatorCoverage
+from .utils.verilator_coverage.processor import count_verilator_coverage_hit
+
+
+def line_point(path: str, line: int) -> str:
+    return "%s:%d" % (path, line)
+
+
+def bin_point(group: str, point: str, bin_name: str) -> str:
+    return "%s/%s/%s" % (group, point, bin_name)
+
+
+def _encode_varints(values, out: bytearray):
+    for v in values:
+        while v >= 0x80:
+            out.append((v & 0x7F) | 0x80)
+            v >>= 7
+        out.append(v)
+
+
+def _decode_varints(data: bytes, pos: int, n: int) -> tuple[list[int], int]:
+    values = []
+    for _ in range(n):
+        shift = v = 0
+        while True:
+            b = data[pos]
+            pos += 1
+            v |= (b & 0x7F) << shift
+            if b < 0x80:
+                break
+            shift += 7
+        values.append(v)
+    return values, pos
+
+
+class AttributionIndex:
+    """
+    Map coverage points to the ids of the tests hitting them.
+
+    Hits are usually added in increasing test id order, the posting lists are sorted and
+    de-duplicated when hits come out of order.
+    """
+
+    def __init__(self):
+        self.tests: list[str] = []
+        self.test_ids: dict[str, int] = {}
+        self.points: list[str] = []
+        self.point_ids: dict[str, int] = {}
+        self.postings: list[array] = []
+        self._unique = None
+
+    def add_test(self, nodeid: str) -> int:
+        test_id = self.test_ids.get(nodeid)
+        if test_id is None:
+            test_id = self.test_ids[nodeid] = len(self.tests)
+            self.tests.append(nodeid)
+        return test_id
+
+    def point_id(self, name: str) -> int:
+        pid = self.point_ids.get(name)
+        if pid is None:
+            pid = self.point_ids[name] = len(self.points)
+            self.points.append(name)
+            self.postings.append(array("I"))
+        return pid
+
+    def add_hits(self, test_id: int, point_ids):
+        self._unique = None
+        postings = self.postings
+        for pid in point_ids:
+            p = postings[pid]
+            if not p or p[-1] < test_id:
+                p.append(test_id)
+            elif p[-1] != test_id:
+                postings[pid] = array("I", sorted(set(p).union([test_id])))
+
+    def tests_hitting(self, point: str) -> list[str]:
+        """Node ids of the tests hitting `point`, see `line_point` and `bin_point`."""
+        pid = self.point_ids.get(point)
+        if pid is None:
+            return []
+        return [self.tests[t] for t in self.postings[pid]]
+
+    def points_uniquely_hit_by(self, nodeid: str) -> list[str]:
+        """Points hit by no other test than `nodeid`."""
+        if self._unique is None:
+            unique: dict[int, list[int]] = {}
+            for pid, p in enumerate(self.postings):
+                if len(p) == 1:
+                    unique.setdefault(p[0], []).append(pid)
+            self._unique = unique
+        test_id = self.test_ids.get(nodeid)
+        return [self.points[pid] for pid in self._unique.get(test_id, [])]
+
+    def summary(self, top: int = 50, examples: int = 20) -> dict:
+        """Tests with the most uniquely hit points, with some of those points."""
+        self.points_uniquely_hit_by("")
+        rows = sorted(self._unique.items(), key=lambda kv: -len(kv[1]))[:top]
+        return {
+            "tests": len(self.tests),
+            "points": len(self.points),
+            "unique": [
+                {
+                    "test": self.tests[t],
+                    "count": len(pids),
+                    "points": [self.points[pid] for pid in pids[:examples]],
+                }
+                for t, pids in rows
+            ],
+        }
+
+    def save(self, path: str):
+        blob = bytearray()
+        for p in self.postings:
+            # Deltas must not be negative
+            p = sorted(set(p))
+            _encode_varints([len(p)], blob)
+            prev = 0
+            deltas = []
+            for t in p:
+                deltas.append(t - prev)
+                prev = t
+            _encode_varints(deltas, blob)
+        with gzip.open(path, "wt", encoding="utf-8") as f:
+            json.dump(
+                {
+                    "tests": self.tests,
+                    "points": self.points,
+                    "postings": base64.b64encode(bytes(blob)).decode("ascii"),
+                },
+                f,
+            )
+
+    @classmethod
+    def load(cls, path: str) -> "AttributionIndex":
+        with gzip.open(path, "rt", encoding="utf-8") as f:
+            data = json.load(f)
+        index = cls()
+        for nodeid in data["tests"]:
+            index.add_test(nodeid)
+        blob = base64.b64decode(data["postings"])
+        pos = 0
+        for name in data["points"]:
+            pid = index.point_id(name)
+            (n,), pos = _decode_varints(blob, pos, 1)
+            deltas, pos = _decode_varints(blob, pos, n)
+            prev = 0
+            p = index.postings[pid]
+            for d in deltas:
+                prev += d
+                p.append(prev)
+        return index
+
+
+class AttributionIndexBuilder:
+    """
+    Build the attribution index on the controller from the coverage of each passed test.
+
+    Line coverage is read from the per-test `.dat` files, each distinct entry is only decoded
+    once. Entries already folded on an xdist worker (`--line-cov-premerge`) are skipped unless
+    their files are kept with `--keep-line-cov-dat`.
+    """
+
+    def __init__(self):
+        self.index = AttributionIndex()
+        self._entry_points: dict[str, tuple[int, ...]] = {}
+        self._schemas = {}
+        self._pending = []
+        self._skipped_merged = False
+        self._failed_tests = set()
+
+    def _line_points(self, entry: str) -> tuple[int, ...]:
+        pids = self._entry_points.get(entry)
+        if pids is None:
+            meta = VerilatorCoverage(entry, lazy=True)
+            lines = {meta.line}
+            for b in meta.block:
+                lines.update(b)
+            pids = self._entry_points[entry] = tuple(
+                self.index.point_id(line_point(meta.path, ln)) for ln in sorted(lines)
+            )
+        return pids
+
+    def _add_func(self, test_id: int, data: dict):
+        pids = []
+        for point in data.get("points", []):
+            for b in point.get("bins", []):
+                if b.get("hints", 0) > 0:
+                    pids.append(
+                        self.index.point_id(
+                            bin_point(data["name"], point["name"], b["name"])
+                        )
+                    )
+        self.index.add_hits(test_id, pids)
+
+    def pytest_runtest_logreport(self, report):
+        # Keep the schemas carried by older payloads, those of failed tests included
+        for fc_data in getattr(report, "__coverage_group__", []):
+            g = fc_data["data"]
+            if isinstance(g, dict) and "group" in g:
+                self._schemas.setdefault(g["schema"], g["group"])
+        if not report_passed(report):
+            self._failed_tests.add(report.nodeid)
+        if report.when != "teardown" or report.nodeid in self._failed_tests:
+            return
+        if not hasattr(report, "__coverage_group__") and not hasattr(
+            report, "__line_coverage__"
+        ):
+            return
+        test_id = self.index.add_test(report.nodeid)
+        for fc_data in getattr(report, "__coverage_group__", []):
+            data = decode_func_coverage(fc_data["data"], self._schemas)
+            if data is None:
+                self._pending.append((test_id, fc_data["data"]))
+            else:
+                self._add_func(test_id, data)
+        lc_data = getattr(report, "__line_coverage__", None)
+        if lc_data is None or not os.path.exists(lc_data["data"]):
+            self._skipped_merged |= lc_data is not None and lc_data.get("merged", False)
+            return
+        pids = []
+        for entry, hit in count_verilator_coverage_hit(lc_data["data"]).items():
+            if hit > 0:
+                pids.extend(self._line_points(entry))
+        self.index.add_hits(test_id, pids)
+
+    def finish(self, schemas: dict = None) -> AttributionIndex:
+        """
+        Attribute the functional coverage waiting for its schema, `schemas` maps the schema
+        digests to the schemas registered by the test processes.
+        """
+        for digest, schema in (schemas or {}).items():
+            self._schemas.setdefault(digest, schema)
+        pending, self._pending = self._pending, []
+        missing = set()
+        for test_id, g in pending:
+            data = decode_func_coverage(g, self._schemas)
+            if data is None:
+                missing.add(g["name"])
+            else:
+                self._add_func(test_id, data)
+        if missing:
+            warnings.warn(
+                "Functional coverage schema of groups %s is missing, their bins are not attributed"
+                % ", ".join(sorted(missing))
+            )
+        if self._skipped_merged:
+            warnings.warn(
+                "Line coverage pre-merged on xdist workers is not attributed, use --keep-line-cov-dat"
+            )
+        return self.index
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Query a toffee coverage attribution index."
+    )
+    parser.add_argument("index", help="Path of coverage_attribution.json.gz")
+    parser.add_argument(
+        "--point", action="append", default=[], help="List the tests hitting a point."
+    )
+    parser.add_argument(
+        "--unique",
+        action="append",
+        default=[],
+        help="List the points only hit by a test.",
+    )
+    args = parser.parse_args(argv)
+    index = AttributionIndex.load(args.index)
+    for p in args.point:
+        print("%s:" % p)
+        for t in index.tests_hitting(p):
+            print("  %s" % t)
+    for t in args.unique:
+        print("%s:" % t)
+        for p in index.points_uniquely_hit_by(t):
+            print("  %s" % p)
+    if not args.point and not args.unique:
+        print(json.dumps(index.summary(), indent=2))
+
+
+if __name__ == "__main__":
+    main()
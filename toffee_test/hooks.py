@@ -0,0 +1,13 @@
+"""
+Hooks specifications of toffee-test, implement them in a conftest.py or a plugin.
+"""
+
+
+def pytest_toffee_timing(config, timing: dict):
+    """
+    Called once at the end of the session on the controller when --toffee-timing is set.
+
+    `timing` maps "totals" and "session" to {stage: seconds} and "tests" to
+    {nodeid: {stage: seconds}}, use it to forward the overhead of toffee-test to a
+    metrics system.
+    """
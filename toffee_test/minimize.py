@@ -0,0 +1,171 @@
+"""
+Coverage based regression minimization.
+
+Each test records the points it covers, functional bins with hints and line coverage
+entries with hits, as 8-byte digests on its teardown report. The controller numbers the
+digests, keeps one bitset per test and runs a greedy weighted set cover with the test
+duration as weight. The selected tests are written to a json file, which a later run reads
+with `--cov-select` to only run those tests.
+"""
+
+__all__ = [
+    "CoverageMinimizer",
+    "greedy_set_cover",
+    "func_cover_ids",
+    "line_cover_ids",
+    "item_cover_ids",
+    "pack_cover_ids",
+    "unpack_cover_ids",
+    "load_selection",
+]
+
+import base64
+import hashlib
+import heapq
+import json
+import os
+from collections import defaultdict
+
+from .utils import report_passed
+from .utils.verilator_coverage.processor import count_verilator_coverage_hit
+
+_DIGEST_SIZE = 8
+
+
+def _digest(s: str) -> bytes:
+    return hashlib.blake2b(s.encode("utf-8"), digest_size=_DIGEST_SIZE).digest()
+
+
+def func_cover_ids(groups: list[dict]) -> set[bytes]:
+    """Digests of the bins with hints of CovGroup dicts."""
+    ids = set()
+    for g in groups:
+        for point in g.get("points", []):
+            for b in point.get("bins", []):
+                if b.get("hints", 0) > 0:
+                    ids.add(
+                        _digest("F\0%s\0%s\0%s" % (g["name"], point["name"], b["name"]))
+                    )
+    return ids
+
+
+def line_cover_ids(datfile: str) -> set[bytes]:
+    """Digests of the entries with hits of a line coverage file."""
+    return {
+        _digest("L\0" + k)
+        for k, hit in count_verilator_coverage_hit(datfile).items()
+        if hit > 0
+    }
+
+
+def item_cover_ids(item) -> set[bytes]:
+    """Digests of the points covered by a test item, see `set_func_coverage` and `set_line_coverage`."""
+    ids = set(getattr(item, "__func_cover_ids__", ()))
+    if hasattr(item, "__line_coverage__"):
+        datfile = json.loads(item.__line_coverage__)["datfile"]
+        if os.path.exists(datfile):
+            ids |= line_cover_ids(datfile)
+    return ids
+
+
+def pack_cover_ids(ids: set[bytes]) -> str:
+    return base64.b64encode(b"".join(sorted(ids))).decode("ascii")
+
+
+def unpack_cover_ids(packed: str) -> list[bytes]:
+    raw = base64.b64decode(packed)
+    return [raw[i : i + _DIGEST_SIZE] for i in range(0, len(raw), _DIGEST_SIZE)]
+
+
+def _popcount(x: int) -> int:
+    return bin(x).count("1")
+
+
+def greedy_set_cover(covers: dict[str, int], weights: dict[str, float]) -> list[str]:
+    """
+    Select tests until their bitsets cover the union of all bitsets.
+
+    At each step the test with the most newly covered points per unit of weight is taken.
+    Scores only decrease as points get covered, so stale heap entries are re-scored lazily.
+    """
+    uncovered = 0
+    for bits in covers.values():
+        uncovered |= bits
+    heap = []
+    for nodeid, bits in covers.items():
+        if bits:
+            heapq.heappush(
+                heap, (-_popcount(bits) / max(weights.get(nodeid, 0.0), 1e-3), nodeid)
+            )
+    selected = []
+    while uncovered and heap:
+        _, nodeid = heapq.heappop(heap)
+        gain = _popcount(covers[nodeid] & uncovered)
+        if gain == 0:
+            continue
+        score = -gain / max(weights.get(nodeid, 0.0), 1e-3)
+        if heap and score > heap[0][0]:
+            # Another test may be better now, re-queue with the current score
+            heapq.heappush(heap, (score, nodeid))
+            continue
+        selected.append(nodeid)
+        uncovered &= ~covers[nodeid]
+    return selected
+
+
+class CoverageMinimizer:
+    """
+    Collect the covered points of every passed test and write the minimized selection.
+    """
+
+    def __init__(self, outfile: str):
+        self.outfile = outfile
+        self.index: dict[bytes, int] = {}
+        self.covers: dict[str, int] = defaultdict(int)
+        self.durations: dict[str, float] = defaultdict(float)
+        self.failed: set[str] = set()
+
+    def pytest_runtest_logreport(self, report):
+        self.durations[report.nodeid] += report.duration
+        if not report_passed(report):
+            self.failed.add(report.nodeid)
+        packed = getattr(report, "__toffee_cover_ids__", None)
+        if not packed:
+            return
+        indices = []
+        for d in unpack_cover_ids(packed):
+            i = self.index.get(d)
+            if i is None:
+                i = self.index[d] = len(self.index)
+            indices.append(i)
+        # Set the bits in a byte buffer, or-ing single bits into an int is quadratic
+        buf = bytearray(max(indices) // 8 + 1)
+        for i in indices:
+            buf[i >> 3] |= 1 << (i & 7)
+        self.covers[report.nodeid] |= int.from_bytes(buf, "little")
+
+    def pytest_sessionfinish(self, session):
+        covers = {k: v for k, v in self.covers.items() if k not in self.failed}
+        selected = greedy_set_cover(covers, self.durations)
+        with open(self.outfile, "w") as f:
+            json.dump(
+                {
+                    "tests": selected,
+                    "points": len(self.index),
+                    "total_tests": len(covers),
+                    "selected_duration": sum(self.durations[t] for t in selected),
+                    "total_duration": sum(self.durations[t] for t in covers),
+                },
+                f,
+                indent=2,
+            )
+
+    def pytest_terminal_summary(self, terminalreporter):
+        terminalreporter.write_line(
+            "toffee coverage minimization: selection written to %s" % self.outfile
+        )
+
+
+def load_selection(path: str) -> set[str]:
+    with open(path) as f:
+        return set(json.load(f)["tests"])
@@ -1,17 +1,29 @@
 import inspect
 import os
+import shutil
 
 import pytest
 import toffee
 from toffee import run
 import time
 
+from .aggregator import CoverageAggregator
+from .aggregator import SharedLineCoverage
+from .aggregator import WorkerLineCoverageMerger
+from .attribution import AttributionIndexBuilder
 from .markers import toffee_tags_process
+from .minimize import CoverageMinimizer
+from .minimize import item_cover_ids
+from .minimize import load_selection
+from .minimize import pack_cover_ids
 from .reporter import get_default_report_name
 from .reporter import get_template_dir
 from .reporter import process_context
 from .reporter import process_func_coverage
 from .reporter import set_output_report
+from .scheduler import DurationHistory
+from .timing import enable_stage_timing
+from .timing import get_stage_timer
 from .utils import base64_decode
 from .utils import get_toffee_custom_key_value
 from .utils import set_toffee_custom_key_value
@@ -46,9 +58,47 @@ def pytest_runtest_call(item):
 def pytest_runtest_makereport(item, call):
     outcome = yield
     report = outcome.get_result()
+    timer = get_stage_timer()
+    if timer is not None and call.when == "teardown":
+        report.__toffee_timing__ = timer.finish_test()
+    if call.when == "teardown" and item.config.getoption("--cov-minimize"):
+        report.__toffee_cover_ids__ = pack_cover_ids(item_cover_ids(item))
     return process_func_coverage(item, call, report)
 
 
+@pytest.hookimpl(tryfirst=True)
+def pytest_runtest_protocol(item, nextitem):
+    # Only called where the test runs, not on the xdist controller
+    timer = get_stage_timer()
+    if timer is not None:
+        timer.start_test(item.nodeid)
+
+
+@pytest.hookimpl()
+def pytest_runtest_logreport(report):
+    timer = get_stage_timer()
+    if timer is not None and hasattr(report, "__toffee_timing__"):
+        timer.add_test(report.nodeid, report.__toffee_timing__)
+
+
+def pytest_addhooks(pluginmanager):
+    from . import hooks
+
+    pluginmanager.add_hookspecs(hooks)
+
+
+def pytest_collection_modifyitems(config, items):
+    selection_file = config.getoption("--cov-select")
+    if not selection_file:
+        return
+    selection = load_selection(selection_file)
+    selected = [item for item in items if item.nodeid in selection]
+    deselected = [item for item in items if item.nodeid not in selection]
+    if deselected:
+        config.hook.pytest_deselected(items=deselected)
+        items[:] = selected
+
+
 @pytest.hookimpl(tryfirst=True)
 def pytest_runtest_setup(item):
     toffee_tags_process(item)
@@ -78,6 +128,28 @@ def pytest_addoption(parser: pytest.Parser):
         help="Dump json report.",
     )
 
+    group.addoption(
+        "--report-dump-format",
+        action="store",
+        choices=["json", "ndjson"],
+        default="json",
+        help="Format of the dumped report, ndjson writes one test per line.",
+    )
+
+    group.addoption(
+        "--report-dump-compact",
+        action="store_true",
+        default=False,
+        help="Dump the report without indentation.",
+    )
+
+    group.addoption(
+        "--report-dump-gzip",
+        action="store_true",
+        default=False,
+        help="Gzip the dumped report and its coverage files.",
+    )
+
     group.addoption(
         "--custom-key-value",
         action="store",
@@ -92,6 +164,171 @@ def pytest_addoption(parser: pytest.Parser):
         help="Run test without functional coverage.",
     )
 
+    group.addoption(
+        "--line-cov-workers",
+        action="store",
+        type=int,
+        default=0,
+        help=(
+            "Number of processes used to merge line coverage files and render the line "
+            "coverage pages, 0 to use threads."
+        ),
+    )
+
+    group.addoption(
+        "--incremental-cov",
+        action="store_true",
+        default=False,
+        help=(
+            "Merge the coverage of each test in the background while the tests are "
+            "running."
+        ),
+    )
+
+    group.addoption(
+        "--line-cov-premerge",
+        action="store_true",
+        default=False,
+        help=(
+            "Merge the line coverage of passed tests on each xdist worker, ship one "
+            "file per worker."
+        ),
+    )
+
+    group.addoption(
+        "--line-cov-shared",
+        action="store_true",
+        default=False,
+        help=(
+            "Sum the line coverage of each passed test into memory-mapped counters "
+            "shared with the controller. Cannot be combined with --line-cov-premerge."
+        ),
+    )
+
+    group.addoption(
+        "--keep-line-cov-dat",
+        action="store_true",
+        default=False,
+        help=(
+            "Keep the line coverage file of each test after it is merged on the "
+            "worker."
+        ),
+    )
+
+    group.addoption(
+        "--line-cov-genhtml",
+        action="store_true",
+        default=False,
+        help=(
+            "Render the line coverage pages with lcov's genhtml instead of the "
+            "built-in renderer."
+        ),
+    )
+
+    group.addoption(
+        "--line-cov-cache",
+        action="store",
+        default=None,
+        help=(
+            "Directory of a persistent cache of line coverage pages, unchanged pages "
+            "are not rendered again."
+        ),
+    )
+
+    group.addoption(
+        "--line-cov-cache-size",
+        action="store",
+        type=int,
+        default=512,
+        help=(
+            "Size limit of the line coverage page cache in MiB, least recently used "
+            "pages are evicted."
+        ),
+    )
+
+    group.addoption(
+        "--line-cov-dat-cache",
+        action="store",
+        default=None,
+        help=(
+            "Directory of a persistent cache of parsed line coverage files, unchanged "
+            "files are not parsed again."
+        ),
+    )
+
+    group.addoption(
+        "--line-cov-dat-cache-size",
+        action="store",
+        type=int,
+        default=1024,
+        help=(
+            "Size limit of the parsed line coverage file cache in MiB, least recently "
+            "used files are evicted."
+        ),
+    )
+
+    group.addoption(
+        "--line-cov-memory-budget",
+        action="store",
+        type=float,
+        default=0,
+        help=(
+            "Merge line coverage through sorted runs on disk, holding at most about "
+            "this many MiB of coverage entries in memory. 0 merges in memory, any "
+            "budget above 0 merges on disk, a fraction of a MiB such as 0.01 spills "
+            "several runs even for small designs. The hits summed by --line-cov-shared "
+            "or --incremental-cov are still held in memory, and the files are merged "
+            "by a single process without --line-cov-dat-cache."
+        ),
+    )
+
+    group.addoption(
+        "--duration-sched",
+        action="store_true",
+        default=False,
+        help=(
+            "Keep the duration of every test in the pytest cache and, with xdist, run "
+            "the longest tests first according to the durations of previous runs. An "
+            "explicit --dist other than load keeps its own scheduler."
+        ),
+    )
+
+    group.addoption(
+        "--cov-minimize",
+        action="store",
+        default=None,
+        metavar="FILE",
+        help=(
+            "Write the smallest set of tests reaching the same coverage, weighted by "
+            "duration, to FILE."
+        ),
+    )
+
+    group.addoption(
+        "--cov-select",
+        action="store",
+        default=None,
+        metavar="FILE",
+        help="Only run the tests listed in a selection FILE written by --cov-minimize.",
+    )
+
+    group.addoption(
+        "--cov-attribution",
+        action="store_true",
+        default=False,
+        help=(
+            "Record which tests hit each coverage point, in "
+            "coverage_attribution.json.gz of the report."
+        ),
+    )
+
+    group.addoption(
+        "--toffee-timing",
+        action="store_true",
+        default=False,
+        help="Time the overhead of toffee-test per test and per session.",
+    )
+
 
 @pytest.hookimpl(tryfirst=True)
 def pytest_configure(config: pytest.Config):
@@ -125,6 +362,84 @@ def pytest_configure(config: pytest.Config):
 
         config.option.report = [report_name]
         set_output_report(report_name)
+
+        if config.getoption("--incremental-cov") and not hasattr(config, "workerinput"):
+            config._toffee_coverage_aggregator = CoverageAggregator()
+            config._toffee_coverage_aggregator.start()
+            config.pluginmanager.register(
+                config._toffee_coverage_aggregator, "toffee_coverage_aggregator"
+            )
+        if config.getoption("--line-cov-shared") and config.getoption(
+            "--line-cov-premerge"
+        ):
+            raise pytest.UsageError(
+                "--line-cov-shared and --line-cov-premerge cannot be combined, "
+                "both merge the line coverage on the workers"
+            )
+        if config.getoption("--line-cov-memory-budget") > 0 and not hasattr(
+            config, "workerinput"
+        ):
+            if config.getoption("--line-cov-shared") or config.getoption(
+                "--incremental-cov"
+            ):
+                toffee.warning(
+                    "--line-cov-memory-budget does not bound the line coverage summed "
+                    "by --line-cov-shared or --incremental-cov, it is held in memory"
+                )
+            if config.getoption("--line-cov-dat-cache"):
+                toffee.warning(
+                    "--line-cov-dat-cache is not used with --line-cov-memory-budget"
+                )
+        if config.getoption("--line-cov-shared"):
+            shared_dir = os.path.join(os.path.dirname(report_name), "line_shared")
+            if not hasattr(config, "workerinput"):
+                shutil.rmtree(shared_dir, ignore_errors=True)
+                config._toffee_shared_line_coverage = shared_dir
+            os.makedirs(shared_dir, exist_ok=True)
+            process_id = (
+                config.workerinput["workerid"]
+                if hasattr(config, "workerinput")
+                else "main"
+            )
+            # Coverage attribution reads the file of each test on the controller
+            keep_dat = config.getoption("--keep-line-cov-dat") or config.getoption(
+                "--cov-attribution"
+            )
+            config.pluginmanager.register(
+                SharedLineCoverage(shared_dir, process_id, keep_dat),
+                "toffee_shared_line_coverage",
+            )
+        elif config.getoption("--line-cov-premerge") and hasattr(config, "workerinput"):
+            config.pluginmanager.register(
+                WorkerLineCoverageMerger(
+                    config, config.getoption("--keep-line-cov-dat")
+                ),
+                "toffee_worker_line_coverage",
+            )
+        config._toffee_worker_coverage = {
+            "func": [],
+            "line": [],
+            "sim": [],
+            "shards": [],
+            "schemas": {},
+        }
+        if config.getoption("--cov-attribution") and not hasattr(config, "workerinput"):
+            config._toffee_attribution = AttributionIndexBuilder()
+            config.pluginmanager.register(
+                config._toffee_attribution, "toffee_attribution"
+            )
+    if config.getoption("--duration-sched") and not hasattr(config, "workerinput"):
+        config._toffee_duration_history = DurationHistory(config)
+        config.pluginmanager.register(
+            config._toffee_duration_history, "toffee_duration_history"
+        )
+    if config.getoption("--cov-minimize") and not hasattr(config, "workerinput"):
+        config.pluginmanager.register(
+            CoverageMinimizer(config.getoption("--cov-minimize")),
+            "toffee_coverage_minimizer",
+        )
+    if config.getoption("--toffee-timing"):
+        enable_stage_timing()
     if config.getoption("--report-dump-json"):
         config.option.toffee_report_dump_json = True
     else:
@@ -145,6 +460,58 @@ def pytest_configure_node(node):
     node.workerinput["toffee_test_start_time"] = node.config._toffee_test_start_time
 
 
+@pytest.hookimpl(tryfirst=True)
+def pytest_sessionfinish(session):
+    # Hand the session coverage buffers of this worker to the controller
+    if hasattr(session.config, "workeroutput"):
+        session.config.workeroutput["toffee_session_coverage"] = {
+            "func": getattr(session, "__coverage_group__", []),
+            "line": getattr(session, "__line_coverage__", []),
+            "sim": getattr(session, "__sim_metrics__", []),
+            "schemas": getattr(session, "__func_schemas__", {}),
+        }
+
+
+@pytest.hookimpl(optionalhook=True)
+def pytest_xdist_make_scheduler(config, log):
+    if not config.getoption("--duration-sched"):
+        return None
+    dist = config.getoption("dist")
+    if dist != "load":
+        toffee.warning(
+            "--duration-sched only schedules --dist load, keeping --dist %s" % dist
+        )
+        return None
+    from .scheduler import DurationScheduling
+
+    return DurationScheduling(config, log, config._toffee_duration_history)
+
+
+@pytest.hookimpl()
+def pytest_unconfigure(config):
+    timer = get_stage_timer()
+    if timer is not None and not hasattr(config, "workerinput"):
+        config.hook.pytest_toffee_timing(config=config, timing=timer.as_dict())
+
+
+@pytest.hookimpl()
+def pytest_testnodedown(node, error):
+    worker_coverage = getattr(node.config, "_toffee_worker_coverage", None)
+    output = getattr(node, "workeroutput", {})
+    if worker_coverage is None:
+        return
+    session_coverage = output.get("toffee_session_coverage", {})
+    worker_coverage["func"].extend(session_coverage.get("func", []))
+    worker_coverage["line"].extend(session_coverage.get("line", []))
+    worker_coverage["sim"].extend(session_coverage.get("sim", []))
+    for digest, schema in session_coverage.get("schemas", {}).items():
+        worker_coverage["schemas"].setdefault(digest, schema)
+    shard = output.get("toffee_line_coverage_shard")
+    if shard:
+        worker_coverage["line"].append(shard)
+        worker_coverage["shards"].append(shard["data"])
+
+
 """
 toffee async test
 """
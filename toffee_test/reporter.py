@@ -1,20 +1,28 @@
 import json
 import os
 import uuid
-from collections import Counter
 from datetime import datetime
 from typing import Union
 import shutil
+import threading
 import time
 
-from filelock import FileLock
 from toffee.funcov import CovGroup, get_func_full_name
 
-from .utils import convert_line_coverage, get_toffee_custom_key_value
+from .utils import convert_line_coverage, get_toffee_custom_key_value, report_passed
+from .utils.verilator_coverage import DatCache
+from .utils.verilator_coverage.point_dict import build_key
+from .utils.verilator_coverage.shared import read_shared_hits
+from .utils.func_coverage import encode_func_coverage, func_coverage_payload_hash, FuncCoverageMerger
+from .utils.report_dump import dump_report_context
+from .timing import get_stage_timer, stage_timer
+from .minimize import func_cover_ids
 
 
-LOCK_FILE_FUNC_COV = "/tmp/toffee_func_cov.lock"
-LOCK_FILE_LINE_COV = "/tmp/toffee_line_cov.lock"
+# Coverage of module scoped requests and the functional coverage schemas are buffered on
+# the session of this process, the buffers of xdist workers are handed to the controller
+# through `workeroutput`.
+__session_coverage_lock__ = threading.Lock()
 
 def get_default_report_name():
     current_time = datetime.now().strftime("%Y%m%d%H%M%S")
@@ -37,14 +45,20 @@ def set_output_report(report_path):
     __output_report_dir__ = report_dir
 
 
-def __update_line_coverage__(line_coverage_list: list[dict]=None, line_grate=99):
+def __update_line_coverage__(line_coverage_list: list[dict]=None, line_grate=99, workers=0, merged_hits=None,
+                             genhtml=False, html_cache=None, html_cache_size=512, dat_cache=None,
+                             dat_cache_size=1024, memory_budget=0):
     if not line_coverage_list:
         return None
     coverage_error = ""
     line_dat_dir = os.path.join(__output_report_dir__, "line_dat")
     try:
+        if dat_cache is not None:
+            dat_cache = DatCache(dat_cache, dat_cache_size * 2 ** 20)
         (hint, total), ignore = convert_line_coverage(
-            line_coverage_list, line_dat_dir
+            line_coverage_list, line_dat_dir, genhtml=genhtml, workers=workers, merged_hits=merged_hits,
+            html_cache=html_cache, html_cache_size=html_cache_size * 2 ** 20, dat_cache=dat_cache,
+            memory_budget=int(memory_budget * 2 ** 20),
         )
     except Exception as e:
         from toffee.logger import error
@@ -61,8 +75,17 @@ def __update_line_coverage__(line_coverage_list: list[dict]=None, line_grate=99)
     }
 
 
-def __update_func_coverage__(__func_coverage__):
-    if __func_coverage__ is None:
+def __merge_func_coverage__(func_coverage, merged=None):
+    """Fold functional coverage payloads into `merged`, a FuncCoverageMerger."""
+    if merged is None:
+        merged = FuncCoverageMerger()
+    for g in func_coverage:
+        merged.add(g)
+    return merged
+
+
+def __update_func_coverage__(__func_coverage__, merged=None, schemas=None):
+    if __func_coverage__ is None and merged is None:
         return None
     coverage = {}
     group_num_hints = 0
@@ -89,66 +112,10 @@ def __update_func_coverage__(__func_coverage__):
                                         |- has_once:  boolean
     """
 
-    def parse_group(g):
-        nonlocal point_num_hints, point_num_total, bin_num_hints, bin_num_total, has_once
-        data = json.loads(g)
-        if data["has_once"]:
-            has_once = True
-        return data
-
-    def merge_dicts(dict1, dict2):
-        """Recursively merge two dictionaries."""
-        result = dict1.copy()  # Start with keys and values of dict1
-        for key, value in dict2.items():
-            if key.startswith("__"):
-                continue
-            if key in result:
-                if isinstance(result[key], dict) and isinstance(value, dict):
-                    result[key] = merge_dicts(result[key], value)
-                elif isinstance(result[key], list) and isinstance(value, list):
-                    if key == "points" or key == "bins":
-                        if key == "bins" and result.get("dynamic_bin", False) == False:
-                            assert Counter([x["name"] for x in value]) == Counter(
-                                x["name"] for x in result[key]
-                            ), f"bins in points {dict1['name']} should be same, merge function coverage: {dict1['name']} failed (when add_watch_point, use dynamic_bin=True to ignore this error)"
-                        old_keys = {a["name"]: i for i, a in enumerate(result[key])}
-                        for data in value:
-                            if data["name"] not in old_keys:
-                                result[key].append(data)
-                            else:
-                                result[key][old_keys[data["name"]]] = merge_dicts(
-                                    result[key][old_keys[data["name"]]], data
-                                )
-                    else: # Normal list merge, use unique items
-                        result[key] = list(set(result[key] + value))
-                elif isinstance(result[key], bool) and isinstance(value, bool):
-                    if key == "has_once":
-                        result[key] = result[key] and value
-                    else:
-                        result[key] = result[key] or value
-                elif isinstance(result[key], int) and isinstance(value, int):
-                    result[key] += value
-                elif result[key] == value:
-                    continue  # Same value, do nothing
-                else:
-                    raise ValueError(
-                        f"Conflict at key '{key}': {result[key]} vs {value}"
-                    )
-            else:
-                result[key] = value
-        return result
-
-    def merge_dicts_list(dicts: list):
-        """Merge a list of dictionaries."""
-        result = {}
-        for d in dicts:
-            if d["name"] in result:
-                result[d["name"]] = merge_dicts(result[d["name"]], d)
-            else:
-                result[d["name"]] = d
-        return [v for _, v in result.items()]
-
-    coverage["groups"] = merge_dicts_list([parse_group(g) for g in __func_coverage__])
+    merged = __merge_func_coverage__(__func_coverage__ or [], merged)
+    merged.add_schemas(schemas or {})
+    groups, has_once = merged.result()
+    coverage["groups"] = list(groups.values())
 
     # Recalculate the groups hinted situation
     for group in coverage["groups"]:
@@ -197,6 +164,41 @@ def __update_func_coverage__(__func_coverage__):
     return coverage
 
 
+def __update_sim_metrics__(sim_metrics: list[dict]):
+    """
+    Aggregate the simulation metrics of the tests into one throughput row per DUT.
+    """
+
+    if not sim_metrics:
+        return None
+    duts = {}
+    for m in sim_metrics:
+        d = duts.setdefault(m["dut"], {
+            "tests": 0,
+            "cycles": 0,
+            "seconds": 0.0,
+            "sample_seconds": 0.0,
+            "slowest_test": None,
+            "slowest_cycles_per_second": None,
+        })
+        d["tests"] += 1
+        d["cycles"] += m["cycles"]
+        d["seconds"] += m["seconds"]
+        d["sample_seconds"] += m["sample_seconds"]
+        # Tests that did not step the clock have no simulation rate
+        if m["cycles"] > 0 and (d["slowest_cycles_per_second"] is None
+                                or m["cycles_per_second"] < d["slowest_cycles_per_second"]):
+            d["slowest_test"] = m["nodeid"]
+            d["slowest_cycles_per_second"] = m["cycles_per_second"]
+    for d in duts.values():
+        d["cycles_per_second"] = d["cycles"] / d["seconds"] if d["seconds"] > 0 else 0.0
+        d["sample_fraction"] = d["sample_seconds"] / d["seconds"] if d["seconds"] > 0 else 0.0
+    return {
+        "tests": sim_metrics,
+        "duts": duts,
+    }
+
+
 __report_info__ = {
     "user": None,
     "title": None,
@@ -223,62 +225,123 @@ def process_context(context, config):
     context["metadata"].update(__report_info__["meta"])
 
     coverage_func_list = []
-    coverage_func_keys = []
+    coverage_func_keys = set()
     coverage_line_list = []
-    coverage_line_keys = []
+    coverage_line_keys = set()
     has_testcase_func_coverage = False
 
-    for t in context["tests"]:
-        test_passed = t.get("status", {}).get("word") == "PASSED"
-        for p in t["phases"]:
-            if hasattr(p["report"], "__coverage_group__"):
-                has_testcase_func_coverage = True
-                for fc_data in p["report"].__coverage_group__:
-                    key = "%s-%s" % (fc_data["hash"], fc_data["id"])
-                    if key in coverage_func_keys:
+    func_merged = None
+    line_hits = None
+    aggregator = getattr(config, "_toffee_coverage_aggregator", None)
+    if aggregator is not None and aggregator.finish():
+        # Coverage of test reports is already merged while the tests were running
+        has_testcase_func_coverage = aggregator.has_func_coverage
+        coverage_func_keys = set(aggregator.func_keys)
+        coverage_line_keys = set(aggregator.line_keys)
+        coverage_line_list = list(aggregator.line_coverage_list)
+        func_merged = aggregator.func_merged
+        line_hits = aggregator.line_hits
+    else:
+        for t in context["tests"]:
+            test_passed = all(report_passed(p["report"]) for p in t["phases"])
+            for p in t["phases"]:
+                if hasattr(p["report"], "__coverage_group__"):
+                    has_testcase_func_coverage = True
+                    for fc_data in p["report"].__coverage_group__:
+                        key = "%s-%s" % (fc_data["hash"], fc_data["id"])
+                        if key in coverage_func_keys:
+                            continue
+                        coverage_func_keys.add(key)
+                        coverage_func_list.append(fc_data["data"])
+                if hasattr(p["report"], "__line_coverage__"):
+                    if not test_passed:
+                        continue
+                    lc_data = p["report"].__line_coverage__
+                    key = "%s-%s" % (lc_data["hash"], lc_data["id"])
+                    if key in coverage_line_keys:
                         continue
-                    coverage_func_keys.append(key)
-                    coverage_func_list.append(fc_data["data"])
-            if hasattr(p["report"], "__line_coverage__"):
-                if not test_passed:
-                    continue
-                lc_data = p["report"].__line_coverage__
-                key = "%s-%s" % (lc_data["hash"], lc_data["id"])
-                if key in coverage_line_keys:
-                    continue
-                coverage_line_keys.append(key)
-                coverage_line_list.append(lc_data)
-    # search data in session
-    if not has_testcase_func_coverage and hasattr(context["session"], "__coverage_group__"):
-        for fc_data in context["session"].__coverage_group__:
+                    coverage_line_keys.add(key)
+                    coverage_line_list.append(lc_data)
+    # search data in session and the session buffers of xdist workers
+    worker_coverage = getattr(config, "_toffee_worker_coverage", {"func": [], "line": [], "sim": [], "shards": [], "schemas": {}})
+    # Functional coverage schemas registered by this process and the xdist workers
+    func_schemas = dict(getattr(context["session"], "__func_schemas__", {}))
+    func_schemas.update(worker_coverage["schemas"])
+    session_func_coverage = list(getattr(context["session"], "__coverage_group__", []))
+    session_func_coverage.extend(worker_coverage["func"])
+    if not has_testcase_func_coverage:
+        for fc_data in session_func_coverage:
             key = "%s-%s" % (fc_data["hash"], fc_data["id"])
             if key in coverage_func_keys:
                 continue
-            coverage_func_keys.append(key)
+            coverage_func_keys.add(key)
             coverage_func_list.append(fc_data["data"])
-    if hasattr(context["session"], "__line_coverage__"):
-        for lc_data in context["session"].__line_coverage__:
-            key = "%s-%s" % (lc_data["hash"], lc_data["id"])
-            if key in coverage_line_keys:
-                continue
-            coverage_line_keys.append(key)
-            coverage_line_list.append(lc_data)
+    # Also the line coverage shards merged on xdist workers, see --line-cov-premerge
+    session_line_coverage = list(getattr(context["session"], "__line_coverage__", []))
+    session_line_coverage.extend(worker_coverage["line"])
+    for lc_data in session_line_coverage:
+        key = "%s-%s" % (lc_data["hash"], lc_data["id"])
+        if key in coverage_line_keys:
+            continue
+        coverage_line_keys.add(key)
+        coverage_line_list.append(lc_data)
+    # Hits summed into shared vectors while the tests were running, see --line-cov-shared
+    shared_dir = getattr(config, "_toffee_shared_line_coverage", None)
+    if shared_dir is not None:
+        with stage_timer("line_coverage_merge"):
+            shared_hits = read_shared_hits(shared_dir)
+        # The vectors are summed up, do not leave them in the report directory
+        shutil.rmtree(shared_dir, ignore_errors=True)
+        if line_hits:
+            shared_hits.update(line_hits)
+        line_hits = shared_hits
+    line_coverage = __update_line_coverage__(coverage_line_list, global_report_info.get("line_grate", 99),
+                                             config.getoption("--line-cov-workers"), line_hits,
+                                             config.getoption("--line-cov-genhtml"),
+                                             config.getoption("--line-cov-cache"),
+                                             config.getoption("--line-cov-cache-size"),
+                                             config.getoption("--line-cov-dat-cache"),
+                                             config.getoption("--line-cov-dat-cache-size"),
+                                             config.getoption("--line-cov-memory-budget"))
+    # The shards merged on the workers are read, do not leave them in the report directory
+    for shard in worker_coverage["shards"]:
+        try:
+            os.remove(shard)
+        except OSError:
+            pass
+    with stage_timer("func_coverage_merge"):
+        func_coverage = __update_func_coverage__(coverage_func_list, func_merged, func_schemas)
     context["coverages"] = {
-        "line": __update_line_coverage__(coverage_line_list, global_report_info.get("line_grate", 99)),
-        "functional": __update_func_coverage__(coverage_func_list),
+        "line": line_coverage,
+        "functional": func_coverage,
     }
+    sim_metrics = []
+    for t in context["tests"]:
+        for p in t["phases"]:
+            sim_metrics.extend(getattr(p["report"], "__sim_metrics__", []))
+    sim_metrics.extend(getattr(context["session"], "__sim_metrics__", []))
+    sim_metrics.extend(worker_coverage["sim"])
+    context["sim_metrics"] = __update_sim_metrics__(sim_metrics)
+    attribution = getattr(config, "_toffee_attribution", None)
+    if attribution is not None:
+        with stage_timer("attribution_index"):
+            index = attribution.finish(func_schemas)
+            index.save(os.path.join(__output_report_dir__, "coverage_attribution.json.gz"))
+        context["attribution"] = index.summary()
     test_abstract_info = {
         get_func_full_name(t["item"].function):t["status"]["word"] for t in context["tests"]
     }
     context["test_abstract_info"] = test_abstract_info
+    timer = get_stage_timer()
+    if timer is not None:
+        context["timing"] = timer.as_dict()
+        for stage, seconds in sorted(context["timing"]["totals"].items()):
+            context["metadata"]["Toffee time (%s)" % stage] = "%.3fs" % seconds
     if config.option.toffee_report_dump_json:
-        def default(o):
-            try:
-                return str(o)
-            except:
-                return None
-        with open(os.path.join(__output_report_dir__, "toffee_report.json"), "w") as f:
-            json.dump(context, f, indent=4, default=default)
+        dump_report_context(context, __output_report_dir__,
+                            fmt=config.getoption("--report-dump-format"),
+                            compact=config.getoption("--report-dump-compact"),
+                            compress=config.getoption("--report-dump-gzip"))
 
 
 def set_func_coverage(request, g):
@@ -288,28 +351,38 @@ def set_func_coverage(request, g):
         assert isinstance(
             i, CovGroup
         ), "g should be an instance of CovGroup or list of CovGroup"
-    request.node.__coverage_group__ = [str(x) for x in g]
+    groups = [x.as_dict() for x in g]
+    with __session_coverage_lock__:
+        session = request.session
+        if not hasattr(session, "__func_schemas__"):
+            session.__func_schemas__ = {}
+        request.node.__coverage_group__ = [encode_func_coverage(x, session.__func_schemas__) for x in groups]
+    if request.scope != 'module' and request.config.getoption("--cov-minimize"):
+        request.node.__func_cover_ids__ = func_cover_ids(groups)
     if request.scope == 'module':
-        with FileLock(LOCK_FILE_FUNC_COV):
+        with __session_coverage_lock__:
             session = request.session
             if not hasattr(session, "__coverage_group__"):
                 session.__coverage_group__ = []
             session.__coverage_group__.extend([{
-                "hash": "%s" % hash(g),
+                "hash": func_coverage_payload_hash(g),
                 "id": "H%s-P%s" % (uuid.getnode(), os.getpid()),
                 "data": g,
             } for g in request.node.__coverage_group__])
 
 
-def set_line_coverage(request, datfile, ignore: Union[list[str], str] = None):
+def set_line_coverage(request, datfile, ignore: Union[list[str], str] = None, build: str = None):
     assert isinstance(datfile, str), "datfile should be a string"
     if ignore is None:
         ignore = []
     elif isinstance(ignore, str):
         ignore = [ignore]
-    request.node.__line_coverage__ = json.dumps({"datfile":datfile, "ignore": ignore})
+    if build is not None:
+        # The build id names point dictionaries and shared vectors, keep it to a fixed size
+        build = build_key(str(build))
+    request.node.__line_coverage__ = json.dumps({"datfile":datfile, "ignore": ignore, "build": build})
     if request.scope == 'module':
-        with FileLock(LOCK_FILE_LINE_COV):
+        with __session_coverage_lock__:
             session = request.session
             if not hasattr(session, "__line_coverage__"):
                 session.__line_coverage__ = []
@@ -318,9 +391,24 @@ def set_line_coverage(request, datfile, ignore: Union[list[str], str] = None):
                 "id": "H%s-P%s" % (uuid.getnode(), os.getpid()),
                 "data": datfile,
                 "ignore": ignore,
+                "build": build,
             })
 
 
+def set_sim_metrics(request, metrics: dict):
+    metrics = {**metrics, "nodeid": request.node.nodeid}
+    if request.scope == 'module':
+        with __session_coverage_lock__:
+            session = request.session
+            if not hasattr(session, "__sim_metrics__"):
+                session.__sim_metrics__ = []
+            session.__sim_metrics__.append(metrics)
+        return
+    if not hasattr(request.node, "__sim_metrics__"):
+        request.node.__sim_metrics__ = []
+    request.node.__sim_metrics__.append(metrics)
+
+
 def process_func_coverage(item, call, report):
     if call.when != "teardown":
         return
@@ -328,16 +416,18 @@ def process_func_coverage(item, call, report):
         groups = []
         for g in item.__coverage_group__:
             assert isinstance(
-                g, str
-            ), "item.__coverage_group__ should be an instance of CovGroup"
+                g, (str, dict)
+            ), "item.__coverage_group__ should be an encoded CovGroup"
             groups.append(
                 {
-                    "hash": "%s" % hash(g),
+                    "hash": func_coverage_payload_hash(g),
                     "id": "H%s-P%s" % (uuid.getnode(), os.getpid()),
                     "data": g,
                 }
             )
         report.__coverage_group__ = groups
+    if hasattr(item, "__sim_metrics__"):
+        report.__sim_metrics__ = item.__sim_metrics__
     if hasattr(item, "__line_coverage__"):
         assert isinstance(
             item.__line_coverage__, str
@@ -350,6 +440,7 @@ def process_func_coverage(item, call, report):
             "id": "H%s-P%s" % (uuid.getnode(), os.getpid()),
             "data": datfile,
             "ignore": ignore,
+            "build": line_data.get("build"),
         }
     return report
 
@@ -1,9 +1,56 @@
 import os
+import time
 from collections.abc import Iterable
 from zlib import crc32
 
 from .reporter import set_func_coverage
 from .reporter import set_line_coverage
+from .reporter import set_sim_metrics
+from .timing import get_stage_timer
+from .timing import stage_timer
+from .utils.verilator_coverage.point_dict import dut_build_id
+
+
+class CovSampler:
+    """
+    Sample the coverage groups of a DUT from a single rising edge callback.
+
+    Each group has its own schedule: it is sampled every `every` cycles, and only while
+    `enable()` returns True if a predicate is given. With `timed=True`, `callback` also sums
+    up the time spent in sampling in `seconds`, otherwise it is the sampler itself.
+    """
+
+    def __init__(self, timed=False):
+        self.cycle = 0
+        self.seconds = 0.0
+        self.groups = []
+        self.scheduled = []
+        self.callback = self.timed_call if timed else self
+
+    def add(self, group, every=1, enable=None):
+        if every == 1 and enable is None:
+            self.groups.append(group)
+        else:
+            self.scheduled.append((group, every, enable))
+
+    def clear(self):
+        self.groups.clear()
+        self.scheduled.clear()
+
+    def __call__(self, _):
+        self.cycle += 1
+        for g in self.groups:
+            g.sample()
+        if self.scheduled:
+            cycle = self.cycle
+            for g, every, enable in self.scheduled:
+                if cycle % every == 0 and (enable is None or enable()):
+                    g.sample()
+
+    def timed_call(self, _):
+        start = time.perf_counter()
+        self(_)
+        self.seconds += time.perf_counter() - start
 
 
 class ToffeeRequest:
@@ -13,12 +60,16 @@ class ToffeeRequest:
         self.args = None
         self.request = request
         self.cov_groups = []
+        self.cov_sampler = None
         self.ignores = None
+        self.__pending_samples = []
+        self.__sim_start = None
+        self.__dut_cls = None
 
         self.waveform_filename = None
         self.coverage_filename = None
 
-    def __add_cov_sample(self, cov_groups):
+    def __add_cov_sample(self, cov_groups, every=1, enable=None):
         """
         Add the coverage sample to the DUT.
         """
@@ -29,11 +80,42 @@ class ToffeeRequest:
         if not isinstance(cov_groups, list):
             cov_groups = [cov_groups]
 
-        def sample_helper(cov_point):
-            return lambda _: cov_point.sample()
+        # All groups are sampled by one callback per DUT
+        if self.cov_sampler is None:
+            self.cov_sampler = CovSampler(timed=get_stage_timer() is not None)
+            self.dut.xclock.StepRis(self.cov_sampler.callback)
 
         for g in cov_groups:
-            self.dut.xclock.StepRis(sample_helper(g))
+            self.cov_sampler.add(g, every, enable)
+
+    def __clock_cycles(self) -> int:
+        """
+        Number of cycles simulated by the DUT clock so far.
+        """
+
+        clk = getattr(getattr(self.dut, "xclock", None), "clk", None)
+        if clk is not None:
+            return int(clk)
+        return self.cov_sampler.cycle if self.cov_sampler is not None else 0
+
+    def __sim_metrics(self) -> dict:
+        """
+        Simulated cycles, simulation time and sampling time since the DUT was created, the
+        sampling time is only measured with --toffee-timing.
+        """
+
+        dut_name, start_time, start_cycles = self.__sim_start
+        seconds = time.perf_counter() - start_time
+        cycles = self.__clock_cycles() - start_cycles
+        sample_seconds = self.cov_sampler.seconds if self.cov_sampler is not None else 0.0
+        return {
+            "dut": dut_name,
+            "cycles": cycles,
+            "seconds": seconds,
+            "sample_seconds": sample_seconds,
+            "cycles_per_second": cycles / seconds if seconds > 0 else 0.0,
+            "sample_fraction": sample_seconds / seconds if seconds > 0 else 0.0,
+        }
 
     def __need_report(self) -> bool:
         """
@@ -97,7 +179,10 @@ class ToffeeRequest:
         dut_extra_kwargs["coverage_filename"] = ""
 
         # Create DUT
-        self.dut = dut_cls(*dut_extra_args, **dut_extra_kwargs)
+        with stage_timer("create_dut"):
+            self.dut = dut_cls(*dut_extra_args, **dut_extra_kwargs)
+        self.__sim_start = (dut_cls.__name__, time.perf_counter(), self.__clock_cycles())
+        self.__dut_cls = dut_cls
 
         # Set clock name
         if clock_name:
@@ -126,8 +211,10 @@ class ToffeeRequest:
                 self.coverage_filename = "/".join((report_dir, default_name))
 
         # Also export functional coverage
-        if not self.__no_func() and self.cov_groups:
-            self.__add_cov_sample(self.cov_groups)
+        if not self.__no_func():
+            for cov_groups, every, enable in self.__pending_samples:
+                self.__add_cov_sample(cov_groups, every, enable)
+        self.__pending_samples.clear()
 
         # Set waveform name
         if wave_format:
@@ -147,21 +234,31 @@ class ToffeeRequest:
 
         return self.dut
 
-    def add_cov_groups(self, cov_groups, periodic_sample=True):
+    def add_cov_groups(self, cov_groups, periodic_sample=True, sample_enable=None):
         """
         Add the coverage groups to the list.
 
         Args:
             cov_groups: The coverage groups to be added.
-            periodic_sample: Whether to sample the coverage periodically.
+            periodic_sample: Whether to sample the coverage periodically. True samples on every rising
+                edge of the clock, an integer N samples every N cycles.
+            sample_enable: Optional predicate without arguments, the groups are only sampled while it
+                returns True.
         """
 
         if not isinstance(cov_groups, list):
             cov_groups = [cov_groups]
         self.cov_groups.extend(cov_groups)
 
-        if self.dut is not None and not self.__no_func() and periodic_sample:
-            self.__add_cov_sample(cov_groups)
+        if not periodic_sample:
+            return
+        every = 1 if periodic_sample is True else int(periodic_sample)
+        assert every > 0, "periodic_sample should be a bool or a positive number of cycles"
+
+        if self.dut is None:
+            self.__pending_samples.append((cov_groups, every, sample_enable))
+        elif not self.__no_func():
+            self.__add_cov_sample(cov_groups, every, sample_enable)
 
     def finish(self, request):
         """
@@ -169,20 +266,28 @@ class ToffeeRequest:
         """
 
         if self.dut is not None:
-            self.dut.Finish()
+            if self.__need_report() and self.__sim_start is not None:
+                set_sim_metrics(request, self.__sim_metrics())
+
+            # Waveform and coverage files are written when the DUT finishes
+            with stage_timer("dut_finish"):
+                self.dut.Finish()
 
             use_code_cov: bool = self.dut.GetCovMetrics() != 0
 
             if self.__need_report():
                 if not self.__no_func():
-                    set_func_coverage(request, self.cov_groups)
+                    with stage_timer("func_coverage_serialize"):
+                        set_func_coverage(request, self.cov_groups)
                 if use_code_cov:
-                    set_line_coverage(request, self.coverage_filename, self.ignores)
+                    set_line_coverage(request, self.coverage_filename, self.ignores, dut_build_id(self.__dut_cls))
 
         for g in self.cov_groups:
             g.clear()
 
         self.cov_groups.clear()
+        if self.cov_sampler is not None:
+            self.cov_sampler.clear()
 
 
 PreRequest = ToffeeRequest
@@ -0,0 +1,130 @@
+import heapq
+import time
+from collections import defaultdict
+
+from xdist.scheduler import LoadScheduling
+
+
+def lpt_makespan(durations: list[float], workers: int) -> float:
+    """
+    Makespan of handing out `durations` longest first, each to the least loaded worker.
+    """
+    if workers <= 0 or not durations:
+        return 0.0
+    loads = [0.0] * workers
+    for d in sorted(durations, reverse=True):
+        heapq.heapreplace(loads, loads[0] + d)
+    return max(loads)
+
+
+class DurationHistory:
+    """
+    Keep the duration of every test (setup, call and teardown) in the pytest cache.
+
+    Durations are smoothed over the runs, so that one slow run does not reorder the schedule.
+    Tests without history are estimated with the median of the known durations.
+    """
+
+    CACHE_KEY = "toffee/durations"
+    SMOOTHING = 0.5
+
+    def __init__(self, config):
+        self.config = config
+        self.durations: dict[str, float] = None
+        self.default_estimate = 1.0
+        self.current: dict[str, float] = defaultdict(float)
+        self.worker_busy: dict[str, float] = defaultdict(float)
+        self.predicted_makespan = None
+        self.schedule_start = None
+
+    def load(self):
+        # The cache is only set up by the cacheprovider plugin in its own pytest_configure
+        if self.durations is not None:
+            return
+        self.durations = {}
+        if getattr(self.config, "cache", None) is not None:
+            self.durations = dict(self.config.cache.get(self.CACHE_KEY, {}))
+        known = sorted(self.durations.values())
+        self.default_estimate = known[len(known) // 2] if known else 1.0
+
+    def estimate(self, nodeid: str) -> float:
+        self.load()
+        return self.durations.get(nodeid, self.default_estimate)
+
+    def pytest_runtest_logreport(self, report):
+        self.current[report.nodeid] += report.duration
+        node = getattr(report, "node", None)
+        if node is not None:
+            self.worker_busy[node.gateway.id] += report.duration
+
+    def pytest_sessionfinish(self, session):
+        if getattr(self.config, "cache", None) is None or not self.current:
+            return
+        self.load()
+        for nodeid, d in self.current.items():
+            old = self.durations.get(nodeid)
+            self.durations[nodeid] = (
+                d if old is None else old + (d - old) * self.SMOOTHING
+            )
+        self.config.cache.set(self.CACHE_KEY, self.durations)
+
+    def pytest_terminal_summary(self, terminalreporter):
+        if self.predicted_makespan is None:
+            return
+        actual = max(self.worker_busy.values(), default=0.0)
+        wall = time.time() - self.schedule_start
+        terminalreporter.write_line(
+            "toffee duration scheduling: predicted makespan %.2fs, "
+            "actual %.2fs (busiest worker), wall %.2fs"
+            % (self.predicted_makespan, actual, wall)
+        )
+
+
+class DurationScheduling(LoadScheduling):
+    """
+    Hand out the longest tests first, one at a time, to the first worker that becomes free.
+
+    Durations come from the `DurationHistory` of previous runs. Each worker is kept at two
+    pending tests (a worker only starts a test once it knows the next one), so the load is
+    balanced by the actual run times while the order follows the estimates.
+    """
+
+    def __init__(self, config, log=None, history: DurationHistory = None):
+        super().__init__(config, log)
+        self.history = history or DurationHistory(config)
+
+    def check_schedule(self, node, duration: float = 0) -> None:
+        if node.shutting_down:
+            return
+        if self.pending:
+            node_pending = self.node2pending[node]
+            if len(node_pending) < 2:
+                self._send_tests(node, 2 - len(node_pending))
+        else:
+            node.shutdown()
+
+    def schedule(self) -> None:
+        assert self.collection_is_completed
+        if self.collection is not None:
+            for node in self.nodes:
+                self.check_schedule(node)
+            return
+        if not self._check_nodes_have_same_collection():
+            self.log("**Different tests collected, aborting run**")
+            return
+        self.collection = next(iter(self.node2collection.values()))
+        estimates = [self.history.estimate(nodeid) for nodeid in self.collection]
+        self.pending[:] = sorted(
+            range(len(self.collection)), key=lambda i: -estimates[i]
+        )
+        self.history.predicted_makespan = lpt_makespan(estimates, len(self.nodes))
+        self.history.schedule_start = time.time()
+        if not self.collection:
+            return
+        # Deal the longest tests one per worker and round, so that no worker holds two of them
+        for _ in range(2):
+            for node in self.nodes:
+                self._send_tests(node, 1)
+        if not self.pending:
+            for node in self.nodes:
+                node.shutdown()
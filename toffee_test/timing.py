@@ -0,0 +1,85 @@
+"""
+Opt-in timing of the plugin's own overhead, enabled with --toffee-timing.
+
+Stages that run while a test is running (fixture setup and teardown included) are booked
+on that test, the times of a test travel to the controller on its teardown report. Other
+stages, like the coverage merge at the end of the session, are booked on the session.
+"""
+
+__all__ = [
+    "StageTimer",
+    "enable_stage_timing",
+    "get_stage_timer",
+    "stage_timer",
+]
+
+import time
+from contextlib import contextmanager
+
+
+class StageTimer:
+    def __init__(self):
+        self.tests: dict[str, dict[str, float]] = {}
+        self.session: dict[str, float] = {}
+        self.current = None
+        self._pending: dict[str, float] = {}
+
+    def add(self, stage: str, seconds: float):
+        book = self.session if self.current is None else self._pending
+        book[stage] = book.get(stage, 0.0) + seconds
+
+    def start_test(self, nodeid: str):
+        self.current = nodeid
+        self._pending = {}
+
+    def finish_test(self) -> dict[str, float]:
+        """Return the stage times of the running test, they are booked by `add_test`."""
+        pending, self._pending = self._pending, {}
+        self.current = None
+        return pending
+
+    def add_test(self, nodeid: str, stages: dict[str, float]):
+        book = self.tests.setdefault(nodeid, {})
+        for stage, seconds in stages.items():
+            book[stage] = book.get(stage, 0.0) + seconds
+
+    def totals(self) -> dict[str, float]:
+        totals = dict(self.session)
+        for stages in self.tests.values():
+            for stage, seconds in stages.items():
+                totals[stage] = totals.get(stage, 0.0) + seconds
+        return totals
+
+    def as_dict(self) -> dict:
+        return {
+            "totals": self.totals(),
+            "session": dict(self.session),
+            "tests": {nodeid: dict(stages) for nodeid, stages in self.tests.items()},
+        }
+
+
+__stage_timer__: StageTimer = None
+
+
+def enable_stage_timing() -> StageTimer:
+    global __stage_timer__
+    __stage_timer__ = StageTimer()
+    return __stage_timer__
+
+
+def get_stage_timer() -> StageTimer:
+    return __stage_timer__
+
+
+@contextmanager
+def stage_timer(stage: str):
+    """Time the enclosed block as `stage`, does nothing unless timing is enabled."""
+    timer = __stage_timer__
+    if timer is None:
+        yield
+        return
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        timer.add(stage, time.perf_counter() - start)
@@ -20,6 +20,13 @@ def exe_cmd(cmd):
     return success, stdout, stderr
 
 
+def report_passed(report) -> bool:
+    """
+    Whether a test report counts as passed for coverage, xfailed and xpassed tests do not.
+    """
+    return report.outcome == "passed" and not hasattr(report, "wasxfail")
+
+
 def parse_lines(text: str):
     pattern = r"lines\.+: \d+\.\d+% \((\d+) of (\d+) lines\)\n"
     match = re.search(pattern, text)
@@ -28,10 +35,18 @@ def parse_lines(text: str):
     return -1, -1
 
 
-def convert_line_coverage(line_coverage_list: list[dict], output_dir):
-    from .verilator_coverage import convert_verilator_coverage
-    merged_info ,final_ignore_info = convert_verilator_coverage(line_coverage_list, output_dir)
-    su, so, se = exe_cmd(["genhtml", "--branch-coverage", merged_info, "-o", output_dir])
+def convert_line_coverage(line_coverage_list: list[dict], output_dir, genhtml=False,
+                          html_cache=None, html_cache_size=512 * 2 ** 20, **kwargs):
+    from .verilator_coverage import convert_verilator_coverage, convert_verilator_coverage_html
+    from ..timing import stage_timer
+    if not genhtml:
+        # Render the html pages in process, lcov is not needed
+        return convert_verilator_coverage_html(line_coverage_list, output_dir, html_cache=html_cache,
+                                               html_cache_size=html_cache_size, **kwargs)
+    with stage_timer("line_coverage_merge"):
+        merged_info ,final_ignore_info = convert_verilator_coverage(line_coverage_list, output_dir, **kwargs)
+    with stage_timer("genhtml"):
+        su, so, se = exe_cmd(["genhtml", "--branch-coverage", merged_info, "-o", output_dir])
     if not su:
         import warnings
         #warnings.warn(f"Failed to convert line coverage: {se}")
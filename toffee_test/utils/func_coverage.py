@@ -0,0 +1,253 @@
+"""
+Compact transport of functional coverage.
+
+A CovGroup is split into a schema, its structure with every integer and boolean zeroed,
+and two vectors holding the integers (bin hints, counters) and booleans in a fixed order.
+Metadata keys (`__filename__`, `__sample_count__`, ...) are kept in the schema as they are,
+they are not part of its digest: like `merge_dicts`, a merged group keeps the metadata of
+the first payload of its schema. A payload only carries the digest of its schema, each
+schema is registered once per process in a `{digest: schema}` map which is handed to the
+consumer with the coverage buffers of the session. Merging the same group is an
+element-wise vector addition, the schema is only needed to build the merged group.
+"""
+
+__all__ = [
+    "FuncCoverageMerger",
+    "encode_func_coverage",
+    "decode_func_coverage",
+    "func_coverage_payload_hash",
+    "merge_dicts",
+]
+
+import base64
+import copy
+import hashlib
+import json
+from array import array
+from collections import Counter
+
+
+def merge_dicts(dict1, dict2):
+    """Recursively merge two dictionaries."""
+    result = dict1.copy()  # Start with keys and values of dict1
+    for key, value in dict2.items():
+        if key.startswith("__"):
+            continue
+        if key in result:
+            if isinstance(result[key], dict) and isinstance(value, dict):
+                result[key] = merge_dicts(result[key], value)
+            elif isinstance(result[key], list) and isinstance(value, list):
+                if key == "points" or key == "bins":
+                    if key == "bins" and result.get("dynamic_bin", False) == False:
+                        assert Counter([x["name"] for x in value]) == Counter(
+                            x["name"] for x in result[key]
+                        ), f"bins in points {dict1['name']} should be same, merge function coverage: {dict1['name']} failed (when add_watch_point, use dynamic_bin=True to ignore this error)"
+                    old_keys = {a["name"]: i for i, a in enumerate(result[key])}
+                    for data in value:
+                        if data["name"] not in old_keys:
+                            result[key].append(data)
+                        else:
+                            result[key][old_keys[data["name"]]] = merge_dicts(
+                                result[key][old_keys[data["name"]]], data
+                            )
+                else:  # Normal list merge, use unique items
+                    result[key] = list(set(result[key] + value))
+            elif isinstance(result[key], bool) and isinstance(value, bool):
+                if key == "has_once":
+                    result[key] = result[key] and value
+                else:
+                    result[key] = result[key] or value
+            elif isinstance(result[key], int) and isinstance(value, int):
+                result[key] += value
+            elif result[key] == value:
+                continue  # Same value, do nothing
+            else:
+                raise ValueError(f"Conflict at key '{key}': {result[key]} vs {value}")
+        else:
+            result[key] = value
+    return result
+
+
+def _split(obj, ints: list, bools: list, key=None):
+    # Return the schema of obj, collect its integers and booleans in traversal order
+    if isinstance(obj, bool):
+        bools.append((obj, key == "has_once"))
+        return False
+    if isinstance(obj, int):
+        ints.append(obj)
+        return 0
+    if isinstance(obj, dict):
+        return {
+            k: obj[k] if k.startswith("__") else _split(obj[k], ints, bools, k)
+            for k in sorted(obj)
+        }
+    if isinstance(obj, list):
+        if key in ("points", "bins"):
+            return [_split(x, ints, bools, key) for x in obj]
+        # Other lists are merged as sets of items, keep them in the schema
+        return list(obj)
+    return obj
+
+
+def _fill(schema, ints, bools, key=None):
+    # Inverse of _split, `ints` and `bools` are iterators
+    if isinstance(schema, bool):
+        return next(bools)
+    if isinstance(schema, int):
+        return next(ints)
+    if isinstance(schema, dict):
+        return {
+            k: v if k.startswith("__") else _fill(v, ints, bools, k)
+            for k, v in schema.items()
+        }
+    if isinstance(schema, list):
+        if key in ("points", "bins"):
+            return [_fill(x, ints, bools, key) for x in schema]
+        return list(schema)
+    return schema
+
+
+def _layout(schema):
+    # The schema without its metadata keys, which are not merged
+    if isinstance(schema, dict):
+        return {k: _layout(v) for k, v in schema.items() if not k.startswith("__")}
+    if isinstance(schema, list):
+        return [_layout(x) for x in schema]
+    return schema
+
+
+def encode_func_coverage(data: dict, schemas: dict) -> dict:
+    """
+    Encode the dict of a CovGroup into a transport payload.
+
+    The schema of the group is registered in `schemas`, which maps schema digests to
+    schemas, the payload only holds its digest.
+    """
+
+    ints, bools = [], []
+    schema = _split(data, ints, bools)
+    digest = hashlib.sha1(
+        json.dumps(_layout(schema), sort_keys=True).encode("utf-8")
+    ).hexdigest()
+    schemas.setdefault(digest, schema)
+    payload = {
+        "name": data["name"],
+        "schema": digest,
+        "ints": base64.b64encode(array("q", ints).tobytes()).decode("ascii"),
+        "bools": "".join("1" if b else "0" for b, _ in bools),
+        "has_once": data["has_once"],
+    }
+    payload["digest"] = hashlib.sha1(
+        "|".join((digest, payload["ints"], payload["bools"])).encode("ascii")
+    ).hexdigest()
+    return payload
+
+
+def decode_func_coverage(g, schemas: dict):
+    """
+    Return the CovGroup dict of one payload, None if its schema is not in `schemas`.
+
+    `schemas` maps schema digests to schemas, it is updated with the schema carried by the
+    payloads of older versions.
+    """
+    if isinstance(g, str):
+        return json.loads(g)
+    if "group" in g:
+        schemas.setdefault(g["schema"], g["group"])
+    schema = schemas.get(g["schema"])
+    if schema is None:
+        return None
+    ints = array("q")
+    ints.frombytes(base64.b64decode(g["ints"]))
+    return _fill(schema, iter(ints), iter(c == "1" for c in g["bools"]))
+
+
+def func_coverage_payload_hash(g) -> str:
+    """Content digest of a payload, computed once when it is encoded."""
+    if isinstance(g, str):
+        return hashlib.sha1(g.encode("utf-8")).hexdigest()
+    return g["digest"]
+
+
+class FuncCoverageMerger:
+    """
+    Merge functional coverage payloads, both transport payloads and legacy CovGroup json strings.
+
+    The vectors of a schema are merged without the schema, both the OR and the AND of the
+    booleans are kept and picked once the schemas are known, see `add_schemas`.
+    """
+
+    def __init__(self):
+        self.schemas = {}
+        self.names = {}
+        self.ints = {}
+        self.any = {}
+        self.all = {}
+        self.groups = {}
+        self.has_once = False
+
+    def add_schemas(self, schemas: dict):
+        for digest, schema in schemas.items():
+            self.schemas.setdefault(digest, schema)
+
+    def add(self, g):
+        if isinstance(g, str):
+            data = json.loads(g)
+            if data["has_once"]:
+                self.has_once = True
+            if data["name"] in self.groups:
+                self.groups[data["name"]] = merge_dicts(self.groups[data["name"]], data)
+            else:
+                self.groups[data["name"]] = data
+            return
+        digest = g["schema"]
+        if "group" in g:
+            self.schemas.setdefault(digest, g["group"])
+        ints = array("q")
+        ints.frombytes(base64.b64decode(g["ints"]))
+        bools = [c == "1" for c in g["bools"]]
+        if digest not in self.ints:
+            self.names[digest] = g["name"]
+            self.ints[digest] = ints
+            self.any[digest] = bools
+            self.all[digest] = list(bools)
+        else:
+            self.ints[digest] = array("q", map(sum, zip(self.ints[digest], ints)))
+            self.any[digest] = [a or b for a, b in zip(self.any[digest], bools)]
+            self.all[digest] = [a and b for a, b in zip(self.all[digest], bools)]
+        if g["has_once"]:
+            self.has_once = True
+
+    def result(self) -> tuple[dict, bool]:
+        """
+        Return the merged groups by name and whether any group has `has_once` set.
+        """
+
+        groups = copy.deepcopy(self.groups)
+        missing = set()
+        for digest, ints in self.ints.items():
+            schema = self.schemas.get(digest)
+            if schema is None:
+                missing.add(self.names[digest])
+                continue
+            and_mask = []
+            _split(schema, [], and_mask)
+            bools = [
+                al if is_and else an
+                for an, al, (_, is_and) in zip(
+                    self.any[digest], self.all[digest], and_mask
+                )
+            ]
+            data = _fill(schema, iter(ints), iter(bools))
+            if data["name"] in groups:
+                groups[data["name"]] = merge_dicts(groups[data["name"]], data)
+            else:
+                groups[data["name"]] = data
+        if missing:
+            import warnings
+
+            warnings.warn(
+                "Functional coverage schema of groups %s is missing, skip them"
+                % ", ".join(sorted(missing))
+            )
+        return groups, self.has_once
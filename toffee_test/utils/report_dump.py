@@ -0,0 +1,132 @@
+"""
+Streaming dump of the report context.
+
+The context handed over by pytest-reporter holds pytest objects (config, session, items,
+reports and call infos) next to plain data. Only the plain data is written: items are
+replaced by their node id, reports by a small summary, any other object is dropped.
+Tests are serialized and written one by one, so the whole document is never built in
+memory, and the coverage sections are written to their own sidecar files.
+"""
+
+__all__ = [
+    "dump_report_context",
+]
+
+import gzip
+import json
+import os
+
+_SKIP = object()
+
+_FORMATS = ("json", "ndjson")
+
+
+def _report_summary(report) -> dict:
+    summary = {
+        "nodeid": report.nodeid,
+        "when": getattr(report, "when", None),
+        "outcome": report.outcome,
+        "duration": getattr(report, "duration", None),
+        "location": _to_json(getattr(report, "location", None)),
+    }
+    if report.outcome != "passed":
+        summary["longrepr"] = getattr(report, "longreprtext", "")
+    if hasattr(report, "wasxfail"):
+        summary["wasxfail"] = report.wasxfail
+    sections = getattr(report, "sections", None)
+    if sections:
+        summary["sections"] = [[title, content] for title, content in sections]
+    return summary
+
+
+def _to_json(o):
+    """Return a JSON serializable copy of `o`, `_SKIP` if it has no serializable form."""
+    if o is None or isinstance(o, (str, bool, int, float)):
+        return o
+    if isinstance(o, dict):
+        ret = {}
+        for k, v in o.items():
+            v = _to_json(v)
+            if v is not _SKIP:
+                ret[str(k)] = v
+        return ret
+    if isinstance(o, (list, tuple, set, frozenset)):
+        return [v for v in map(_to_json, o) if v is not _SKIP]
+    if hasattr(o, "nodeid"):
+        # Test reports carry an outcome, items and collectors are referenced by node id
+        if hasattr(o, "outcome"):
+            return _report_summary(o)
+        return o.nodeid
+    return _SKIP
+
+
+def _open(path: str, compress: bool):
+    if compress:
+        return gzip.open(path + ".gz", "wt", encoding="utf-8", compresslevel=6)
+    return open(path, "w", encoding="utf-8")
+
+
+def _dumps(o, compact: bool) -> str:
+    if compact:
+        return json.dumps(o, separators=(",", ":"))
+    return json.dumps(o, indent=4)
+
+
+def dump_report_context(
+    context: dict,
+    output_dir: str,
+    fmt: str = "json",
+    compact: bool = False,
+    compress: bool = False,
+) -> str:
+    """
+    Dump `context` to `toffee_report.json` (`fmt="json"`) or `toffee_report.ndjson` (`fmt="ndjson"`)
+    in `output_dir`, `compress` gzips every written file. Return the path of the main file.
+
+    In the NDJSON format the first line holds the session level data and every further
+    line one test. Each entry of `context["coverages"]` is written to `coverage_<name>.json`
+    and replaced by the name of that file in the main document.
+    """
+    assert (
+        fmt in _FORMATS
+    ), f"Unknown report dump format: {fmt}, should be one of {_FORMATS}"
+    suffix = ".gz" if compress else ""
+
+    coverages = {}
+    for name, data in (context.get("coverages") or {}).items():
+        filename = f"coverage_{name}.json"
+        with _open(os.path.join(output_dir, filename), compress) as f:
+            f.write(_dumps(_to_json(data), compact))
+        coverages[name] = filename + suffix
+
+    header = {}
+    for k, v in context.items():
+        if k in ("tests", "coverages"):
+            continue
+        v = _to_json(v)
+        if v is not _SKIP:
+            header[k] = v
+    header["coverages"] = coverages
+
+    path = os.path.join(output_dir, f"toffee_report.{fmt}")
+    tests = context.get("tests", [])
+    with _open(path, compress) as f:
+        if fmt == "ndjson":
+            f.write(json.dumps({"type": "session", **header}, separators=(",", ":")))
+            f.write("\n")
+            for t in tests:
+                f.write(
+                    json.dumps({"type": "test", **_to_json(t)}, separators=(",", ":"))
+                )
+                f.write("\n")
+        else:
+            header = _dumps(header, compact)
+            # Splice the tests into the header object, one test at a time
+            f.write(header[:-1].rstrip())
+            f.write(',"tests":[' if compact else ',\n    "tests": [\n')
+            for i, t in enumerate(tests):
+                if i:
+                    f.write("," if compact else ",\n")
+                f.write(_dumps(_to_json(t), compact))
+            f.write("]}" if compact else "\n    ]\n}\n")
+    return path + suffix
@@ -1,33 +1,121 @@
-__all__ = ["convert_verilator_coverage"]
+__all__ = ["convert_verilator_coverage", "convert_verilator_coverage_html", "DatCache"]
 
 import os
 import subprocess
 from pathlib import Path
+from typing import Union
 
-from .models import VerilatorCoverage
+from .dat_cache import DatCache
+from .external import SpilledCoverage, external_merge_coverage
+from .html import render_coverage_html
+from .lcov import write_lcov_info
+from .models import CoverageTable, VerilatorCoverage
 
 
-def convert_verilator_coverage(line_coverage_list: list[dict], output_dir) -> tuple[str, list[tuple]]:
+def _convert_verilator_coverage(
+        line_coverage_list: list[dict],
+        output_dir,
+        native_lcov: bool = True,
+        workers: int = 0,
+        merged_hits=None,
+        compact: bool = True,
+        dat_cache: DatCache = None,
+        memory_budget: int = 0,
+):
     from .processor import (
         preprocess_verilator_coverage,
+        process_coverage_list,
         filter_coverage,
         verilator_coverage_miss,
     )
 
     assert isinstance(line_coverage_list, list), "Invalid line coverage list"
-    merged_coverage, ignore_info, ignore_pattern, ignore_miss_range = preprocess_verilator_coverage(line_coverage_list)
-    # Sort miss_range
-    filtered_coverage = filter_coverage(merged_coverage, ignore_pattern, ignore_miss_range)
     if not os.path.exists(output_dir):
         os.makedirs(output_dir)
+    if memory_budget > 0:
+        # Bounded memory: merge and filter through sorted runs on disk, consumers stream the result
+        dat_list, ignore_info, ignore_pattern, ignore_miss_range = process_coverage_list(line_coverage_list)
+        filtered_coverage = external_merge_coverage(
+            dat_list, os.path.join(output_dir, "merge_runs"), memory_budget, merged_hits,
+            ignore_pattern, ignore_miss_range,
+        )
+    else:
+        merged_coverage, ignore_info, ignore_pattern, ignore_miss_range = preprocess_verilator_coverage(
+            line_coverage_list, workers, merged_hits, compact, dat_cache
+        )
+        # Sort miss_range
+        filtered_coverage = filter_coverage(merged_coverage, ignore_pattern, ignore_miss_range)
     verilator_coverage_miss(filtered_coverage, os.path.join(output_dir, "code_coverage.json"))
     merged_info = os.path.join(output_dir, "merged.info")
-    verilator_coverage_to_lcov(filtered_coverage, merged_info)
+    verilator_coverage_to_lcov(filtered_coverage, merged_info, native=native_lcov)
 
+    return filtered_coverage, merged_info, ignore_info
+
+
+def convert_verilator_coverage(
+        line_coverage_list: list[dict],
+        output_dir,
+        native_lcov: bool = True,
+        workers: int = 0,
+        merged_hits=None,
+        compact: bool = True,
+        dat_cache: DatCache = None,
+        memory_budget: int = 0,
+) -> tuple[str, list[tuple]]:
+    filtered_coverage, merged_info, ignore_info = _convert_verilator_coverage(
+        line_coverage_list, output_dir, native_lcov, workers, merged_hits, compact, dat_cache, memory_budget
+    )
+    if isinstance(filtered_coverage, SpilledCoverage):
+        filtered_coverage.close()
     return merged_info, ignore_info
 
 
-def verilator_coverage_to_lcov(coverages: list[tuple[VerilatorCoverage, int]], outfile: str):
+def convert_verilator_coverage_html(
+        line_coverage_list: list[dict],
+        output_dir,
+        native_lcov: bool = True,
+        workers: int = 0,
+        merged_hits=None,
+        compact: bool = True,
+        html_cache: str = None,
+        html_cache_size: int = 512 * 2 ** 20,
+        dat_cache: DatCache = None,
+        memory_budget: int = 0,
+) -> tuple[tuple[int, int], list[tuple]]:
+    """
+    Same as `convert_verilator_coverage`, and render the html pages with the native renderer.
+
+    Return ((hit lines, total lines), ignore info), the merged.info tracefile is still written.
+    `html_cache` is the directory of the persistent page cache, see `render_coverage_html`.
+    `dat_cache` keeps the parsed coverage files across runs, see `DatCache`. With a
+    `memory_budget` in bytes, the coverage is merged on disk, see `external_merge_coverage`.
+    """
+    from ...timing import stage_timer
+
+    with stage_timer("line_coverage_merge"):
+        filtered_coverage, _, ignore_info = _convert_verilator_coverage(
+            line_coverage_list, output_dir, native_lcov, workers, merged_hits, compact, dat_cache,
+            memory_budget,
+        )
+    with stage_timer("html_render"):
+        summaries = render_coverage_html(filtered_coverage, output_dir, workers,
+                                         cache_dir=html_cache, cache_size=html_cache_size)
+    if isinstance(filtered_coverage, SpilledCoverage):
+        filtered_coverage.close()
+    hit = sum(s.line_hit for s in summaries)
+    total = sum(s.line_found for s in summaries)
+    return (hit, total), ignore_info
+
+
+def verilator_coverage_to_lcov(
+        coverages: Union[list[tuple[VerilatorCoverage, int]], CoverageTable],
+        outfile: str,
+        native: bool = True,
+):
+    if native:
+        write_lcov_info(coverages, outfile)
+        return
+    # Fallback: round trip through a .dat file and the external verilator_coverage tool
     outfile_dat = Path(outfile).with_suffix(".dat")
     with outfile_dat.open("w", encoding="utf-8") as f:
         f.write("# SystemC::Coverage-3\n")
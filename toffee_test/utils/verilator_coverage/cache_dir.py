@@ -0,0 +1,73 @@
+__all__ = [
+    "replace_file",
+    "store_file",
+    "evict_lru",
+]
+
+import os
+import tempfile
+from typing import Callable
+from typing import Union
+
+Writer = Union[bytes, Callable[[str], None]]
+
+
+def replace_file(path: str, write: Writer) -> None:
+    """
+    Write `path` atomically: the content is written to a temporary file of the same
+    directory, which then replaces `path`. Readers, and other processes writing the same
+    file, never see a partial file, and a hard link to the old file keeps its content.
+
+    `write` is the content, or a function writing the temporary file at the given path.
+    The temporary file is removed if writing fails.
+    """
+    fd, tmp = tempfile.mkstemp(dir=os.path.dirname(path) or ".", suffix=".tmp")
+    try:
+        if isinstance(write, bytes):
+            with os.fdopen(fd, "wb") as f:
+                f.write(write)
+        else:
+            os.close(fd)
+            write(tmp)
+        os.replace(tmp, path)
+    except BaseException:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+        raise
+
+
+def store_file(path: str, write: Writer) -> None:
+    """
+    Same as `replace_file`, for cache entries: a file that cannot be written is skipped.
+    """
+    try:
+        replace_file(path, write)
+    except OSError:
+        pass
+
+
+def evict_lru(cache_dir: str, suffixes: tuple[str, ...], max_bytes: int) -> None:
+    """
+    Remove the least recently used files ending with one of `suffixes`, by mtime, until
+    they take at most `max_bytes`. Readers refresh the mtime of the files they use.
+    """
+    entries = []
+    total = 0
+    for entry in os.scandir(cache_dir):
+        if not entry.name.endswith(suffixes):
+            continue
+        try:
+            st = entry.stat()
+        except OSError:
+            continue
+        entries.append((st.st_mtime, st.st_size, entry.path))
+        total += st.st_size
+    entries.sort()
+    for _, size, path in entries:
+        if total <= max_bytes:
+            break
+        try:
+            os.remove(path)
+        except OSError:
+            continue
+        total -= size
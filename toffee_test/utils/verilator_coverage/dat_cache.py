@@ -0,0 +1,174 @@
+__all__ = [
+    "DatCache",
+]
+
+import hashlib
+import os
+import struct
+import sys
+from array import array
+from collections import Counter
+from typing import Optional
+
+from .cache_dir import evict_lru
+from .cache_dir import store_file
+from .point_dict import PointDictionary
+
+# Header of a cached hit map, followed by the number of entries, the hits as int64 and the
+# entries separated by newlines. The entries are not compressed, inflating them takes longer
+# than building the hit map itself
+_MAGIC = b"TDC1"
+_HEADER = struct.Struct("<4sI")
+
+
+def encode_hits(hits: dict[str, int]) -> bytes:
+    counts = array("q", hits.values())
+    if sys.byteorder == "big":
+        counts.byteswap()
+    body = "\n".join(hits).encode("utf-8")
+    return _HEADER.pack(_MAGIC, len(counts)) + counts.tobytes() + body
+
+
+def decode_hits(data: bytes) -> Optional[Counter]:
+    magic, n = _HEADER.unpack_from(data)
+    if magic != _MAGIC:
+        return None
+    start = _HEADER.size
+    counts = array("q")
+    counts.frombytes(data[start : start + 8 * n])
+    if sys.byteorder == "big":
+        counts.byteswap()
+    hits = Counter()
+    if n:
+        entries = data[start + 8 * n :].decode("utf-8").split("\n")
+        dict.update(hits, zip(entries, counts))
+    return hits
+
+
+def _read(path: str) -> Optional[bytes]:
+    try:
+        with open(path, "rb") as f:
+            return f.read()
+    except OSError:
+        return None
+
+
+class DatCache:
+    """
+    On-disk cache of the hit maps parsed from SystemC::Coverage-3 files.
+
+    A hit map is stored once per file content, under the digest of the file. A small
+    reference file, named after the path, size and mtime of a coverage file, points to
+    the digest, so an unchanged file is neither read nor hashed again. Files of a known
+    DUT build are stored as plain hit vectors over the ids of its `PointDictionary`,
+    which is kept in the cache too. Files are replaced atomically, several processes may
+    share one cache. `evict` trims the cache to `max_bytes`, least recently used files first.
+    """
+
+    def __init__(self, cache_dir: str, max_bytes: int = 1024 * 2**20):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        os.makedirs(cache_dir, exist_ok=True)
+
+    def _ref_path(self, path: str, st: os.stat_result) -> str:
+        key = "%s\0%d\0%d" % (os.path.abspath(path), st.st_size, st.st_mtime_ns)
+        return os.path.join(
+            self.cache_dir, hashlib.sha1(key.encode("utf-8")).hexdigest() + ".ref"
+        )
+
+    def _load_blob(self, digest: str) -> Optional[Counter]:
+        blob = os.path.join(self.cache_dir, digest + ".hits")
+        data = _read(blob)
+        if data is None or len(data) < _HEADER.size:
+            return None
+        try:
+            hits = decode_hits(data)
+            # Refresh the mtime, eviction drops the least recently used files first
+            os.utime(blob)
+        except (OSError, ValueError):
+            return None
+        return hits
+
+    def _digest(self, path: str) -> tuple[str, Optional[bytes]]:
+        # Content digest of a coverage file, and its content if it had to be read
+        ref = self._ref_path(path, os.stat(path))
+        digest = _read(ref)
+        if digest is not None:
+            os.utime(ref)
+            return digest.decode("ascii"), None
+        raw = _read(path)
+        if raw is None:
+            raise FileNotFoundError(path)
+        digest = hashlib.blake2b(raw, digest_size=16).hexdigest()
+        store_file(ref, digest.encode("ascii"))
+        return digest, raw
+
+    def load(self, path: str, parse) -> Counter:
+        """
+        Return the hit map of the coverage file `path`, `parse(lines)` builds it on a miss.
+        """
+        digest, raw = self._digest(path)
+        hits = self._load_blob(digest)
+        if hits is None:
+            if raw is None:
+                raw = _read(path)
+            hits = parse(raw.decode("utf-8").split("\n"))
+            try:
+                data = encode_hits(hits)
+            except OverflowError:
+                # Hit counts beyond int64, do not cache this file
+                return hits
+            store_file(os.path.join(self.cache_dir, digest + ".hits"), data)
+        return hits
+
+    def load_vector(
+        self, path: str, dictionary: PointDictionary, extra: Counter
+    ) -> list[int]:
+        """
+        Return the hit vector of the coverage file `path` over the ids of `dictionary`.
+
+        Entries missing from the dictionary are added to `extra`, the vectors of such files
+        are not cached.
+        """
+        digest, _ = self._digest(path)
+        blob = os.path.join(self.cache_dir, "%s-%s.vec" % (digest, dictionary.digest()))
+        data = _read(blob)
+        if data is not None and len(data) == 8 * len(dictionary):
+            vec = array("q")
+            vec.frombytes(data)
+            if sys.byteorder == "big":
+                vec.byteswap()
+            os.utime(blob)
+            return vec.tolist()
+        hits = [0] * len(dictionary)
+        file_extra = Counter()
+        dictionary.read(path, hits, file_extra)
+        if file_extra:
+            extra.update(file_extra)
+            return hits
+        try:
+            vec = array("q", hits)
+        except OverflowError:
+            return hits
+        if sys.byteorder == "big":
+            vec.byteswap()
+        store_file(blob, vec.tobytes())
+        return hits
+
+    def load_points(self, build_id: str) -> Optional[PointDictionary]:
+        path = os.path.join(self.cache_dir, build_id + ".points")
+        try:
+            dictionary = PointDictionary.load(build_id, path)
+            os.utime(path)
+        except (OSError, ValueError):
+            return None
+        return dictionary
+
+    def store_points(self, dictionary: PointDictionary) -> None:
+        store_file(
+            os.path.join(self.cache_dir, dictionary.build_id + ".points"),
+            dictionary.save,
+        )
+
+    def evict(self) -> None:
+        evict_lru(self.cache_dir, (".hits", ".ref", ".vec", ".points"), self.max_bytes)
@@ -0,0 +1,166 @@
+__all__ = [
+    "SpilledCoverage",
+    "external_merge_coverage",
+]
+
+import heapq
+import itertools
+import os
+import shutil
+from collections import Counter
+from typing import Iterable
+from typing import Iterator
+from typing import Optional
+
+from .models import VerilatorCoverage
+from .processor import _iter_filtered_coverage
+from .processor import iter_verilator_coverage
+
+# Estimated bytes held per distinct entry: the entry in the counter and its line in the sorted run
+_ENTRY_OVERHEAD = 200
+# Runs merged at once, more runs are merged in several passes
+_MAX_OPEN_RUNS = 64
+
+
+def _sort_fields(raw: str) -> str:
+    # Lines of a run sort like `VerilatorCoverage`, ties by the raw entry. "\0" is below any
+    # character of the fields, so a field sorts before all the longer fields it prefixes.
+    # The fields are cut out directly, decoding a `VerilatorCoverage` costs several times more
+    fields = dict(item.split("\x02", 1) for item in raw.split("\x01")[1:])
+    type_part, module_name = fields["page"].split("/")
+    return "%s\0%020d\0%020d\0%s\0%s" % (
+        fields["f"],
+        int(fields["l"]),
+        int(fields["n"]),
+        type_part.lstrip("v_"),
+        module_name,
+    )
+
+
+def _run_line(raw: str, hit: int) -> str:
+    return "%s\0%s\0%d\n" % (_sort_fields(raw), raw, hit)
+
+
+def _write_run(path: str, lines: list[str]) -> None:
+    lines.sort()
+    with open(path, "w", encoding="utf-8") as f:
+        f.writelines(lines)
+
+
+def _read_run(path: str) -> Iterator[str]:
+    with open(path, "r", encoding="utf-8") as f:
+        yield from f
+
+
+def _merge_runs(runs: list[str]) -> Iterator[tuple[str, int]]:
+    # Yield (key, summed hits) in order, the key is a run line without its hits
+    cur = None
+    total = 0
+    for line in heapq.merge(*map(_read_run, runs)):
+        key, _, hit = line.rpartition("\0")
+        if key == cur:
+            total += int(hit)
+            continue
+        if cur is not None:
+            yield cur, total
+        cur, total = key, int(hit)
+    if cur is not None:
+        yield cur, total
+
+
+class SpilledCoverage:
+    """
+    Merged coverage points kept sorted in a file, iterated as `(VerilatorCoverage, hit)`.
+
+    Every iteration streams the file again, so the consumers of the merged coverage
+    (`verilator_coverage_miss`, `write_lcov_info`, `render_coverage_html`) run one after
+    the other without holding the points in memory. `close` removes the files.
+    """
+
+    def __init__(self, work_dir: str, path: str):
+        self.work_dir = work_dir
+        self.path = path
+
+    def __iter__(self) -> Iterator[tuple[VerilatorCoverage, int]]:
+        with open(self.path, "r", encoding="utf-8") as f:
+            for line in f:
+                key, _, hit = line.rpartition("\0")
+                yield VerilatorCoverage(key.rpartition("\0")[2], lazy=True), int(hit)
+
+    def close(self):
+        shutil.rmtree(self.work_dir, ignore_errors=True)
+
+
+def external_merge_coverage(
+    coverage_files: Iterable[str],
+    work_dir: str,
+    memory_budget: int,
+    merged_hits: Optional[Counter] = None,
+    ignore_patterns: Iterable[str] = (),
+    ignore_miss_line_ranges: Optional[dict[str, list[range]]] = None,
+) -> SpilledCoverage:
+    """
+    Merge and filter coverage files within a memory budget, keep the result sorted on disk.
+
+    Entries are summed in memory until their estimated size reaches `memory_budget` bytes,
+    then written to `work_dir` as a sorted run. The runs are merged k ways into one stream,
+    which is filtered like `filter_coverage` and written to a single sorted file.
+    """
+    shutil.rmtree(work_dir, ignore_errors=True)
+    os.makedirs(work_dir)
+    runs: list[str] = []
+    run_ids = itertools.count()
+    buf = Counter()
+    size = 0
+
+    def spill():
+        nonlocal buf, size
+        path = os.path.join(work_dir, "run_%d" % next(run_ids))
+        _write_run(path, [_run_line(raw, hit) for raw, hit in buf.items()])
+        runs.append(path)
+        buf = Counter()
+        size = 0
+
+    def add(entries):
+        nonlocal size
+        for entry, hit in entries:
+            if entry not in buf:
+                size += 2 * len(entry) + _ENTRY_OVERHEAD
+            buf[entry] += hit
+            if size >= memory_budget:
+                spill()
+
+    if merged_hits:
+        add(merged_hits.items())
+    for path in coverage_files:
+        with open(path, "r") as f:
+            add(iter_verilator_coverage(f))
+    if buf or not runs:
+        spill()
+    # Merge in several passes while there are too many runs to open at once
+    while len(runs) > _MAX_OPEN_RUNS:
+        path = os.path.join(work_dir, "run_%d" % next(run_ids))
+        with open(path, "w", encoding="utf-8") as f:
+            for key, hit in _merge_runs(runs[:_MAX_OPEN_RUNS]):
+                f.write("%s\0%d\n" % (key, hit))
+        for run in runs[:_MAX_OPEN_RUNS]:
+            os.remove(run)
+        runs = runs[_MAX_OPEN_RUNS:] + [path]
+
+    merged_path = os.path.join(work_dir, "merged")
+    points = (
+        (VerilatorCoverage(key.rpartition("\0")[2], lazy=True), hit)
+        for key, hit in _merge_runs(runs)
+    )
+    records = _iter_filtered_coverage(
+        points, set(ignore_patterns), ignore_miss_line_ranges or {}
+    )
+    with open(merged_path, "w", encoding="utf-8") as f:
+        for _, meta, hit, new_blocks in records:
+            if new_blocks is not None:
+                meta.block = new_blocks
+            # The sort fields do not change with the blocks, the file stays sorted
+            f.write("%s\0%s\0%d\n" % (_sort_fields(str(meta)), meta, hit))
+    for run in runs:
+        os.remove(run)
+    return SpilledCoverage(work_dir, merged_path)
@@ -0,0 +1,244 @@
+__all__ = [
+    "render_coverage_html",
+]
+
+import hashlib
+import html
+import os
+import shutil
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures import ThreadPoolExecutor
+from typing import Iterable
+from typing import NamedTuple
+from typing import Optional
+
+from .cache_dir import evict_lru
+from .cache_dir import replace_file
+from .cache_dir import store_file
+from .lcov import ANNOTATE_MIN
+from .lcov import collect_source_lines
+from .lcov import source_totals
+from .models import VerilatorCoverage
+
+_STYLE = """
+body { font-family: sans-serif; margin: 1em 2em; }
+table { border-collapse: collapse; }
+th, td { padding: 2px 8px; border: 1px solid #ccc; text-align: right; }
+th:first-child, td:first-child { text-align: left; }
+.hi { background: #ccffcc; }
+.mi { background: #ffcccc; }
+.med { background: #ffeb9c; }
+pre { margin: 0; }
+table.source td { border: none; padding: 0 6px; font-family: monospace; white-space: pre; text-align: left; }
+table.source td.num { text-align: right; color: #666; }
+"""
+
+
+# Bump when the page layout changes, pages cached by an older renderer are then ignored
+_RENDER_VERSION = "1"
+
+
+class SourceSummary(NamedTuple):
+    path: str
+    page: str
+    line_found: int
+    line_hit: int
+    branch_found: int
+    branch_hit: int
+
+
+def _rate(hit: int, found: int) -> str:
+    return f"{hit / found * 100:.1f}%" if found else "-"
+
+
+def _rate_class(hit: int, found: int) -> str:
+    if not found:
+        return ""
+    rate = hit / found * 100
+    return "hi" if rate >= 90 else "med" if rate >= 75 else "mi"
+
+
+def _page_head(title: str) -> str:
+    return (
+        f'<!DOCTYPE html>\n<html><head><meta charset="utf-8"><title>{html.escape(title)}</title>'
+        f"<style>{_STYLE}</style></head><body>\n"
+    )
+
+
+def _read_source(path: str) -> Optional[bytes]:
+    try:
+        with open(path, "rb") as f:
+            return f.read()
+    except OSError:
+        return None
+
+
+def _page_key(
+    path: str, source: Optional[bytes], lines: dict[int, list[int]], annotate_min: int
+) -> str:
+    # Content address of a page: the source text and the coverage records of that file
+    h = hashlib.sha1()
+    h.update(f"{_RENDER_VERSION}\0{path}\0{annotate_min}\0".encode("utf-8"))
+    h.update(hashlib.sha1(source).digest() if source is not None else b"-")
+    h.update(repr(sorted(lines.items())).encode("ascii"))
+    return h.hexdigest()
+
+
+def _place_page(cached: str, dest: str) -> None:
+    if os.path.exists(dest):
+        os.remove(dest)
+    try:
+        os.link(cached, dest)
+    except OSError:
+        shutil.copyfile(cached, dest)
+
+
+def evict_render_cache(cache_dir: str, max_bytes: int) -> None:
+    """
+    Remove the least recently used pages until the cache holds at most `max_bytes`.
+    """
+    evict_lru(cache_dir, (".html",), max_bytes)
+
+
+def _render_source(
+    args: tuple[str, str, str, dict[int, list[int]], int, Optional[str]]
+) -> SourceSummary:
+    path, page, output_dir, lines, annotate_min, cache_dir = args
+    line_found, line_hit, branch_found, branch_hit = source_totals(lines, annotate_min)
+    summary = SourceSummary(path, page, line_found, line_hit, branch_found, branch_hit)
+    raw_source = _read_source(path)
+    page_path = os.path.join(output_dir, page)
+    if cache_dir is not None:
+        key = _page_key(path, raw_source, lines, annotate_min)
+        cached = os.path.join(cache_dir, key + ".html")
+        try:
+            # Refresh the mtime, eviction drops the least recently used pages first
+            os.utime(cached)
+            _place_page(cached, page_path)
+            return summary
+        except OSError:
+            pass
+    source = (
+        raw_source.decode("utf-8", errors="replace").splitlines()
+        if raw_source is not None
+        else None
+    )
+    if source is None:
+        # Source not available on this machine, only list the instrumented lines
+        numbers = sorted(lines)
+    else:
+        numbers = range(1, max(len(source), max(lines)) + 1)
+    out = [
+        _page_head(path),
+        f'<h2>{html.escape(path)}</h2>\n<p><a href="index.html">Back to index</a></p>\n',
+        "<table><tr><th></th><th>Hit</th><th>Total</th><th>Coverage</th></tr>\n",
+        f"<tr><td>Lines</td><td>{line_hit}</td><td>{line_found}</td>"
+        f'<td class="{_rate_class(line_hit, line_found)}">{_rate(line_hit, line_found)}</td></tr>\n',
+        f"<tr><td>Branches</td><td>{branch_hit}</td><td>{branch_found}</td>"
+        f'<td class="{_rate_class(branch_hit, branch_found)}">{_rate(branch_hit, branch_found)}</td></tr>\n',
+        '</table>\n<br>\n<table class="source">\n',
+    ]
+    for n in numbers:
+        counts = lines.get(n)
+        text = (
+            html.escape(source[n - 1])
+            if source is not None and n <= len(source)
+            else ""
+        )
+        if counts is None:
+            out.append(
+                f'<tr><td class="num">{n}</td><td></td><td></td><td>{text}</td></tr>\n'
+            )
+            continue
+        cls = "hi" if max(counts) > 0 else "mi"
+        branches = ""
+        if len(counts) > 1:
+            branches = (
+                "[" + " ".join("+" if c >= annotate_min else "-" for c in counts) + "]"
+            )
+        out.append(
+            f'<tr class="{cls}"><td class="num">{n}</td><td class="num">{max(counts)}</td>'
+            f"<td>{branches}</td><td>{text}</td></tr>\n"
+        )
+    out.append("</table>\n</body></html>\n")
+    # Replace the page instead of writing into it, it may be a hard link to a cached page
+    replace_file(page_path, "".join(out).encode("utf-8"))
+    if cache_dir is not None:
+        store_file(
+            os.path.join(cache_dir, key + ".html"),
+            lambda tmp: shutil.copyfile(page_path, tmp),
+        )
+    return summary
+
+
+def _write_index(output_dir: str, summaries: list[SourceSummary]) -> None:
+    lf = sum(s.line_found for s in summaries)
+    lh = sum(s.line_hit for s in summaries)
+    bf = sum(s.branch_found for s in summaries)
+    bh = sum(s.branch_hit for s in summaries)
+    out = [
+        _page_head("Line Coverage"),
+        "<h2>Line Coverage</h2>\n<table>\n",
+        "<tr><th>File</th><th>Line Coverage</th><th>Lines Hit</th><th>Lines</th>"
+        "<th>Branch Coverage</th><th>Branches Hit</th><th>Branches</th></tr>\n",
+        f'<tr><td><b>Total</b></td><td class="{_rate_class(lh, lf)}">{_rate(lh, lf)}</td><td>{lh}</td><td>{lf}</td>'
+        f'<td class="{_rate_class(bh, bf)}">{_rate(bh, bf)}</td><td>{bh}</td><td>{bf}</td></tr>\n',
+    ]
+    for s in summaries:
+        out.append(
+            f'<tr><td><a href="{s.page}">{html.escape(s.path)}</a></td>'
+            f'<td class="{_rate_class(s.line_hit, s.line_found)}">{_rate(s.line_hit, s.line_found)}</td>'
+            f"<td>{s.line_hit}</td><td>{s.line_found}</td>"
+            f'<td class="{_rate_class(s.branch_hit, s.branch_found)}">{_rate(s.branch_hit, s.branch_found)}</td>'
+            f"<td>{s.branch_hit}</td><td>{s.branch_found}</td></tr>\n"
+        )
+    out.append("</table>\n</body></html>\n")
+    with open(os.path.join(output_dir, "index.html"), "w", encoding="utf-8") as f:
+        f.write("".join(out))
+
+
+def render_coverage_html(
+    coverages: Iterable[tuple[VerilatorCoverage, int]],
+    output_dir: str,
+    workers: int = 0,
+    annotate_min: int = ANNOTATE_MIN,
+    cache_dir: Optional[str] = None,
+    cache_size: int = 512 * 2**20,
+) -> list[SourceSummary]:
+    """
+    Render `index.html` and one page per source file into `output_dir`, in place of `genhtml`.
+
+    Line and branch totals are counted the same way as the records of `write_lcov_info`.
+    Source pages are rendered by a process pool of `workers` processes, or in a thread pool
+    when `workers` <= 0, like `count_verilator_coverage_files`. Return the summary of every
+    source file, sorted by path.
+
+    With `cache_dir`, pages are also kept there, addressed by the content of the source
+    file and its coverage records. Pages found in the cache are hard-linked (or copied)
+    instead of rendered, and the cache is trimmed to `cache_size` bytes, least recently
+    used pages first.
+    """
+    os.makedirs(output_dir, exist_ok=True)
+    if cache_dir is not None:
+        os.makedirs(cache_dir, exist_ok=True)
+    jobs = []
+    for i, (path, lines) in enumerate(collect_source_lines(coverages)):
+        page = "src_%d_%s.html" % (i, os.path.basename(path))
+        jobs.append((path, page, output_dir, lines, annotate_min, cache_dir))
+    if workers == 1 or len(jobs) <= 1:
+        summaries = [_render_source(job) for job in jobs]
+    elif workers <= 0:
+        with ThreadPoolExecutor() as pool:
+            summaries = list(pool.map(_render_source, jobs))
+    else:
+        with ProcessPoolExecutor(max_workers=min(workers, len(jobs))) as pool:
+            summaries = list(
+                pool.map(
+                    _render_source, jobs, chunksize=max(1, len(jobs) // (workers * 4))
+                )
+            )
+    summaries.sort(key=lambda s: s.path)
+    _write_index(output_dir, summaries)
+    if cache_dir is not None:
+        evict_render_cache(cache_dir, cache_size)
+    return summaries
@@ -0,0 +1,109 @@
+__all__ = [
+    "collect_source_lines",
+    "source_totals",
+    "write_lcov_info",
+]
+
+from typing import Iterable
+from typing import Iterator
+from typing import TextIO
+
+from .models import VerilatorCoverage
+
+# Same default as `verilator_coverage --annotate-min`, a branch point is only
+# reported as hit by `-write-info` once its count reaches this threshold.
+ANNOTATE_MIN = 10
+
+
+def _point_lines(meta: VerilatorCoverage) -> Iterable[int]:
+    yield meta.line
+    for b in meta.block:
+        yield from b
+
+
+def collect_source_lines(
+    coverages: Iterable[tuple[VerilatorCoverage, int]],
+) -> Iterator[tuple[str, dict[int, list[int]]]]:
+    """
+    Group coverage points by source file, yield (path, {line: counts of the points on that line}).
+
+    Every point counts on its own line and on the extra lines of its `S` block list.
+    The input is expected to be sorted by path (as returned by `merge_verilator_coverage`),
+    each source file is yielded as soon as the next file starts.
+    """
+    cur_path = None
+    lines: dict[int, list[int]] = {}
+    # line -> index of the last point added, a point may list its own line in `S`
+    last_point: dict[int, int] = {}
+    for i, (meta, hit) in enumerate(coverages):
+        if not meta.path or not meta.line:
+            continue
+        if meta.path != cur_path:
+            if lines:
+                yield cur_path, lines
+            cur_path = meta.path
+            lines = {}
+            last_point = {}
+        for ln in _point_lines(meta):
+            if last_point.get(ln) == i:
+                continue
+            last_point[ln] = i
+            lines.setdefault(ln, []).append(hit)
+    if lines:
+        yield cur_path, lines
+
+
+def source_totals(
+    lines: dict[int, list[int]], annotate_min: int = ANNOTATE_MIN
+) -> tuple[int, int, int, int]:
+    """
+    Return (lines found, lines hit, branches found, branches hit) of one source file.
+
+    Only lines carrying more than one point count as branches.
+    """
+    line_found = len(lines)
+    line_hit = 0
+    branch_found = 0
+    branch_hit = 0
+    for counts in lines.values():
+        line_hit += max(counts) > 0
+        if len(counts) == 1:
+            continue
+        branch_found += len(counts)
+        branch_hit += sum(c >= annotate_min for c in counts)
+    return line_found, line_hit, branch_found, branch_hit
+
+
+def _write_source(
+    f: TextIO, path: str, lines: dict[int, list[int]], annotate_min: int
+) -> None:
+    f.write(f"SF:{path}\n")
+    for line in sorted(lines):
+        counts = lines[line]
+        f.write(f"DA:{line},{max(counts)}\n")
+        if len(counts) == 1:
+            continue
+        for i, c in enumerate(counts):
+            f.write(f"BRDA:{line},0,{i},{c}\n")
+    line_found, line_hit, branch_found, branch_hit = source_totals(lines, annotate_min)
+    f.write(f"BRF:{branch_found}\n")
+    f.write(f"BRH:{branch_hit}\n")
+    f.write(f"LF:{line_found}\n")
+    f.write(f"LH:{line_hit}\n")
+    f.write("end_of_record\n")
+
+
+def write_lcov_info(
+    coverages: Iterable[tuple[VerilatorCoverage, int]],
+    outfile: str,
+    annotate_min: int = ANNOTATE_MIN,
+) -> None:
+    """
+    Write coverage points as an LCOV tracefile, the same way `verilator_coverage -write-info` does.
+
+    A line that carries more than one point also gets one BRDA record per point, in input order.
+    """
+    with open(outfile, "w", encoding="utf-8") as f:
+        f.write("TN:verilator_coverage\n")
+        for path, lines in collect_source_lines(coverages):
+            _write_source(f, path, lines, annotate_min)
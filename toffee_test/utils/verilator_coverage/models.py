@@ -1,5 +1,7 @@
 __all__ = [
     "VerilatorCoverage",
+    "CoveragePoint",
+    "CoverageTable",
     "MetricStats",
     "ModuleCoverage",
     "FileCoverage",
@@ -7,80 +9,181 @@ __all__ = [
 ]
 
 import re
+from array import array
 from dataclasses import dataclass, field
-from typing import NamedTuple
+from typing import Iterable, NamedTuple, Optional
+
+
+_RE_PARSER = re.compile(r"\x01([^\x02]+)\x02([^\x01]*)")
+
+
+def _decode_entry(raw: str) -> tuple:
+    # Split the fields of a raw entry, the `S` block list is returned undecoded
+    path = line = column = type = module_name = hierarchy = block_raw = None
+    comment = ""
+    has_type_field = has_comment = False
+    for k, v in _RE_PARSER.findall(raw):
+        if k == "f":
+            path = v
+        elif k == "l":
+            line = int(v)
+        elif k == "n":
+            column = int(v)
+        elif k == "t":
+            has_type_field = True
+        elif k == "page":
+            type_part, module_name = v.split("/")
+            type = type_part.lstrip("v_")
+        elif k == "o":
+            comment = v
+            has_comment = True
+        elif k == "S":
+            block_raw = v
+        elif k == "h":
+            hierarchy = v
+    return (path, line, column, type, module_name, comment, hierarchy,
+            has_type_field, has_comment, block_raw)
+
+
+def _parse_block(block_raw: str) -> list[range]:
+    block_list = []
+    for b in block_raw.split(","):
+        if "-" in b:
+            l, r = map(int, b.split("-"))
+            block_list.append(range(l, r + 1))
+        else:
+            num = int(b)
+            block_list.append(range(num, num + 1))
+    return block_list
+
+
+def _decoded_field(slot: str) -> property:
+    def getter(self):
+        if not self._decoded:
+            self._decode()
+        return getattr(self, slot)
+    return property(getter)
 
 
 class VerilatorCoverage:
+    """
+    One entry of a SystemC::Coverage-3 file.
+
+    With `lazy=True` the raw entry is kept and fields are only decoded when they are read:
+    reading `path` alone extracts just that field, the first access to any other field
+    decodes the rest except the `S` block list, which is only parsed when `block` is used.
+    `str()` of a lazy entry returns the raw entry as long as its blocks were not replaced.
+    """
     __slots__ = (
-        'path', 'line', 'column', 'type', 'module_name',
-        'comment', '_block', 'hierarchy',
+        '_path', '_line', '_column', '_type', '_module_name',
+        '_comment', '_block', '_hierarchy',
         '_has_type_field', '_has_comment', '_has_blocks',
-        '_block_set_cache_valid', '_block_set'
+        '_block_set_cache_valid', '_block_set',
+        '_raw', '_block_raw', '_decoded', '_mutated',
     )
 
-    _RE_PARSER = re.compile(r"\x01([^\x02]+)\x02([^\x01]*)")
+    def __init__(self, raw: str, lazy: bool = False):
+        self._raw = raw
+        self._block_raw = None
+        self._decoded = False
+        self._mutated = False
+        self._block_set_cache_valid = False
+        self._block_set: set[int] = set()
+
+        if not lazy:
+            self._decode()
+            self._parse_block()
+            self._raw = None
 
-    def __init__(self, raw: str):
-        self.comment = ""
+    def _decode(self):
+        self._comment = ""
         self._block: list[range] = []
         self._has_type_field = False
         self._has_comment = False
         self._has_blocks = False
-        self._block_set_cache_valid = False
-        self._block_set: set[int] = set()
 
-        for k, v in self._RE_PARSER.findall(raw):
+        for k, v in _RE_PARSER.findall(self._raw):
             if k == "f":
-                self.path: str = v
+                self._path: str = v
             elif k == "l":
-                self.line = int(v)
+                self._line = int(v)
             elif k == "n":
-                self.column = int(v)
+                self._column = int(v)
             elif k == "t":
                 self._has_type_field = True
             elif k == "page":
                 type_part, module_part = v.split("/")
-                self.type = type_part.lstrip("v_")
-                self.module_name = module_part
+                self._type = type_part.lstrip("v_")
+                self._module_name = module_part
             elif k == "o":
-                self.comment = v
+                self._comment = v
                 self._has_comment = True
             elif k == "S":
-                block_list = []
-                for b in v.split(","):
-                    if "-" in b:
-                        l, r = map(int, b.split("-"))
-                        block_list.append(range(l, r + 1))
-                    else:
-                        num = int(b)
-                        block_list.append(range(num, num + 1))
-                self._block = block_list
+                self._block_raw = v
                 self._has_blocks = True
             elif k == "h":
-                self.hierarchy = v
+                self._hierarchy = v
+        self._decoded = True
+
+    def _parse_block(self):
+        if self._block_raw is None:
+            return
+        self._block = _parse_block(self._block_raw)
+        self._block_raw = None
+
+    @property
+    def path(self) -> str:
+        try:
+            return self._path
+        except AttributeError:
+            pass
+        if not self._decoded:
+            # Only cut out the file field, enough for ignore filtering
+            start = self._raw.find("\x01f\x02")
+            if start != -1:
+                end = self._raw.find("\x01", start + 3)
+                self._path = self._raw[start + 3:end] if end != -1 else self._raw[start + 3:]
+                return self._path
+            self._decode()
+        return self._path
+
+    line = _decoded_field('_line')
+    column = _decoded_field('_column')
+    type = _decoded_field('_type')
+    module_name = _decoded_field('_module_name')
+    comment = _decoded_field('_comment')
+    hierarchy = _decoded_field('_hierarchy')
 
     @property
     def block_set(self) -> set[int]:
+        if not self._decoded:
+            self._decode()
         if not self._has_blocks:
             return set()
         elif not self._block_set_cache_valid:
             self._block_set_cache_valid = True
-            for b in self._block:
+            for b in self.block:
                 self._block_set.update(b)
         return self._block_set
 
     @property
     def block(self):
+        if not self._decoded:
+            self._decode()
+        self._parse_block()
         return self._block
 
     @block.setter
     def block(self, new_blocks: list[range]):
+        if not self._decoded:
+            self._decode()
         if not self._has_blocks or not new_blocks:
             return
         self._block_set_cache_valid = False
         self._block_set.clear()
+        self._block_raw = None
         self._block = new_blocks
+        self._mutated = True
 
     def __lt__(self, other):
         x = (self.path, self.line, self.column, self.type, self.module_name)
@@ -88,32 +191,272 @@ class VerilatorCoverage:
         return x < y
 
     def __str__(self):
-        fields = [
-            f"\x01f\x02{self.path}",
-            f"\x01l\x02{self.line}",
-            f"\x01n\x02{self.column}"
-        ]
+        if self._raw is not None and not self._mutated:
+            return self._raw
+        return format_coverage_entry(
+            self.path, self.line, self.column, self.type, self.module_name, self.hierarchy,
+            self.comment if self._has_comment else None,
+            self.block if self._has_blocks else None,
+            self._has_type_field,
+        )
+
+
+def format_coverage_entry(
+        path: str,
+        line: int,
+        column: int,
+        type: str,
+        module_name: str,
+        hierarchy: str,
+        comment: Optional[str] = None,
+        block: Optional[list[range]] = None,
+        has_type_field: bool = False,
+) -> str:
+    fields = [
+        f"\x01f\x02{path}",
+        f"\x01l\x02{line}",
+        f"\x01n\x02{column}"
+    ]
+
+    if has_type_field:
+        fields.append(f"\x01t\x02{type}")
+
+    fields.append(f"\x01page\x02v_{type}/{module_name}")
+
+    if comment is not None:
+        fields.append(f"\x01o\x02{comment}")
+
+    if block is not None:
+        block_parts = []
+        for b in block:
+            if b.start + 1 == b.stop:
+                block_parts.append(str(b.start))
+            else:
+                block_parts.append(f"{b.start}-{b.stop - 1}")
+        fields.append(f"\x01S\x02{','.join(block_parts)}")
+
+    fields.append(f"\x01h\x02{hierarchy}")
+
+    return ''.join(fields)
+
+
+class _StringTable:
+    __slots__ = ('values', '_ids')
+
+    def __init__(self):
+        self.values: list[str] = []
+        self._ids: dict[str, int] = {}
+
+    def intern(self, value: str) -> int:
+        i = self._ids.get(value)
+        if i is None:
+            i = self._ids[value] = len(self.values)
+            self.values.append(value)
+        return i
+
+
+_FLAG_TYPE_FIELD = 1
+_FLAG_COMMENT = 2
+_FLAG_BLOCKS = 4
+
+
+class CoveragePoint:
+    """
+    Read-only view of one row of a `CoverageTable`, with the same fields as `VerilatorCoverage`.
+    """
+    __slots__ = ('_table', '_index')
+
+    def __init__(self, table: "CoverageTable", index: int):
+        self._table = table
+        self._index = index
+
+    @property
+    def path(self) -> str:
+        return self._table.paths.values[self._table.path_ids[self._index]]
+
+    @property
+    def line(self) -> int:
+        return self._table.lines[self._index]
+
+    @property
+    def column(self) -> int:
+        return self._table.columns[self._index]
+
+    @property
+    def type(self) -> str:
+        return self._table.types.values[self._table.type_ids[self._index]]
+
+    @property
+    def module_name(self) -> str:
+        return self._table.modules.values[self._table.module_ids[self._index]]
+
+    @property
+    def hierarchy(self) -> str:
+        return self._table.hierarchies.values[self._table.hierarchy_ids[self._index]]
+
+    @property
+    def comment(self) -> str:
+        return self._table.comments.values[self._table.comment_ids[self._index]]
+
+    @property
+    def block(self) -> list[range]:
+        return self._table.block(self._index)
+
+    @property
+    def block_set(self) -> set[int]:
+        s = set()
+        for b in self.block:
+            s.update(b)
+        return s
+
+    def __lt__(self, other):
+        x = (self.path, self.line, self.column, self.type, self.module_name)
+        y = (other.path, other.line, other.column, other.type, other.module_name)
+        return x < y
+
+    def __str__(self):
+        flags = self._table.flags[self._index]
+        return format_coverage_entry(
+            self.path, self.line, self.column, self.type, self.module_name, self.hierarchy,
+            self.comment if flags & _FLAG_COMMENT else None,
+            self.block if flags & _FLAG_BLOCKS else None,
+            bool(flags & _FLAG_TYPE_FIELD),
+        )
+
+
+class CoverageTable:
+    """
+    Columnar store of merged coverage points.
+
+    Strings (paths, modules, types, hierarchies and comments) are interned into tables shared by
+    all rows, numeric fields and hit counts are kept in arrays, and the lines of the `S` blocks
+    are kept as (start, stop) pairs in one flat array indexed by `block_offsets` (CSR layout).
+    Iterating the table yields `(CoveragePoint, hit)` tuples like a merged coverage list.
+    """
+
+    def __init__(self, strings: Optional["CoverageTable"] = None):
+        # Share the string tables with another table, e.g. when taking a subset of it
+        if strings is not None:
+            self.paths = strings.paths
+            self.modules = strings.modules
+            self.types = strings.types
+            self.hierarchies = strings.hierarchies
+            self.comments = strings.comments
+        else:
+            self.paths = _StringTable()
+            self.modules = _StringTable()
+            self.types = _StringTable()
+            self.hierarchies = _StringTable()
+            self.comments = _StringTable()
+        self.path_ids = array('I')
+        self.module_ids = array('I')
+        self.type_ids = array('I')
+        self.hierarchy_ids = array('I')
+        self.comment_ids = array('I')
+        self.lines = array('q')
+        self.columns = array('q')
+        self.hits = array('Q')
+        self.flags = array('B')
+        self.block_offsets = array('Q', [0])
+        self.block_bounds = array('q')
+
+    @classmethod
+    def from_hits(cls, hits: dict[str, int]) -> "CoverageTable":
+        """
+        Build a table sorted like `merge_verilator_coverage` from raw entries and their hits.
+
+        Entries are decoded straight into the columns, no `VerilatorCoverage` is built.
+        """
+        table = cls()
+        for raw, hit in hits.items():
+            (path, line, column, type, module_name, comment, hierarchy,
+             has_type_field, has_comment, block_raw) = _decode_entry(raw)
+            table.path_ids.append(table.paths.intern(path))
+            table.module_ids.append(table.modules.intern(module_name))
+            table.type_ids.append(table.types.intern(type))
+            table.hierarchy_ids.append(table.hierarchies.intern(hierarchy))
+            table.comment_ids.append(table.comments.intern(comment))
+            table.lines.append(line)
+            table.columns.append(column)
+            table.hits.append(hit)
+            table.flags.append(
+                _FLAG_TYPE_FIELD * has_type_field
+                | _FLAG_COMMENT * has_comment
+                | _FLAG_BLOCKS * (block_raw is not None)
+            )
+            table._append_block(() if block_raw is None else _parse_block(block_raw))
+        return table.sorted()
+
+    def __len__(self):
+        return len(self.hits)
 
-        if self._has_type_field:
-            fields.append(f"\x01t\x02{self.type}")
+    def __iter__(self):
+        hits = self.hits
+        for i in range(len(hits)):
+            yield CoveragePoint(self, i), hits[i]
 
-        fields.append(f"\x01page\x02v_{self.type}/{self.module_name}")
+    def append(self, meta: VerilatorCoverage, hit: int, block: Optional[list[range]] = None):
+        self.path_ids.append(self.paths.intern(meta.path))
+        self.module_ids.append(self.modules.intern(meta.module_name))
+        self.type_ids.append(self.types.intern(meta.type))
+        self.hierarchy_ids.append(self.hierarchies.intern(meta.hierarchy))
+        self.comment_ids.append(self.comments.intern(meta.comment))
+        self.lines.append(meta.line)
+        self.columns.append(meta.column)
+        self.hits.append(hit)
+        self.flags.append(
+            _FLAG_TYPE_FIELD * meta._has_type_field
+            | _FLAG_COMMENT * meta._has_comment
+            | _FLAG_BLOCKS * meta._has_blocks
+        )
+        self._append_block(meta.block if block is None else block)
 
-        if self._has_comment:
-            fields.append(f"\x01o\x02{self.comment}")
+    def _append_block(self, block: list[range]):
+        for b in block:
+            self.block_bounds.append(b.start)
+            self.block_bounds.append(b.stop)
+        self.block_offsets.append(len(self.block_bounds))
 
-        if self._has_blocks:
-            block_parts = []
-            for b in self._block:
-                if b.start + 1 == b.stop:
-                    block_parts.append(str(b.start))
-                else:
-                    block_parts.append(f"{b.start}-{b.stop - 1}")
-            fields.append(f"\x01S\x02{','.join(block_parts)}")
+    def block(self, index: int) -> list[range]:
+        bounds = self.block_bounds
+        l, r = self.block_offsets[index], self.block_offsets[index + 1]
+        return [range(bounds[i], bounds[i + 1]) for i in range(l, r, 2)]
 
-        fields.append(f"\x01h\x02{self.hierarchy}")
+    def take(self, indices: Iterable[int], blocks: Optional[dict[int, list[range]]] = None) -> "CoverageTable":
+        """
+        Copy the given rows into a new table sharing the string tables, `blocks` replaces the
+        block lines of some rows.
+        """
+        if blocks is None:
+            blocks = {}
+        table = CoverageTable(self)
+        for i in indices:
+            table.path_ids.append(self.path_ids[i])
+            table.module_ids.append(self.module_ids[i])
+            table.type_ids.append(self.type_ids[i])
+            table.hierarchy_ids.append(self.hierarchy_ids[i])
+            table.comment_ids.append(self.comment_ids[i])
+            table.lines.append(self.lines[i])
+            table.columns.append(self.columns[i])
+            table.hits.append(self.hits[i])
+            table.flags.append(self.flags[i])
+            if i in blocks:
+                table._append_block(blocks[i])
+            else:
+                l, r = self.block_offsets[i], self.block_offsets[i + 1]
+                table.block_bounds.extend(self.block_bounds[l:r])
+                table.block_offsets.append(len(table.block_bounds))
+        return table
 
-        return ''.join(fields)
+    def sorted(self) -> "CoverageTable":
+        paths = self.paths.values
+        types = self.types.values
+        modules = self.modules.values
+        order = sorted(range(len(self)), key=lambda i: (
+            paths[self.path_ids[i]], self.lines[i], self.columns[i],
+            types[self.type_ids[i]], modules[self.module_ids[i]],
+        ))
+        return self.take(order)
 
 
 @dataclass
@@ -0,0 +1,186 @@
+__all__ = [
+    "PointDictionary",
+    "build_key",
+    "dut_build_id",
+]
+
+import glob
+import hashlib
+import inspect
+import os
+import sys
+from array import array
+from collections import Counter
+from typing import Optional
+
+
+def _library_digest(package_dir: str) -> Optional[str]:
+    # Libraries of large designs reach gigabytes, their stat data stands for the content:
+    # a rebuild changes the modification time
+    libraries = sorted(glob.glob(os.path.join(package_dir, "*.so*")))
+    if not libraries:
+        return None
+    h = hashlib.blake2b(digest_size=16)
+    for lib in libraries:
+        st = os.stat(lib)
+        h.update(
+            (
+                "%s\0%d\0%d\0" % (os.path.basename(lib), st.st_size, st.st_mtime_ns)
+            ).encode("utf-8")
+        )
+    return h.hexdigest()
+
+
+def build_key(build: str) -> str:
+    """
+    Fixed size id of a build, used in file names and file headers: 32 lowercase hex digits,
+    as returned by `dut_build_id`, are kept, any other string is replaced by its digest.
+    """
+    if len(build) == 32 and all(c in "0123456789abcdef" for c in build):
+        return build
+    return hashlib.blake2b(build.encode("utf-8"), digest_size=16).hexdigest()
+
+
+def dut_build_id(dut_cls) -> Optional[str]:
+    """
+    Digest of the names, sizes and modification times of the shared libraries next to the
+    module of a DUT class, None if there are none.
+
+    All DUTs created from the same compiled library write the same coverage entries in the
+    same order, so their coverage files share one `PointDictionary`.
+    """
+    try:
+        module_file = inspect.getfile(dut_cls)
+    except TypeError:
+        return None
+    return _library_digest(os.path.dirname(os.path.abspath(module_file)))
+
+
+class PointDictionary:
+    """
+    Dense integer ids of the coverage entries of one DUT build.
+
+    The coverage files of the build are summed into a hit vector indexed by id. `layout` keeps
+    the id of every line of the first file read: the lines of later files are matched by
+    position with a prefix comparison, entry strings are neither hashed nor kept. Entries not
+    in the dictionary are summed into a separate counter.
+    """
+
+    def __init__(self, build_id: str):
+        self.build_id = build_id
+        self.keys: list[str] = []
+        self.ids: dict[str, int] = {}
+        self.layout = array("I")
+        self._prefixes = None
+        self._digest = None
+
+    def __getstate__(self):
+        return {"build_id": self.build_id, "keys": self.keys, "layout": self.layout}
+
+    def __setstate__(self, state):
+        self.__init__(state["build_id"])
+        self.keys = state["keys"]
+        self.ids = {k: i for i, k in enumerate(self.keys)}
+        self.layout = state["layout"]
+
+    def __len__(self):
+        return len(self.keys)
+
+    def id_of(self, key: str) -> int:
+        i = self.ids.get(key)
+        if i is None:
+            i = self.ids[key] = len(self.keys)
+            self.keys.append(key)
+            self._prefixes = self._digest = None
+        return i
+
+    def digest(self) -> str:
+        """Digest of the ids, vectors over the ids of another dictionary are not compatible."""
+        if self._digest is None:
+            h = hashlib.blake2b(digest_size=16)
+            h.update(self.build_id.encode("utf-8") + b"\0")
+            h.update("\n".join(self.keys).encode("utf-8"))
+            self._digest = h.hexdigest()
+        return self._digest
+
+    def learn(self, path: str) -> None:
+        """Number the entries of a coverage file of this build, in file order."""
+        with open(path, "r") as f:
+            if f.readline().strip() != r"# SystemC::Coverage-3":
+                return
+            layout = array("I")
+            for line in f:
+                line = line.strip()
+                if line:
+                    layout.append(
+                        self.id_of(line[line.find(" ") + 2 : line.rfind(" ") - 1])
+                    )
+        self.layout = layout
+        self._prefixes = None
+
+    def _line_prefixes(self) -> list[tuple[str, int, int]]:
+        if self._prefixes is None:
+            keys = self.keys
+            self._prefixes = [
+                ("C '%s' " % keys[i], len(keys[i]) + 5, i) for i in self.layout
+            ]
+        return self._prefixes
+
+    def read(self, path: str, hits: list[int], extra: Counter) -> None:
+        """Add the hits of a coverage file to the vector `hits` and to `extra`."""
+        ids = self.ids
+        prefixes = self._line_prefixes()
+        with open(path, "r") as f:
+            if f.readline().strip() != r"# SystemC::Coverage-3":
+                # Invalid verilator coverage file
+                return
+            pos = 0
+            for line in f:
+                if pos < len(prefixes):
+                    prefix, n, i = prefixes[pos]
+                    pos += 1
+                    if line.startswith(prefix):
+                        hits[i] += int(line[n:])
+                        continue
+                line = line.strip()
+                if not line:
+                    continue
+                entry = line[line.find(" ") + 2 : line.rfind(" ") - 1]
+                hit = int(line[line.rfind(" ") + 1 :])
+                i = ids.get(entry)
+                if i is None:
+                    extra[entry] += hit
+                else:
+                    hits[i] += hit
+
+    def hit_map(self, hits: list[int], extra: Optional[Counter] = None) -> Counter:
+        """Hits by entry, the same as `count_verilator_coverage_hit` of the summed files."""
+        c = Counter()
+        dict.update(c, zip(self.keys, hits))
+        if extra:
+            c.update(extra)
+        return c
+
+    def save(self, path: str) -> None:
+        body = "\n".join(self.keys).encode("utf-8")
+        with open(path, "wb") as f:
+            layout = array("I", self.layout)
+            if sys.byteorder == "big":
+                layout.byteswap()
+            f.write(len(layout).to_bytes(4, "little"))
+            f.write(layout.tobytes())
+            f.write(body)
+
+    @classmethod
+    def load(cls, build_id: str, path: str) -> "PointDictionary":
+        with open(path, "rb") as f:
+            data = f.read()
+        n = int.from_bytes(data[:4], "little")
+        d = cls(build_id)
+        d.layout.frombytes(data[4 : 4 + n * d.layout.itemsize])
+        if sys.byteorder == "big":
+            d.layout.byteswap()
+        body = data[4 + n * d.layout.itemsize :].decode("utf-8")
+        d.keys = body.split("\n") if body else []
+        d.ids = {k: i for i, k in enumerate(d.keys)}
+        return d
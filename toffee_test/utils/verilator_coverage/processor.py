@@ -6,13 +6,20 @@ __all__ = [
 
 import fnmatch
 import json
+import operator
 import os
-from concurrent.futures import as_completed, ThreadPoolExecutor
+import re
+from concurrent.futures import as_completed, ProcessPoolExecutor, ThreadPoolExecutor
 from dataclasses import asdict, fields
 from pathlib import Path
-from typing import Iterable, Counter
+from typing import Iterable, Iterator, Counter, Optional, Union
 
-from .models import VerilatorCoverage, MetricStats, ModuleCoverage, FileCoverage, CoverageSummary
+from .dat_cache import DatCache
+from .models import VerilatorCoverage, CoverageTable, MetricStats, ModuleCoverage, FileCoverage, CoverageSummary
+from .point_dict import PointDictionary
+
+# Point dictionaries of the DUT builds merged by this process
+__point_dictionaries__: dict[str, PointDictionary] = {}
 
 
 def merge_intervals(intervals: Iterable[int]) -> list[range]:
@@ -37,7 +44,10 @@ def _merge_consecutive_lines(lines: set[int]) -> tuple[str, ...]:
     return tuple(f"{x.start}-{x.stop - 1}" for x in sorted_lines)
 
 
-def verilator_coverage_miss(merged_coverage: list[tuple[VerilatorCoverage, int]], out_file: str) -> CoverageSummary:
+def verilator_coverage_miss(
+        merged_coverage: Union[list[tuple[VerilatorCoverage, int]], CoverageTable],
+        out_file: str,
+) -> CoverageSummary:
     # Parse missing coverage
     coverages = merged_coverage
     total = MetricStats()
@@ -45,7 +55,7 @@ def verilator_coverage_miss(merged_coverage: list[tuple[VerilatorCoverage, int]]
     # Parse file
     collect_lines: dict[tuple[str, int], int] = {}
     collect_modules: dict[tuple[str, int], str] = {}
-    # file_lines_hit: dict[str, set[int]] = {}
+    # file_lines_hit: dict[str, list[range]] = {}
     miss_tree: dict[str, FileCoverage] = {}
     for meta, hit in coverages:
         module_name = meta.module_name
@@ -192,80 +202,158 @@ def verilator_coverage_miss(merged_coverage: list[tuple[VerilatorCoverage, int]]
     return summary
 
 
-def get_range_filter(path: str, ignore_miss_line_ranges: dict[str, set[int]]) -> set[int]:
+class IgnoreMatcher:
+    """
+    Tell whether a path matches any of the ignore glob patterns.
+
+    The patterns are compiled once into a single regex and the decision is cached per path,
+    so the cost grows with the number of distinct source files instead of coverage entries.
+    """
+
+    def __init__(self, patterns: Iterable[str]):
+        patterns = sorted(set(patterns))
+        self._regex = re.compile("|".join(f"(?:{fnmatch.translate(os.path.normcase(p))})" for p in patterns)) if patterns else None
+        self._cache: dict[str, bool] = {}
+
+    def __call__(self, path: str) -> bool:
+        ignored = self._cache.get(path)
+        if ignored is None:
+            ignored = self._cache[path] = (
+                self._regex is not None and self._regex.match(os.path.normcase(path)) is not None
+            )
+        return ignored
+
+
+def merge_ranges(ranges: Iterable[range]) -> list[range]:
+    """Sort ranges and coalesce the overlapping or adjacent ones."""
+    final: list[range] = []
+    for r in sorted((r for r in ranges if r), key=lambda x: x.start):
+        if final and r.start <= final[-1].stop:
+            if r.stop > final[-1].stop:
+                final[-1] = range(final[-1].start, r.stop)
+        else:
+            final.append(r)
+    return final
+
+
+def in_ranges(line: int, ranges: list[range]) -> bool:
+    # `ranges` is sorted and coalesced, find the first one ending after `line`
+    lo, hi = 0, len(ranges)
+    while lo < hi:
+        mid = (lo + hi) // 2
+        if ranges[mid].stop <= line:
+            lo = mid + 1
+        else:
+            hi = mid
+    return lo < len(ranges) and ranges[lo].start <= line
+
+
+def get_range_filter(path: str, ignore_miss_line_ranges: dict[str, list[range]]) -> list[range]:
     if path in ignore_miss_line_ranges:
-        return ignore_miss_line_ranges[path]
-    final = set()
+        return merge_ranges(ignore_miss_line_ranges[path])
+    final = []
 
     for k, v in ignore_miss_line_ranges.items():
         if k[0] != '/' and path.endswith(k):
-            final.update(v)
+            final.extend(v)
 
-    return final
+    return merge_ranges(final)
 
 
-def filter_ranges(input_ranges: list[range], range_filters: set[int]) -> list[range]:
-    raw_range = set()
-    for r in input_ranges:
-        raw_range.update(r)
-    if len(raw_range) < len(range_filters):
-        cooked = raw_range - range_filters
-    else:
-        cooked = raw_range.difference(range_filters)
-    res = merge_intervals(cooked)
+def filter_ranges(input_ranges: list[range], range_filters: list[range]) -> list[range]:
+    """
+    Subtract the sorted, coalesced `range_filters` from `input_ranges` with one sweep.
+    """
+    res: list[range] = []
+    j = 0
+    for r in merge_ranges(input_ranges):
+        start, stop = r.start, r.stop
+        # Skip filters ending before this range
+        while j < len(range_filters) and range_filters[j].stop <= start:
+            j += 1
+        k = j
+        while start < stop and k < len(range_filters) and range_filters[k].start < stop:
+            f = range_filters[k]
+            if f.start > start:
+                res.append(range(start, f.start))
+            start = max(start, f.stop)
+            k += 1
+        if start < stop:
+            res.append(range(start, stop))
     return res
 
 
-def filter_coverage(
-        merged_coverage: list[tuple[VerilatorCoverage, int]],
+def _iter_filtered_coverage(
+        merged_coverage: Iterable[tuple[VerilatorCoverage, int]],
         ignore_patterns: set[str],
-        ignore_miss_line_ranges: dict[str, set[int]],
-) -> list[tuple[VerilatorCoverage, int]]:
-    filtered_coverage: list[tuple[VerilatorCoverage, int]] = []
-
-    for meta, hit in merged_coverage:
+        ignore_miss_line_ranges: dict[str, list[range]],
+) -> Iterator[tuple[int, VerilatorCoverage, int, Optional[list[range]]]]:
+    # Yield (index, meta, hit, new blocks or None) of the records to keep
+    is_ignored = IgnoreMatcher(ignore_patterns)
+    range_filters: dict[str, list[range]] = {}
+    for i, (meta, hit) in enumerate(merged_coverage):
         # Remove files to be filtered
-        is_ignore = False
-        for pat in ignore_patterns:
-            if fnmatch.fnmatch(meta.path, pat):
-                is_ignore = True
-                break
-        if is_ignore:
+        path = meta.path
+        if is_ignored(path):
             continue
         # Only ignore miss record
         if hit != 0:
-            filtered_coverage.append((meta, hit))
+            yield i, meta, hit, None
             continue
         # Remove miss lines to be filtered
-        range_filter = get_range_filter(meta.path, ignore_miss_line_ranges)
+        range_filter = range_filters.get(path)
+        if range_filter is None:
+            range_filter = range_filters[path] = get_range_filter(path, ignore_miss_line_ranges)
+        new_blocks = None
         if range_filter:
             if meta.block:
                 new_blocks = filter_ranges(meta.block, range_filter)
                 # Ignore the empty miss line
                 if not new_blocks:
                     continue
-                meta.block = new_blocks
-            elif meta.line in range_filter:
+            elif in_ranges(meta.line, range_filter):
                 continue
+        yield i, meta, hit, new_blocks
+
+
+def filter_coverage(
+        merged_coverage: Union[list[tuple[VerilatorCoverage, int]], CoverageTable],
+        ignore_patterns: set[str],
+        ignore_miss_line_ranges: dict[str, list[range]],
+) -> Union[list[tuple[VerilatorCoverage, int]], CoverageTable]:
+    records = _iter_filtered_coverage(merged_coverage, ignore_patterns, ignore_miss_line_ranges)
+    if isinstance(merged_coverage, CoverageTable):
+        kept: list[int] = []
+        blocks: dict[int, list[range]] = {}
+        for i, _, _, new_blocks in records:
+            kept.append(i)
+            if new_blocks is not None:
+                blocks[i] = new_blocks
+        return merged_coverage.take(kept, blocks)
+
+    filtered_coverage: list[tuple[VerilatorCoverage, int]] = []
+    for _, meta, hit, new_blocks in records:
+        if new_blocks is not None:
+            meta.block = new_blocks
         filtered_coverage.append((meta, hit))
     return filtered_coverage
 
 
-def parse_ignore_miss_lines(pat: str, miss_lines: dict[str, set[int]]) -> bool:
+def parse_ignore_miss_lines(pat: str, miss_lines: dict[str, list[range]]) -> bool:
     nu_start = pat.rfind(":")
     if not pat.endswith(":") and nu_start != -1:
         file = pat[:nu_start]
         range_str = pat[nu_start + 1:].split(",")
         # Process ranges to list
-        miss_lines.setdefault(file, set())
+        miss_lines.setdefault(file, [])
         to_be_ignored = miss_lines[file]
         for s in range_str:
             if "-" in s:
                 l, r = map(int, s.split("-"))
-                to_be_ignored.update(range(l, r + 1))
+                to_be_ignored.append(range(l, r + 1))
             else:
                 l = int(s)
-                to_be_ignored.add(l)
+                to_be_ignored.append(range(l, l + 1))
         return True
     return False
 
@@ -274,18 +362,19 @@ def process_coverage_list(coverage_list: Iterable[dict]) -> tuple[
     list[str],
     list[tuple],
     set[str],
-    dict[str, set[int]]
+    dict[str, list[range]]
 ]:
     dat_files: list[str] = []
     ignore_infos: list[tuple] = []
     ignore_patterns: set[str] = set()
-    ignore_miss_lines: dict[str, set[int]] = {}
+    ignore_miss_lines: dict[str, list[range]] = {}
 
     for line_data in coverage_list:
-        # Handle dat file
+        # Handle dat file, hits of merged entries are already folded by the caller
         dat_file = line_data["data"]
-        assert os.path.exists(dat_file), f"Invalid data file: '{dat_file}'"
-        dat_files.append(dat_file)
+        if not line_data.get("merged", False):
+            assert os.path.exists(dat_file), f"Invalid data file: '{dat_file}'"
+            dat_files.append(dat_file)
         # Handle ignore
         ignore_items = line_data["ignore"]
         assert isinstance(ignore_items, list), f"Invalid ignore list: '{ignore_items}'"
@@ -313,7 +402,7 @@ def process_coverage_list(coverage_list: Iterable[dict]) -> tuple[
 def process_ignore_files(
         ignore_files: Iterable[str],
         patterns: set[str],
-        miss_lines: dict[str, set[int]]
+        miss_lines: dict[str, list[range]]
 ) -> None:
     for ignore_file in ignore_files:
         for i, ln in enumerate(open(ignore_file).readlines()):
@@ -332,41 +421,271 @@ def process_ignore_files(
             patterns.add(ln)
 
 
-def count_verilator_coverage_hit(path: str) -> Counter:
+def parse_verilator_coverage(lines: Iterable[str]) -> Counter:
     verilator_coverage_dat = Counter()
-    with open(path, "r") as f:
-        first_line = f.readline().strip()
-        if first_line != r"# SystemC::Coverage-3":
-            # Invalid verilator coverage file
-            return verilator_coverage_dat
-        for line in f:
-            line = line.strip()
-            l = line.find(" ")
-            r = line.rfind(" ")
-            entry = line[l + 1:r]
-            hit = line[r + 1:]
-            verilator_coverage_dat[entry] += int(hit)
+    lines = iter(lines)
+    first_line = next(lines, "").strip()
+    if first_line != r"# SystemC::Coverage-3":
+        # Invalid verilator coverage file
         return verilator_coverage_dat
+    for line in lines:
+        line = line.strip()
+        if not line:
+            continue
+        l = line.find(" ")
+        r = line.rfind(" ")
+        # Drop the quotes around the entry
+        entry = line[l + 2:r - 1]
+        hit = line[r + 1:]
+        verilator_coverage_dat[entry] += int(hit)
+    return verilator_coverage_dat
+
+
+def iter_verilator_coverage(lines: Iterable[str]) -> Iterator[tuple[str, int]]:
+    """Yield (entry, hit) of the lines of a coverage file, in file order."""
+    lines = iter(lines)
+    if next(lines, "").strip() != r"# SystemC::Coverage-3":
+        return
+    for line in lines:
+        line = line.strip()
+        if not line:
+            continue
+        r = line.rfind(" ")
+        yield line[line.find(" ") + 2:r - 1], int(line[r + 1:])
 
 
-def merge_verilator_coverage(coverage_files: Iterable[str]) -> list[tuple[VerilatorCoverage, int]]:
+def count_verilator_coverage_hit(path: str, dat_cache: DatCache = None) -> Counter:
+    if dat_cache is not None:
+        return dat_cache.load(path, parse_verilator_coverage)
+    with open(path, "r") as f:
+        return parse_verilator_coverage(f)
+
+
+def write_verilator_coverage(hits: dict[str, int], path: str) -> None:
+    with open(path, "w", encoding="utf-8") as f:
+        f.write("# SystemC::Coverage-3\n")
+        for entry, hit in hits.items():
+            f.write(f"C '{entry}' {hit}\n")
+
+
+def get_point_dictionary(build_id: str, coverage_file: str, dat_cache: DatCache = None) -> PointDictionary:
+    dictionary = __point_dictionaries__.get(build_id)
+    if dictionary is None and dat_cache is not None:
+        dictionary = dat_cache.load_points(build_id)
+    if dictionary is None:
+        dictionary = PointDictionary(build_id)
+        dictionary.learn(coverage_file)
+        if dat_cache is not None:
+            dat_cache.store_points(dictionary)
+    __point_dictionaries__[build_id] = dictionary
+    return dictionary
+
+
+class LineHitSum:
+    """
+    Running sum of the hits of coverage files.
+
+    Files of a known DUT build are summed as hit vectors over the point ids of the build,
+    the other files into a counter.
+    """
+
+    def __init__(self):
+        self.hits = Counter()
+        self.vectors: dict[str, tuple[PointDictionary, list[int], Counter]] = {}
+
+    def __bool__(self):
+        return bool(self.hits) or bool(self.vectors)
+
+    def add(self, path: str, build_id: str = None) -> None:
+        if build_id is None:
+            self.hits.update(count_verilator_coverage_hit(path))
+            return
+        if build_id not in self.vectors:
+            dictionary = get_point_dictionary(build_id, path)
+            self.vectors[build_id] = (dictionary, [0] * len(dictionary), Counter())
+        dictionary, hits, extra = self.vectors[build_id]
+        dictionary.read(path, hits, extra)
+
+    def counter(self) -> Counter:
+        c = Counter(self.hits)
+        for dictionary, hits, extra in self.vectors.values():
+            c.update(dictionary.hit_map(hits, extra))
+        return c
+
+
+def count_verilator_coverage_shard(paths: Iterable[str], dat_cache: DatCache = None) -> Counter:
     c = Counter()
-    with ThreadPoolExecutor() as pool:
-        futures = {pool.submit(count_verilator_coverage_hit, f) for f in coverage_files}
-        for future in as_completed(futures):
-            res = future.result()
-            c.update(res)
+    for path in paths:
+        c.update(count_verilator_coverage_hit(path, dat_cache))
+    return c
+
+
+def shard_coverage_files(coverage_files: Iterable[str], shards: int) -> list[list[str]]:
+    # Balance shards by file size, largest files first
+    sized = sorted(((os.path.getsize(f), f) for f in coverage_files), reverse=True)
+    n = max(1, min(shards, len(sized)))
+    loads = [0] * n
+    buckets: list[list[str]] = [[] for _ in range(n)]
+    for size, f in sized:
+        i = loads.index(min(loads))
+        loads[i] += size
+        buckets[i].append(f)
+    return [files for files in buckets if files]
+
+
+def tree_reduce_counters(counters: list[Counter]) -> Counter:
+    if not counters:
+        return Counter()
+    while len(counters) > 1:
+        reduced = []
+        for i in range(0, len(counters) - 1, 2):
+            a, b = counters[i], counters[i + 1]
+            if len(a) < len(b):
+                a, b = b, a
+            a.update(b)
+            reduced.append(a)
+        if len(counters) % 2:
+            reduced.append(counters[-1])
+        counters = reduced
+    return counters[0]
+
+
+def sum_point_vector_shard(
+        dictionary: PointDictionary,
+        paths: Iterable[str],
+        dat_cache: DatCache = None,
+) -> tuple[list[int], Counter]:
+    hits = [0] * len(dictionary)
+    extra = Counter()
+    for path in paths:
+        if dat_cache is not None:
+            hits = list(map(operator.add, hits, dat_cache.load_vector(path, dictionary, extra)))
+        else:
+            dictionary.read(path, hits, extra)
+    return hits, extra
+
+
+def count_point_vectors(
+        build_id: str,
+        coverage_files: list[str],
+        workers: int = 0,
+        dat_cache: DatCache = None,
+) -> Counter:
+    """
+    Sum up the hits of coverage files of one DUT build as vectors over its point ids.
+    """
+    dictionary = get_point_dictionary(build_id, coverage_files[0], dat_cache)
+    shards = shard_coverage_files(coverage_files, workers) if workers > 1 else [coverage_files]
+    if len(shards) <= 1:
+        hits, extra = sum_point_vector_shard(dictionary, coverage_files, dat_cache)
+    else:
+        n = len(shards)
+        with ProcessPoolExecutor(max_workers=n) as pool:
+            partials = list(pool.map(sum_point_vector_shard, [dictionary] * n, shards, [dat_cache] * n))
+        hits, extra = partials[0]
+        for h, e in partials[1:]:
+            hits = list(map(operator.add, hits, h))
+            extra.update(e)
+    return dictionary.hit_map(hits, extra)
+
+
+def count_verilator_coverage_files(
+        coverage_files: Iterable[str],
+        workers: int = 0,
+        dat_cache: DatCache = None,
+        builds: dict[str, str] = None,
+) -> Counter:
+    """
+    Sum up the hits of all coverage files.
+
+    With `workers` <= 0 the files are parsed in a thread pool. Otherwise they are split into
+    `workers` shards parsed by a process pool, each worker returns one pre-reduced counter
+    and the partial counters are merged pairwise. With `dat_cache`, the hit maps of files
+    parsed by an earlier run are loaded from the cache instead.
+
+    Files listed in `builds`, which maps files to the build id of the DUT that wrote them,
+    are summed as hit vectors over the point ids of their build, see `PointDictionary`.
+    """
+    coverage_files = list(coverage_files)
+    build_hits = []
+    if builds:
+        by_build: dict[str, list[str]] = {}
+        rest = []
+        for f in coverage_files:
+            build_id = builds.get(f)
+            if build_id is None:
+                rest.append(f)
+            else:
+                by_build.setdefault(build_id, []).append(f)
+        for build_id, files in by_build.items():
+            build_hits.append(count_point_vectors(build_id, files, workers, dat_cache))
+        coverage_files = rest
+    if not coverage_files:
+        c = Counter()
+    elif workers <= 0:
+        c = Counter()
+        with ThreadPoolExecutor() as pool:
+            futures = {pool.submit(count_verilator_coverage_hit, f, dat_cache) for f in coverage_files}
+            for future in as_completed(futures):
+                res = future.result()
+                c.update(res)
+    else:
+        shards = shard_coverage_files(coverage_files, workers)
+        if len(shards) <= 1:
+            c = count_verilator_coverage_shard(coverage_files, dat_cache)
+        else:
+            with ProcessPoolExecutor(max_workers=len(shards)) as pool:
+                partials = list(pool.map(count_verilator_coverage_shard, shards, [dat_cache] * len(shards)))
+            c = tree_reduce_counters(partials)
+    for hits in build_hits:
+        c.update(hits)
+    if dat_cache is not None:
+        dat_cache.evict()
+    return c
+
+
+def merge_verilator_coverage(
+        coverage_files: Iterable[str],
+        workers: int = 0,
+        merged_hits: Counter = None,
+        dat_cache: DatCache = None,
+        builds: dict[str, str] = None,
+) -> list[tuple[VerilatorCoverage, int]]:
+    c = count_verilator_coverage_files(coverage_files, workers, dat_cache, builds)
+    if merged_hits:
+        c.update(merged_hits)
     coverages: list[tuple[VerilatorCoverage, int]] = [
-        (VerilatorCoverage(cov), hit) for cov, hit in c.items()
+        (VerilatorCoverage(cov, lazy=True), hit) for cov, hit in c.items()
     ]
     coverages.sort()
     return coverages
 
 
+def merge_verilator_coverage_table(
+        coverage_files: Iterable[str],
+        workers: int = 0,
+        merged_hits: Counter = None,
+        dat_cache: DatCache = None,
+        builds: dict[str, str] = None,
+) -> CoverageTable:
+    c = count_verilator_coverage_files(coverage_files, workers, dat_cache, builds)
+    if merged_hits:
+        c.update(merged_hits)
+    return CoverageTable.from_hits(c)
+
+
 def preprocess_verilator_coverage(
-        line_coverage_list: list[dict]
-) -> tuple[list[tuple[VerilatorCoverage, int]], list[tuple], set[str], dict[str, set[int]]]:
+        line_coverage_list: list[dict],
+        workers: int = 0,
+        merged_hits: Counter = None,
+        compact: bool = True,
+        dat_cache: DatCache = None,
+) -> tuple[Union[list[tuple[VerilatorCoverage, int]], CoverageTable], list[tuple], set[str], dict[str, list[range]]]:
     dat_list, ignore_info, ignore_patterns, ignore_miss_lines = process_coverage_list(line_coverage_list)
+    builds = {lc["data"]: lc["build"] for lc in line_coverage_list if lc.get("build")}
     # Merge coverage data first
-    merged_coverage = merge_verilator_coverage(dat_list)
+    if compact:
+        merged_coverage = merge_verilator_coverage_table(dat_list, workers, merged_hits, dat_cache, builds)
+    else:
+        merged_coverage = merge_verilator_coverage(dat_list, workers, merged_hits, dat_cache, builds)
     return merged_coverage, ignore_info, ignore_patterns, ignore_miss_lines
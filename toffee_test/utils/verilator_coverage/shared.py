@@ -0,0 +1,94 @@
+__all__ = [
+    "SharedHitVector",
+    "read_shared_hits",
+]
+
+import glob
+import mmap
+import operator
+import os
+import struct
+from collections import Counter
+
+from .cache_dir import replace_file
+from .point_dict import build_key
+from .point_dict import PointDictionary
+from .processor import count_verilator_coverage_hit
+
+# Magic, build id, digest of the point dictionary and number of points, padded to 8 bytes
+_HEADER = struct.Struct("<4s32s32s4xQ")
+_MAGIC = b"TSH1"
+
+
+class SharedHitVector:
+    """
+    Memory-mapped hit vector over the point ids of one DUT build.
+
+    Each process owns its own vector file, so no locking is needed, and the counters are in
+    the file as soon as they are added: the controller reads the vectors of all processes
+    directly, even those of a crashed worker. The dictionary of the ids is stored next to
+    the vectors as `<digest>.points`.
+    """
+
+    def __init__(self, path: str, dictionary: PointDictionary):
+        if build_key(dictionary.build_id) != dictionary.build_id:
+            raise ValueError(
+                f"Invalid build id '{dictionary.build_id}', use build_key()"
+            )
+        self.dictionary = dictionary
+        size = _HEADER.size + 8 * len(dictionary)
+        with open(path, "wb") as f:
+            f.write(
+                _HEADER.pack(
+                    _MAGIC,
+                    dictionary.build_id.encode("ascii"),
+                    dictionary.digest().encode("ascii"),
+                    len(dictionary),
+                )
+            )
+            f.truncate(size)
+        self._file = open(path, "r+b")
+        self._mmap = mmap.mmap(self._file.fileno(), size)
+        self.hits = memoryview(self._mmap)[_HEADER.size :].cast("q")
+        points = os.path.join(os.path.dirname(path), dictionary.digest() + ".points")
+        if not os.path.exists(points):
+            replace_file(points, dictionary.save)
+
+    def add(self, path: str, extra: Counter) -> None:
+        """Add the hits of a coverage file of the build, unknown entries go to `extra`."""
+        self.dictionary.read(path, self.hits, extra)
+
+    def close(self):
+        self.hits.release()
+        self._mmap.flush()
+        self._mmap.close()
+        self._file.close()
+
+
+def read_shared_hits(shared_dir: str) -> Counter:
+    """
+    Sum the hit vectors and the leftover coverage files written into `shared_dir`.
+    """
+    sums: dict[str, tuple[str, list[int]]] = {}
+    for path in glob.glob(os.path.join(shared_dir, "*.vec")):
+        with open(path, "rb") as f:
+            data = f.read()
+        magic, build_id, digest, n = _HEADER.unpack_from(data)
+        if magic != _MAGIC:
+            continue
+        vec = memoryview(data)[_HEADER.size : _HEADER.size + 8 * n].cast("q")
+        digest = digest.decode("ascii")
+        if digest in sums:
+            build_id, hits = sums[digest]
+            sums[digest] = (build_id, list(map(operator.add, hits, vec)))
+        else:
+            sums[digest] = (build_id.decode("ascii"), vec.tolist())
+    c = Counter()
+    for digest, (build_id, hits) in sums.items():
+        dictionary = PointDictionary.load(
+            build_id, os.path.join(shared_dir, digest + ".points")
+        )
+        c.update(dictionary.hit_map(hits))
+    for path in glob.glob(os.path.join(shared_dir, "*.dat")):
+        c.update(count_verilator_coverage_hit(path))
+    return c